@@ -1,4 +1,14 @@
+import os
+
+# Cold starts only pay for what the first request uses; indexes are created at deploy time
+os.environ.setdefault("LAZY_STARTUP", "true")
+
 from mangum import Mangum
+from app.core import tracing
+from app.core.config import settings
 from app.main import app
 
-handler = Mangum(app) 
\ No newline at end of file
+tracing.init_tracing("snapfeedback-api")
+# Mangum runs the app's startup and shutdown around every invocation, reconnecting to
+# MongoDB and OpenAI each time; lazily created clients are kept while the instance is warm
+handler = Mangum(app, lifespan="off" if settings.LAZY_STARTUP else "auto")
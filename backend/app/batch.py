@@ -0,0 +1,218 @@
+"""
+Batch evaluations through the OpenAI Batch API, for evaluating many
+classrooms at once at a lower price than one request per submission.
+
+Submit a manifest from the command line:
+
+    python -m app.batch submit manifest.json
+    python -m app.batch status <batch_id>
+
+The manifest lists image files relative to its own location:
+
+    {"items": [
+        {"playground_images": ["room1/a.jpg"], "toy_images": ["room1/toy.jpg"],
+         "activity_description": "Optional description"}
+    ]}
+
+The job worker polls submitted batches and stores their results in the
+submissions as each batch completes.
+"""
+import os
+import sys
+import json
+import base64
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from pymongo.asynchronous.database import AsyncDatabase
+
+from . import crud, jobs, schemas
+from .core import ai_models, images, storage
+from .core.config import settings
+
+# (playground images, toy images, activity description) with normalized image bytes
+BatchItem = Tuple[List[bytes], List[bytes], Optional[str]]
+
+FEEDBACK_PROMPTS = {
+    "playground_feedback": "AI_PLAYGROUND_PROMPT",
+    "toy_feedback": "AI_TOY_PROMPT",
+}
+
+def custom_id(submission_id: str, feedback_type: str) -> str:
+    return f"{submission_id}:{feedback_type}"
+
+async def create_batch(db: AsyncDatabase, items: List[BatchItem]) -> Dict:
+    """
+    Stores a submission per item, submits their playground and toy evaluations
+    as one OpenAI batch and queues a job to ingest the results.
+    """
+    image_store = storage.get_image_store()
+    requests = []
+    submission_ids = []
+    for playground_images, toy_images, activity_description in items:
+        image_keys = await asyncio.gather(*[image_store.put(image_data) for image_data in playground_images + toy_images])
+        playground_keys = image_keys[:len(playground_images)]
+        toy_keys = image_keys[len(playground_images):]
+        db_submission = await crud.create_submission_multi(db, submission_data={
+            "playground_image_urls": [image_store.url_for(key) for key in playground_keys],
+            "toy_image_urls": [image_store.url_for(key) for key in toy_keys],
+            "playground_image_keys": playground_keys,
+            "toy_image_keys": toy_keys,
+            "activity_description": activity_description,
+            "playground_feedback": None,
+            "toy_feedback": None,
+            "status": "pending",
+        })
+        submission_id = str(db_submission["_id"])
+        submission_ids.append(db_submission["_id"])
+
+        for feedback_type, image_set in [("playground_feedback", playground_images), ("toy_feedback", toy_images)]:
+            messages = ai_models.build_feedback_multi_messages(
+                images_data_base64=[base64.b64encode(image_data).decode("utf-8") for image_data in image_set],
+                text_description=activity_description,
+                prompt_base=getattr(settings, FEEDBACK_PROMPTS[feedback_type]),
+            )
+            requests.append(ai_models.build_batch_request(custom_id(submission_id, feedback_type), messages, settings.OPENAI_MODEL))
+
+    batch_job = await crud.create_batch_job(db, batch_data={
+        "submission_ids": submission_ids,
+        "request_count": len(requests),
+        "openai_batch_id": None,
+        "status": "submitting",
+        "ingested_at": None,
+    })
+    batch_job_id = str(batch_job["_id"])
+    try:
+        batch = await ai_models.create_batch(requests, metadata={"batch_job_id": batch_job_id})
+    except Exception:
+        await crud.update_batch_job(db, batch_job_id=batch_job_id, fields={"status": "failed"})
+        for submission_id in submission_ids:
+            await crud.update_submission_status(db, submission_id=str(submission_id), status="failed")
+        raise
+
+    batch_job = await crud.update_batch_job(db, batch_job_id=batch_job_id, fields={
+        "openai_batch_id": batch.id,
+        "status": batch.status,
+    })
+    for submission_id in submission_ids:
+        await crud.update_submission_status(db, submission_id=str(submission_id), status="evaluating")
+    await jobs.enqueue_job(
+        db,
+        job_type=jobs.INGEST_BATCH_JOB,
+        payload={"batch_job_id": batch_job_id},
+        delay_seconds=settings.BATCH_POLL_INTERVAL_SECONDS,
+    )
+    print(f"Submitted batch {batch.id} with {len(requests)} requests for {len(submission_ids)} submissions")
+    return batch_job
+
+async def ingest_result(db: AsyncDatabase, result: dict) -> None:
+    """
+    Stores one line of a batch output file as submission feedback.
+    """
+    submission_id, feedback_type = result["custom_id"].split(":", 1)
+    response = result.get("response") or {}
+    if result.get("error") or response.get("status_code") != 200:
+        print(f"Batch request {result['custom_id']} failed: {result.get('error') or response.get('body')}")
+        return
+    try:
+        feedback_json = json.loads(response["body"]["choices"][0]["message"]["content"])
+        feedback_dict = schemas.validate_feedback(feedback_json)
+    except Exception as e:
+        print(f"Invalid feedback for batch request {result['custom_id']}: {e}")
+        return
+    await crud.update_submission_feedback(db, submission_id=submission_id, feedback_type=feedback_type, feedback_data=feedback_dict)
+
+async def ingest_batch(db: AsyncDatabase, *, batch_job_id: str) -> bool:
+    """
+    Checks a submitted batch and, once it has finished, stores its results.
+    Returns False while the batch is still running.
+    """
+    batch_job = await crud.get_batch_job(db, batch_job_id=batch_job_id)
+    if batch_job is None:
+        raise ValueError(f"Batch {batch_job_id} not found")
+    if batch_job["ingested_at"] is not None:
+        return True
+
+    batch = await ai_models.retrieve_batch(batch_job["openai_batch_id"])
+    request_counts = batch.request_counts.model_dump() if batch.request_counts else None
+    await crud.update_batch_job(db, batch_job_id=batch_job_id, fields={"status": batch.status, "request_counts": request_counts})
+    if batch.status not in ai_models.BATCH_TERMINAL_STATUSES:
+        return False
+
+    # Expired and cancelled batches still have results for the requests that finished
+    if batch.output_file_id:
+        for result in await ai_models.read_batch_file(batch.output_file_id):
+            await ingest_result(db, result)
+
+    missing = 0
+    for submission_id in batch_job["submission_ids"]:
+        db_submission = await crud.get_submission(db, submission_id=str(submission_id))
+        if db_submission is None:
+            # Deleted, or expired through DATA_RETENTION_DAYS, while the batch ran
+            missing += 1
+            continue
+        evaluated = bool(db_submission.get("playground_feedback") or db_submission.get("toy_feedback"))
+        await crud.update_submission_status(db, submission_id=str(submission_id), status="evaluated" if evaluated else "failed")
+        if evaluated:
+            await jobs.enqueue_job(db, job_type=jobs.IMPROVEMENT_SUGGESTIONS_JOB, payload={"submission_id": str(submission_id)})
+
+    await crud.update_batch_job(db, batch_job_id=batch_job_id, fields={"ingested_at": datetime.utcnow(), "missing_submissions": missing})
+    print(f"Ingested batch {batch.id} ({batch.status})" + (f", skipped {missing} missing submissions" if missing else ""))
+    return True
+
+def read_manifest(path: str) -> List[Tuple[List[str], List[str], Optional[str]]]:
+    """
+    Reads a batch manifest and resolves its image paths.
+    """
+    with open(path) as f:
+        manifest = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    items = []
+    for item in manifest["items"]:
+        playground_paths = [os.path.join(base_dir, p) for p in item["playground_images"]]
+        toy_paths = [os.path.join(base_dir, p) for p in item["toy_images"]]
+        if not (1 <= len(playground_paths) <= 3 and 1 <= len(toy_paths) <= 3):
+            raise ValueError("Each manifest item needs between 1 and 3 playground_images and toy_images")
+        items.append((playground_paths, toy_paths, item.get("activity_description")))
+    if not 1 <= len(items) <= settings.BATCH_MAX_ITEMS:
+        raise ValueError(f"A batch must contain between 1 and {settings.BATCH_MAX_ITEMS} items")
+    return items
+
+async def main(argv: List[str]) -> int:
+    from .database import get_db, connect_to_mongo, close_mongo_connection
+
+    if len(argv) != 2 or argv[0] not in ("submit", "status"):
+        print("Usage: python -m app.batch submit MANIFEST | status BATCH_ID")
+        return 2
+
+    ai_models.init_openai_client()
+    connect_to_mongo()
+    try:
+        db = get_db()
+        if argv[0] == "status":
+            batch_job = await crud.get_batch_job(db, batch_job_id=argv[1])
+            if batch_job is None:
+                print(f"Batch {argv[1]} not found")
+                return 1
+            print(json.dumps(batch_job, default=str, indent=2))
+            return 0
+
+        manifest_items = read_manifest(argv[1])
+        # Normalize every image of the batch in one pass through the process pool
+        normalized_images = iter(await images.normalize_image_files([
+            path for playground_paths, toy_paths, _ in manifest_items for path in playground_paths + toy_paths
+        ]))
+        items = [
+            ([next(normalized_images) for _ in playground_paths], [next(normalized_images) for _ in toy_paths], activity_description)
+            for playground_paths, toy_paths, activity_description in manifest_items
+        ]
+        batch_job = await create_batch(db, items)
+        print(f"Batch id: {batch_job['_id']}")
+        return 0
+    finally:
+        images.shutdown_image_pool()
+        await ai_models.close_openai_client()
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
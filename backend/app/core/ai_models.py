@@ -1,42 +1,339 @@
 import json
-from typing import Optional, List, Dict
-from openai import OpenAI, APIError
+import time
+import base64
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Callable, Optional, List, Dict, Tuple
+try:
+    # openai 3+ is built on httpx2; the pool settings must use the SDK's HTTP library
+    import httpx2 as httpx
+except ImportError:
+    import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, APIError, RateLimitError
 from fastapi import HTTPException
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.errors import PyMongoError
 
+from . import metrics, tracing
+from .config import settings
+from .json_stream import JSONObjectStreamParser
+from .scheduler import scheduler
+
+# Process-wide client, created once at app startup and shared by every request
+# so that connections to the OpenAI API are pooled and kept alive.
+_client: Optional[AsyncOpenAI] = None
+
+def init_openai_client() -> AsyncOpenAI:
+    """
+    Creates the shared AsyncOpenAI client if it does not exist yet.
+    """
+    global _client
+    if _client is None:
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            timeout=httpx.Timeout(settings.OPENAI_TIMEOUT_SECONDS, connect=settings.OPENAI_CONNECT_TIMEOUT_SECONDS),
+        )
+        _client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL or None,
+            http_client=http_client,
+            # Retries are done by the scheduler, which also tracks the rate limits
+            max_retries=0,
+        )
+    return _client
+
+def get_openai_client() -> AsyncOpenAI:
+    """
+    Returns the shared AsyncOpenAI client, creating it on first use.
+    """
+    return _client or init_openai_client()
+
+async def close_openai_client() -> None:
+    """
+    Closes the shared client and its connection pool on app shutdown.
+    """
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+# Tokens a low-detail image costs, used to estimate a request against the token budget
+LOW_DETAIL_IMAGE_TOKENS = 85
+
+def estimate_tokens(messages: List[dict], max_tokens: int) -> int:
+    """
+    Rough upper bound of the tokens a chat completion counts against the
+    tokens-per-minute limit: ~4 characters per prompt token plus max_tokens.
+    """
+    tokens = max_tokens
+    for message in messages:
+        content = message["content"]
+        for part in ([{"type": "text", "text": content}] if isinstance(content, str) else content):
+            if part["type"] == "text":
+                tokens += len(part["text"]) // 4
+            else:
+                tokens += LOW_DETAIL_IMAGE_TOKENS
+    return tokens
+
+async def create_chat_completion(prompt_type: str, **kwargs):
+    """
+    Sends a chat completion through the scheduler, which queues it behind the
+    rate limits and retries it on 429s and server errors. With stream=True
+    the stream is returned once the response has started; its usage arrives
+    in the last chunk and is recorded by the caller.
+    prompt_type labels the call's span, latency and token metrics.
+    """
+    client = get_openai_client()
+    if kwargs["messages"][0]["role"] == "system":
+        kwargs.setdefault("prompt_cache_key", prompt_cache_key(kwargs["messages"][0]["content"]))
+    image_count = sum(
+        1 for message in kwargs["messages"] if not isinstance(message["content"], str)
+        for part in message["content"] if part["type"] == "image_url"
+    )
+    attributes = {
+        "gen_ai.request.model": kwargs["model"],
+        "gen_ai.request.max_tokens": kwargs["max_tokens"],
+        "snapfeedback.prompt_type": prompt_type,
+        "snapfeedback.image_count": image_count,
+        "snapfeedback.stream": bool(kwargs.get("stream")),
+    }
+    started_at = time.perf_counter()
+    outcome = "error"
+    with tracing.span("openai.chat.completions", attributes) as call_span:
+        try:
+            response = await scheduler.call(
+                lambda: client.chat.completions.with_raw_response.create(**kwargs),
+                estimated_tokens=estimate_tokens(kwargs["messages"], kwargs["max_tokens"]),
+            )
+            outcome = "ok"
+        finally:
+            metrics.MODEL_CALL_SECONDS.labels(kwargs["model"], prompt_type, outcome).observe(time.perf_counter() - started_at)
+        if not kwargs.get("stream"):
+            metrics.record_usage(response.usage, kwargs["model"], prompt_type)
+            if response.usage is not None:
+                call_span.set_attributes({
+                    "gen_ai.usage.input_tokens": response.usage.prompt_tokens,
+                    "gen_ai.usage.output_tokens": response.usage.completion_tokens,
+                    "gen_ai.usage.cache_read.input_tokens": metrics.cached_tokens(response.usage),
+                })
+    return response
+
+class InvalidAIResponseError(HTTPException):
+    """
+    Raised when the model's JSON doesn't match the expected schema.
+    """
+    def __init__(self, error: Exception):
+        super().__init__(status_code=500, detail=f"AI returned data in an invalid format: {error}")
+
+def validated(response: dict, validate: Optional[Callable[[dict], dict]]) -> dict:
+    """
+    Returns what validate makes of a parsed response. Runs before the response
+    is cached, so an invalid answer is never replayed to later retries.
+    """
+    if validate is None:
+        return response
+    try:
+        with metrics.stage("validation"):
+            return validate(response)
+    except Exception as e:
+        raise InvalidAIResponseError(e) from None
+
+def api_error_exception(e: APIError) -> HTTPException:
+    """
+    HTTP error for an OpenAI error that is left after the scheduler's retries.
+    Rate limiting is reported as 503 so clients know to come back later.
+    """
+    if isinstance(e, RateLimitError):
+        return HTTPException(
+            status_code=503,
+            detail="The AI service is busy, please try again shortly.",
+            headers={"Retry-After": str(int(settings.OPENAI_RETRY_MAX_SECONDS))},
+        )
+    return HTTPException(status_code=500, detail=f"An error occurred with the OpenAI API: {e}")
+
+AI_RESPONSE_CACHE_COLLECTION = "ai_response_cache"
+
+class AIResponseCache:
+    """
+    Content-addressed cache of parsed AI responses: an in-process LRU in front of
+    a Mongo collection whose documents expire through a TTL index.
+    """
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[str, str]" = OrderedDict()
+        self.collection: Optional[AsyncCollection] = None
+        self.memory_hits = 0
+        self.mongo_hits = 0
+        self.misses = 0
+
+    def attach(self, collection: AsyncCollection) -> None:
+        """
+        Backs the cache with a Mongo collection shared by all workers.
+        Its TTL index on expires_at is created by app.indexes.
+        """
+        self.collection = collection
+
+    @staticmethod
+    def make_key(
+        kind: str,
+        images_data_base64: List[str],
+        text_description: Optional[str],
+        prompt_base: str,
+        model_name: str,
+        context: Optional[Dict] = None
+    ) -> str:
+        """
+        Digest of everything that determines the model's answer. Images are hashed
+        on their decoded bytes so data-URL formatting differences don't matter.
+        """
+        digest = hashlib.sha256()
+        for part in (kind, model_name, prompt_base, text_description or ""):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        for image_data in images_data_base64:
+            digest.update(hashlib.sha256(base64.b64decode(image_data)).digest())
+        if context is not None:
+            digest.update(json.dumps(context, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def lookup_query(key: str, now: datetime) -> dict:
+        return {"_id": key, "expires_at": {"$gt": now}}
+
+    async def get(self, key: str) -> Optional[dict]:
+        if not settings.AI_CACHE_ENABLED:
+            return None
+
+        # Values are stored serialized so every caller gets its own copy
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+            self.memory_hits += 1
+            metrics.AI_CACHE_LOOKUPS.labels("memory_hit").inc()
+            tracing.set_attributes({"ai_cache.result": "memory_hit"})
+            return json.loads(value)
+
+        if self.collection is not None:
+            try:
+                doc = await self.collection.find_one(self.lookup_query(key, datetime.utcnow()))
+            except PyMongoError as e:
+                print(f"AI response cache lookup failed: {e}")
+                doc = None
+            if doc is not None:
+                self._remember(key, doc["response"])
+                self.mongo_hits += 1
+                metrics.AI_CACHE_LOOKUPS.labels("mongo_hit").inc()
+                tracing.set_attributes({"ai_cache.result": "mongo_hit"})
+                return json.loads(doc["response"])
+
+        self.misses += 1
+        metrics.AI_CACHE_LOOKUPS.labels("miss").inc()
+        tracing.set_attributes({"ai_cache.result": "miss"})
+        return None
+
+    async def set(self, key: str, response: dict, kind: str, model_name: str) -> None:
+        if not settings.AI_CACHE_ENABLED:
+            return
+
+        value = json.dumps(response)
+        self._remember(key, value)
+        if self.collection is not None:
+            now = datetime.utcnow()
+            try:
+                await self.collection.replace_one(
+                    {"_id": key},
+                    {
+                        "response": value,
+                        "kind": kind,
+                        "model": model_name,
+                        "created_at": now,
+                        "expires_at": now + timedelta(seconds=self.ttl_seconds),
+                    },
+                    upsert=True
+                )
+            except PyMongoError as e:
+                print(f"AI response cache write failed: {e}")
+
+    def _remember(self, key: str, value: str) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        lookups = self.memory_hits + self.mongo_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "mongo_hits": self.mongo_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.mongo_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self.entries),
+        }
+
+response_cache = AIResponseCache(
+    max_entries=settings.AI_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.AI_CACHE_TTL_SECONDS,
+)
+
+# Prompt caching: the provider reuses the computation of a prompt's longest
+# previously seen prefix (from 1024 tokens, in steps of 128). The rubric and
+# output schema go first, as a system message that is byte-identical on every
+# call with that prompt; the description, images and evaluation results follow.
+def system_message(prompt_base: str) -> dict:
+    return {"role": "system", "content": prompt_base}
+
+def prompt_cache_key(prompt_base: str) -> str:
+    """
+    Routes calls sharing a prompt to the same cache, so their common prefix is
+    found even when requests are spread over many servers.
+    """
+    return "snapfeedback-" + hashlib.sha256(prompt_base.encode("utf-8")).hexdigest()[:16]
+
+def image_parts(images_data_base64: List[str]) -> List[dict]:
+    return [
+        {
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:image/jpeg;base64,{image_data}",
+                "detail": "low"
+            }
+        }
+        for image_data in images_data_base64
+    ]
+
+@tracing.traced
 async def get_ai_feedback(
     image_data_base64: str,
     text_description: Optional[str],
     prompt_base: str,
-    openai_api_key: str,
-    model_name: str
+    model_name: str,
+    validate: Optional[Callable[[dict], dict]] = None
 ) -> dict:
     """
     Gets feedback from OpenAI's vision model for a single image.
+    The response is passed through validate before it is cached and returned.
     """
-    try:
-        client = OpenAI(api_key=openai_api_key)
+    cache_key = response_cache.make_key("feedback", [image_data_base64], text_description, prompt_base, model_name)
+    cached = await response_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt_base},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_data_base64}",
-                            "detail": "low"
-                        }
-                    }
-                ]
-            }
-        ]
-        
+    try:
+        content = []
         if text_description:
-            messages[0]["content"].insert(1, {"type": "text", "text": f"Activity Description: {text_description}"})
+            content.append({"type": "text", "text": f"Activity Description: {text_description}"})
+        content += image_parts([image_data_base64])
+        messages = [system_message(prompt_base), {"role": "user", "content": content}]
 
         print(f"Sending request to OpenAI with model: {model_name}")
-        response = client.chat.completions.create(
+        response = await create_chat_completion(
+            prompt_type="feedback",
             model=model_name,
             messages=messages,
             response_format={"type": "json_object"},
@@ -49,11 +346,15 @@ async def get_ai_feedback(
         if not response_content:
             raise HTTPException(status_code=500, detail="AI returned an empty response.")
 
-        return json.loads(response_content)
+        feedback = validated(json.loads(response_content), validate)
+        await response_cache.set(cache_key, feedback, kind="feedback", model_name=model_name)
+        return feedback
 
+    except HTTPException:
+        raise
     except APIError as e:
         print(f"OpenAI API Error: {e}")
-        raise HTTPException(status_code=500, detail=f"An error occurred with the OpenAI API: {e}")
+        raise api_error_exception(e)
     except json.JSONDecodeError:
         print(f"Failed to decode JSON from AI response: {response_content}")
         raise HTTPException(status_code=500, detail="Failed to parse JSON feedback from AI.")
@@ -61,49 +362,51 @@ async def get_ai_feedback(
         print(f"An unexpected error occurred: {e}")
         raise HTTPException(status_code=500, detail="An unexpected error occurred while getting AI feedback.")
 
+def build_feedback_multi_messages(
+    images_data_base64: List[str],
+    text_description: Optional[str],
+    prompt_base: str
+) -> List[dict]:
+    """
+    Builds the chat messages used to evaluate a set of images.
+    Shared by get_ai_feedback_multi and batch evaluations.
+    """
+    content = []
+    if text_description:
+        content.append({"type": "text", "text": f"Activity Description: {text_description}"})
+    
+    # Add instruction for multiple images
+    content.append({
+        "type": "text", 
+        "text": f"You are evaluating {len(images_data_base64)} images. Please consider all images equally when providing your assessment."
+    })
+    content += image_parts(images_data_base64)
+
+    return [system_message(prompt_base), {"role": "user", "content": content}]
+
+@tracing.traced
 async def get_ai_feedback_multi(
     images_data_base64: List[str],
     text_description: Optional[str],
     prompt_base: str,
-    openai_api_key: str,
-    model_name: str
+    model_name: str,
+    validate: Optional[Callable[[dict], dict]] = None
 ) -> dict:
     """
     Gets feedback from OpenAI's vision model for multiple images.
+    The response is passed through validate before it is cached and returned.
     """
-    try:
-        client = OpenAI(api_key=openai_api_key)
-
-        content = [{"type": "text", "text": prompt_base}]
-        
-        if text_description:
-            content.append({"type": "text", "text": f"Activity Description: {text_description}"})
-        
-        # Add instruction for multiple images
-        content.append({
-            "type": "text", 
-            "text": f"You are evaluating {len(images_data_base64)} images. Please consider all images equally when providing your assessment."
-        })
+    cache_key = response_cache.make_key("feedback_multi", images_data_base64, text_description, prompt_base, model_name)
+    cached = await response_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
-        # Add all images
-        for i, image_data in enumerate(images_data_base64):
-            content.append({
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:image/jpeg;base64,{image_data}",
-                    "detail": "low"
-                }
-            })
-
-        messages = [
-            {
-                "role": "user",
-                "content": content
-            }
-        ]
+    try:
+        messages = build_feedback_multi_messages(images_data_base64, text_description, prompt_base)
 
         print(f"Sending request to OpenAI with model: {model_name} for {len(images_data_base64)} images")
-        response = client.chat.completions.create(
+        response = await create_chat_completion(
+            prompt_type="feedback_multi",
             model=model_name,
             messages=messages,
             response_format={"type": "json_object"},
@@ -116,11 +419,15 @@ async def get_ai_feedback_multi(
         if not response_content:
             raise HTTPException(status_code=500, detail="AI returned an empty response.")
 
-        return json.loads(response_content)
+        feedback = validated(json.loads(response_content), validate)
+        await response_cache.set(cache_key, feedback, kind="feedback", model_name=model_name)
+        return feedback
 
+    except HTTPException:
+        raise
     except APIError as e:
         print(f"OpenAI API Error: {e}")
-        raise HTTPException(status_code=500, detail=f"An error occurred with the OpenAI API: {e}")
+        raise api_error_exception(e)
     except json.JSONDecodeError:
         print(f"Failed to decode JSON from AI response: {response_content}")
         raise HTTPException(status_code=500, detail="Failed to parse JSON feedback from AI.")
@@ -128,61 +435,122 @@ async def get_ai_feedback_multi(
         print(f"An unexpected error occurred: {e}")
         raise HTTPException(status_code=500, detail="An unexpected error occurred while getting AI feedback.")
 
+async def stream_ai_feedback_multi(
+    images_data_base64: List[str],
+    text_description: Optional[str],
+    prompt_base: str,
+    model_name: str,
+    validate: Optional[Callable[[dict], dict]] = None
+) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Streams feedback for multiple images, yielding (criterion, feedback) pairs
+    as soon as the model has finished writing each criterion.
+    Shares its cache with get_ai_feedback_multi; cached feedback is replayed at once.
+    The complete feedback is only cached if it passes validate.
+    """
+    cache_key = response_cache.make_key("feedback_multi", images_data_base64, text_description, prompt_base, model_name)
+    cached = await response_cache.get(cache_key)
+    if cached is not None:
+        for criterion, criterion_feedback in cached.items():
+            yield criterion, criterion_feedback
+        return
+
+    try:
+        messages = build_feedback_multi_messages(images_data_base64, text_description, prompt_base)
+
+        print(f"Streaming request to OpenAI with model: {model_name} for {len(images_data_base64)} images")
+        stream = await create_chat_completion(
+            prompt_type="feedback_stream",
+            model=model_name,
+            messages=messages,
+            response_format={"type": "json_object"},
+            max_tokens=1500,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+        parser = JSONObjectStreamParser()
+        feedback = {}
+        async with stream:
+            async for chunk in stream:
+                if chunk.usage:
+                    metrics.record_usage(chunk.usage, model_name, "feedback_stream")
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                for criterion, criterion_feedback in parser.feed(chunk.choices[0].delta.content):
+                    feedback[criterion] = criterion_feedback
+                    yield criterion, criterion_feedback
+
+        if not parser.finished:
+            raise HTTPException(status_code=500, detail="AI response ended before the feedback was complete.")
+        print("Received streamed response from OpenAI.")
+        try:
+            feedback = validated(feedback, validate)
+        except InvalidAIResponseError as e:
+            # The valid criteria have been streamed already; only caching is skipped
+            print(f"Not caching streamed feedback: {e.detail}")
+            return
+        await response_cache.set(cache_key, feedback, kind="feedback", model_name=model_name)
+
+    except HTTPException:
+        raise
+    except APIError as e:
+        print(f"OpenAI API Error: {e}")
+        raise api_error_exception(e)
+    except json.JSONDecodeError:
+        print(f"Failed to decode JSON from streamed AI response: {parser.buffer}")
+        raise HTTPException(status_code=500, detail="Failed to parse JSON feedback from AI.")
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+        raise HTTPException(status_code=500, detail="An unexpected error occurred while getting AI feedback.")
+
+@tracing.traced
 async def get_improvement_suggestions(
     images_data_base64: List[str],
     text_description: Optional[str],
     evaluation_results: Dict,
     prompt_base: str,
-    openai_api_key: str,
-    model_name: str
+    model_name: str,
+    use_cache: bool = True,
+    validate: Optional[Callable[[dict], dict]] = None
 ) -> dict:
     """
     Gets improvement suggestions from OpenAI's vision model based on evaluation results and images.
+    With use_cache=False a fresh answer is requested (and then cached).
+    The response is passed through validate before it is cached and returned.
     """
-    try:
-        client = OpenAI(api_key=openai_api_key)
+    cache_key = response_cache.make_key(
+        "improvement_suggestions", images_data_base64, text_description, prompt_base, model_name,
+        context=evaluation_results
+    )
+    cached = await response_cache.get(cache_key) if use_cache else None
+    if cached is not None:
+        return cached
 
-        # Create context with evaluation results
-        evaluation_context = f"""
-Evaluation Results:
-{json.dumps(evaluation_results, indent=2)}
-
-Based on these evaluation results, the images provided, and the activity description, please generate improvement suggestions.
-"""
-
-        content = [
-            {"type": "text", "text": prompt_base},
-            {"type": "text", "text": evaluation_context}
-        ]
-        
+    try:
+        content = []
         if text_description:
-            content.insert(1, {"type": "text", "text": f"Activity Description: {text_description}"})
+            content.append({"type": "text", "text": f"Activity Description: {text_description}"})
         
         # Add instruction for multiple images
         content.append({
             "type": "text", 
             "text": f"You are analyzing {len(images_data_base64)} images to provide improvement suggestions based on the evaluation results."
         })
+        content += image_parts(images_data_base64)
 
-        # Add all images
-        for i, image_data in enumerate(images_data_base64):
-            content.append({
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:image/jpeg;base64,{image_data}",
-                    "detail": "low"
-                }
-            })
-
-        messages = [
-            {
-                "role": "user",
-                "content": content
-            }
-        ]
+        # The evaluation results differ on every call, so they come last
+        evaluation_context = f"""Evaluation Results:
+{json.dumps(evaluation_results, separators=(",", ":"))}
+
+Based on these evaluation results, the images provided, and the activity description, please generate improvement suggestions."""
+        content.append({"type": "text", "text": evaluation_context})
+
+        messages = [system_message(prompt_base), {"role": "user", "content": content}]
 
         print(f"Sending improvement suggestions request to OpenAI with model: {model_name} for {len(images_data_base64)} images")
-        response = client.chat.completions.create(
+        response = await create_chat_completion(
+            prompt_type="improvement_suggestions",
             model=model_name,
             messages=messages,
             response_format={"type": "json_object"},
@@ -195,14 +563,184 @@ Based on these evaluation results, the images provided, and the activity descrip
         if not response_content:
             raise HTTPException(status_code=500, detail="AI returned an empty response for improvement suggestions.")
 
-        return json.loads(response_content)
+        suggestions = validated(json.loads(response_content), validate)
+        await response_cache.set(cache_key, suggestions, kind="improvement_suggestions", model_name=model_name)
+        return suggestions
 
+    except HTTPException:
+        raise
     except APIError as e:
         print(f"OpenAI API Error for improvement suggestions: {e}")
-        raise HTTPException(status_code=500, detail=f"An error occurred with the OpenAI API: {e}")
+        raise api_error_exception(e)
     except json.JSONDecodeError:
         print(f"Failed to decode JSON from AI improvement suggestions response: {response_content}")
         raise HTTPException(status_code=500, detail="Failed to parse JSON improvement suggestions from AI.")
     except Exception as e:
         print(f"An unexpected error occurred while getting improvement suggestions: {e}")
-        raise HTTPException(status_code=500, detail="An unexpected error occurred while getting improvement suggestions.") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="An unexpected error occurred while getting improvement suggestions.") 
+
+
+# Fused mode evaluates an image set and suggests improvements in a single call,
+# so each image set is sent to the model once instead of twice.
+FUSED_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "fused_evaluation",
+        # Criteria names come from the prompts, so the schema can't be strict
+        "strict": False,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "evaluation": {
+                    "type": "object",
+                    "additionalProperties": {
+                        "type": "object",
+                        "properties": {
+                            "score": {"type": "number", "enum": [0, 0.5, 1]},
+                            "what_went_well": {"type": "string"},
+                            "what_could_be_improved": {"type": "string"},
+                        },
+                        "required": ["score", "what_went_well", "what_could_be_improved"],
+                    },
+                },
+                "improvement_suggestions": {
+                    "type": "object",
+                    "additionalProperties": {"type": "array", "items": {"type": "string"}},
+                },
+            },
+            "required": ["evaluation", "improvement_suggestions"],
+        },
+    },
+}
+
+def build_fused_prompt(evaluation_prompt: str, suggestions_prompt: str) -> str:
+    """
+    Combines an evaluation prompt and the improvement suggestions prompt
+    into one prompt whose answer contains both.
+    """
+    return f"""{evaluation_prompt}
+
+# Improvement Suggestions
+
+In the same response, also act on the following instructions. Base the suggestions on your own evaluation above.
+
+{suggestions_prompt}
+
+# Combined Output Format
+
+Respond with a single JSON object with two keys:
+- "evaluation": the evaluation JSON object described above, with one entry per criterion
+- "improvement_suggestions": the improvement suggestions JSON object described above, with one entry per criterion
+"""
+
+@tracing.traced
+async def get_fused_feedback(
+    images_data_base64: List[str],
+    text_description: Optional[str],
+    evaluation_prompt: str,
+    suggestions_prompt: str,
+    model_name: str,
+    validate: Optional[Callable[[dict], dict]] = None
+) -> dict:
+    """
+    Gets the evaluation and improvement suggestions for a set of images in one call.
+    Returns {"evaluation": {...}, "improvement_suggestions": {...}}, as passed
+    through validate before it is cached.
+    """
+    prompt_base = build_fused_prompt(evaluation_prompt, suggestions_prompt)
+    cache_key = response_cache.make_key("fused", images_data_base64, text_description, prompt_base, model_name)
+    cached = await response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        messages = build_feedback_multi_messages(images_data_base64, text_description, prompt_base)
+
+        print(f"Sending fused request to OpenAI with model: {model_name} for {len(images_data_base64)} images")
+        response = await create_chat_completion(
+            prompt_type="fused",
+            model=model_name,
+            messages=messages,
+            response_format=FUSED_RESPONSE_FORMAT,
+            max_tokens=3000,
+        )
+
+        response_content = response.choices[0].message.content
+        print("Received fused response from OpenAI.")
+
+        if not response_content:
+            raise HTTPException(status_code=500, detail="AI returned an empty response.")
+
+        feedback = json.loads(response_content)
+        if not isinstance(feedback, dict) or "evaluation" not in feedback:
+            raise HTTPException(status_code=500, detail="AI response is missing the evaluation.")
+        feedback = validated(feedback, validate)
+        await response_cache.set(cache_key, feedback, kind="fused", model_name=model_name)
+        return feedback
+
+    except HTTPException:
+        raise
+    except APIError as e:
+        print(f"OpenAI API Error: {e}")
+        raise api_error_exception(e)
+    except json.JSONDecodeError:
+        print(f"Failed to decode JSON from AI response: {response_content}")
+        raise HTTPException(status_code=500, detail="Failed to parse JSON feedback from AI.")
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+        raise HTTPException(status_code=500, detail="An unexpected error occurred while getting AI feedback.")
+
+# Batch API: requests are uploaded as a JSONL file and processed within the
+# completion window at a lower price than synchronous calls.
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+def build_batch_request(custom_id: str, messages: List[dict], model_name: str) -> dict:
+    """
+    One line of a batch input file: the same chat completion request
+    get_ai_feedback_multi sends, tagged with a custom_id to match its result.
+    """
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": model_name,
+            "messages": messages,
+            "prompt_cache_key": prompt_cache_key(messages[0]["content"]),
+            "response_format": {"type": "json_object"},
+            "max_tokens": 1500,
+        },
+    }
+
+@tracing.traced
+async def create_batch(requests: List[dict], metadata: Optional[Dict[str, str]] = None):
+    """
+    Uploads batch requests and starts a batch job. Returns the OpenAI batch object.
+    """
+    try:
+        client = get_openai_client()
+        input_jsonl = "\n".join(json.dumps(request) for request in requests).encode("utf-8")
+        input_file = await client.files.create(file=("batch_input.jsonl", input_jsonl), purpose="batch")
+        print(f"Creating OpenAI batch with {len(requests)} requests")
+        return await client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=settings.BATCH_COMPLETION_WINDOW,
+            metadata=metadata,
+        )
+    except APIError as e:
+        print(f"OpenAI API Error while creating batch: {e}")
+        raise api_error_exception(e)
+
+@tracing.traced
+async def retrieve_batch(batch_id: str):
+    return await get_openai_client().batches.retrieve(batch_id)
+
+@tracing.traced
+async def read_batch_file(file_id: str) -> List[dict]:
+    """
+    Downloads a batch output or error file and parses its JSONL lines.
+    """
+    content = await get_openai_client().files.content(file_id)
+    return [json.loads(line) for line in content.text.splitlines() if line.strip()]
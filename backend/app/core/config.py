@@ -1,10 +1,39 @@
+from typing import Optional
+from pydantic import field_validator
 from pydantic_settings import BaseSettings
 import os
 
+# Perceptual hashes are indexed in this many bands (see app.reuse); hashes within
+# IMAGE_HASH_BANDS - 1 bits of each other are guaranteed to share one
+IMAGE_HASH_BANDS = 8
+
 class Settings(BaseSettings):
     MONGO_URI: str = ""
+    MONGO_DB_NAME: str = "snapfeedback"
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MIN_POOL_SIZE: int = 0
+    MONGO_MAX_IDLE_TIME_MS: int = 60_000
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = 10_000
+    MONGO_CONNECT_TIMEOUT_MS: int = 10_000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 10_000
+    MONGO_SOCKET_TIMEOUT_MS: int = 30_000
+    # Delete submissions and suggestions after this many days (0 keeps them forever)
+    DATA_RETENTION_DAYS: int = 0
     OPENAI_API_KEY: str = ""
     OPENAI_MODEL: str = "gpt-4.1-mini"
+    OPENAI_BASE_URL: str = ""
+    OPENAI_TIMEOUT_SECONDS: float = 120.0
+    OPENAI_CONNECT_TIMEOUT_SECONDS: float = 10.0
+    OPENAI_MAX_CONNECTIONS: int = 100
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    OPENAI_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    # Concurrent model calls; the limit adapts between min and max as 429s come and go
+    OPENAI_INITIAL_CONCURRENCY: int = 8
+    OPENAI_MIN_CONCURRENCY: int = 1
+    OPENAI_MAX_CONCURRENCY: int = 32
+    OPENAI_MAX_RETRIES: int = 4
+    OPENAI_RETRY_BASE_SECONDS: float = 0.5
+    OPENAI_RETRY_MAX_SECONDS: float = 20.0
     AI_PLAYGROUND_PROMPT: str = """Role: You are an expert in the play-based method for prechools 
 Context: You have been brought on to consult for a pre-school that needs your help with evaluating their classroom experience on the following parameters:
 
@@ -144,6 +173,92 @@ Please respond with a JSON object containing improvement suggestions for each cr
 }
 """
     MAX_ACTIVITY_DESCRIPTION_LENGTH: int = 240
+    # "standard" (separate evaluation and suggestions calls) or "fused" (one call per image set)
+    EVALUATION_MODE: str = "standard"
+    # Images are sent with "detail": "low", which the model downsamples to 512px
+    IMAGE_MAX_DIMENSION: int = 512
+    IMAGE_JPEG_QUALITY: int = 85
+    # Processes that normalize and hash images; 0 runs that work on a thread of the
+    # serving process instead. Unset: 2, or 0 with LAZY_STARTUP (serverless hosts
+    # such as Lambda have no /dev/shm for multiprocessing)
+    IMAGE_PROCESS_WORKERS: Optional[int] = None
+    IMAGE_STORE_BACKEND: str = "local"  # "local" or "s3"
+    IMAGE_STORE_LOCAL_DIR: str = "uploaded_images"
+    IMAGE_STORE_PUBLIC_BASE_URL: str = ""
+    S3_BUCKET: str = ""
+    S3_ENDPOINT_URL: str = ""
+    S3_REGION: str = ""
+    S3_PREFIX: str = "images/"
+    S3_ACCESS_KEY_ID: str = ""
+    S3_SECRET_ACCESS_KEY: str = ""
+    MAX_UPLOAD_BYTES: int = 15 * 1024 * 1024
+    AI_CACHE_ENABLED: bool = True
+    AI_CACHE_MAX_ENTRIES: int = 512
+    AI_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    # In-process cache of polled submissions and suggestions; writes by other processes
+    # show after at most READ_CACHE_TTL_SECONDS (0 disables the cache)
+    READ_CACHE_TTL_SECONDS: float = 1.0
+    READ_CACHE_MAX_ENTRIES: int = 1024
+    # Reuse the feedback of an earlier submission whose images' perceptual hashes are all within
+    # IMAGE_REUSE_MAX_DISTANCE bits (of 64, below IMAGE_HASH_BANDS) and whose activity description is the same
+    IMAGE_REUSE_ENABLED: bool = False
+    IMAGE_REUSE_MAX_DISTANCE: int = 7
+    IMAGE_REUSE_MAX_CANDIDATES: int = 50
+    JOB_WORKER_CONCURRENCY: int = 4
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_BASE_SECONDS: float = 5.0
+    JOB_RETRY_MAX_SECONDS: float = 300.0
+    JOB_POLL_INTERVAL_SECONDS: float = 1.0
+    JOB_LEASE_SECONDS: int = 300
+    # Port of the worker's Prometheus /metrics endpoint (0 disables it)
+    WORKER_METRICS_PORT: int = 9100
+    # OpenTelemetry span exporter: "otlp", "file", "console", or empty to disable tracing
+    TRACING_EXPORTER: str = ""
+    TRACING_OTLP_ENDPOINT: str = ""
+    TRACING_FILE_PATH: str = "traces.jsonl"
+    BATCH_MAX_ITEMS: int = 500
+    BATCH_COMPLETION_WINDOW: str = "24h"
+    BATCH_POLL_INTERVAL_SECONDS: float = 60.0
+    SSE_POLL_INTERVAL_SECONDS: float = 1.0
+    SSE_KEEPALIVE_SECONDS: float = 15.0
+    SSE_MAX_DURATION_SECONDS: float = 300.0
+    # Submissions with the same Idempotency-Key, or without one the same payload within
+    # IDEMPOTENCY_PAYLOAD_TTL_SECONDS (0 turns that off), are evaluated once
+    IDEMPOTENCY_ENABLED: bool = True
+    IDEMPOTENCY_KEY_TTL_SECONDS: int = 24 * 3600
+    IDEMPOTENCY_PAYLOAD_TTL_SECONDS: int = 600
+    # How long duplicates wait for a running submission, and after which its key is taken over
+    IDEMPOTENCY_LOCK_SECONDS: int = 300
+    IDEMPOTENCY_POLL_INTERVAL_SECONDS: float = 0.5
+    # Longest ?wait= of GET /improvement-suggestions/{id}; keep it below the load balancer's idle timeout
+    LONG_POLL_MAX_SECONDS: float = 30.0
+    # Watch collections with change streams (replica sets only); otherwise waiting requests
+    # re-read the document every LONG_POLL_FALLBACK_INTERVAL_SECONDS
+    CHANGE_STREAMS_ENABLED: bool = True
+    LONG_POLL_FALLBACK_INTERVAL_SECONDS: float = 1.0
+    # Production server (python -m app.serve); 0 workers runs one per CPU core
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: int = 0
+    SERVER_BACKLOG: int = 2048
+    SERVER_KEEPALIVE_SECONDS: int = 75
+    SERVER_GRACEFUL_TIMEOUT_SECONDS: int = 30
+    # Restart a worker after this many requests (0 never does)
+    SERVER_MAX_REQUESTS: int = 0
+    SERVER_MAX_REQUESTS_JITTER: int = 100
+    SERVER_FORWARDED_ALLOW_IPS: str = "127.0.0.1"
+    SERVER_ACCESS_LOG: bool = True
+    # Create clients, the image store and the image pool on first use rather than at
+    # startup, and skip creating indexes (serverless deployments, see api/index.py)
+    LAZY_STARTUP: bool = False
+
+    @field_validator("IMAGE_REUSE_MAX_DISTANCE")
+    @classmethod
+    def check_reuse_distance(cls, value: int) -> int:
+        # A larger distance could be allowed, but the band lookup would silently miss those matches
+        if not 0 <= value < IMAGE_HASH_BANDS:
+            raise ValueError(f"must be between 0 and {IMAGE_HASH_BANDS - 1}")
+        return value
 
     class Config:
         env_file = ".env"
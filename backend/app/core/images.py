@@ -0,0 +1,147 @@
+import io
+import base64
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from . import metrics
+from .config import settings
+
+# Pillow work is CPU-bound, so it runs in a process pool instead of on the event loop
+_pool: Optional[ProcessPoolExecutor] = None
+
+class InvalidImageError(ValueError):
+    """
+    Raised when uploaded data cannot be decoded as an image.
+    """
+
+def normalize_image(image_data: bytes, max_dimension: int, jpeg_quality: int) -> bytes:
+    """
+    Decodes an image, applies its EXIF orientation, downsizes it to the vision
+    model's effective resolution and re-encodes it as a compact JPEG.
+    """
+    try:
+        with Image.open(io.BytesIO(image_data)) as img:
+            # Let the JPEG decoder skip pixels we are about to throw away
+            img.draft("RGB", (max_dimension, max_dimension))
+            img = ImageOps.exif_transpose(img)
+            if img.mode in ("RGBA", "LA", "P"):
+                img = img.convert("RGBA")
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img, mask=img.getchannel("A"))
+                img = background
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+            img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+            output = io.BytesIO()
+            img.save(output, format="JPEG", quality=jpeg_quality, optimize=True)
+            return output.getvalue()
+    except UnidentifiedImageError:
+        raise InvalidImageError("Could not process image: unrecognized image format") from None
+    except Exception as e:
+        raise InvalidImageError(f"Could not process image: {e}") from None
+
+def normalize_image_base64(image_data_base64: str, max_dimension: int, jpeg_quality: int) -> bytes:
+    """
+    Same as normalize_image, but also decodes the base64 payload in the pool.
+    """
+    try:
+        image_data = base64.b64decode(image_data_base64)
+    except ValueError as e:
+        raise InvalidImageError(f"Invalid Base64 image data: {e}") from None
+    return normalize_image(image_data, max_dimension, jpeg_quality)
+
+def normalize_image_file(path: str, max_dimension: int, jpeg_quality: int) -> bytes:
+    """
+    Same as normalize_image, but reads the image from disk inside the pool.
+    """
+    with open(path, "rb") as f:
+        return normalize_image(f.read(), max_dimension, jpeg_quality)
+
+# Difference hash: 8 rows of 9 grayscale pixels give 64 left-right comparisons
+DHASH_SIZE = 8
+
+def dhash(image_data: bytes) -> str:
+    """
+    64-bit perceptual difference hash of an image, as 16 hex digits. Each bit
+    says whether a pixel of a tiny grayscale thumbnail is brighter than its
+    right neighbour, so re-encoding, rescaling or slightly re-cropping a photo
+    flips few bits while a different photo flips about half.
+    """
+    with Image.open(io.BytesIO(image_data)) as img:
+        # Decode the JPEG at a fraction of its size; the hash only needs 9x8 pixels
+        img.draft("L", (DHASH_SIZE * 8, DHASH_SIZE * 8))
+        pixels = img.convert("L").resize((DHASH_SIZE + 1, DHASH_SIZE), Image.LANCZOS).tobytes()
+    value = 0
+    for row in range(DHASH_SIZE):
+        for col in range(DHASH_SIZE):
+            left = pixels[row * (DHASH_SIZE + 1) + col]
+            value = (value << 1) | (left > pixels[row * (DHASH_SIZE + 1) + col + 1])
+    return f"{value:016x}"
+
+def hamming_distance(hash_a: str, hash_b: str) -> int:
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
+
+def image_process_workers() -> int:
+    if settings.IMAGE_PROCESS_WORKERS is not None:
+        return settings.IMAGE_PROCESS_WORKERS
+    return 0 if settings.LAZY_STARTUP else 2
+
+def init_image_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Creates the shared image processing pool if it does not exist yet.
+    Returns None when images are processed in-process (0 workers).
+    """
+    global _pool
+    if _pool is None and image_process_workers() > 0:
+        # Spawned workers don't inherit the parent's DB or HTTP client threads
+        _pool = ProcessPoolExecutor(
+            max_workers=image_process_workers(),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+def shutdown_image_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+async def _run_in_pool(stage: str, func, sources: list, *args) -> list:
+    loop = asyncio.get_running_loop()
+    pool = _pool or init_image_pool()
+    with metrics.stage(stage):
+        if pool is None:
+            # Pillow releases the GIL while decoding and resizing, so a thread keeps the loop responsive
+            return await asyncio.gather(*[asyncio.to_thread(func, source, *args) for source in sources])
+        return await asyncio.gather(*[loop.run_in_executor(pool, func, source, *args) for source in sources])
+
+async def normalize_images(images_data_base64: List[str]) -> List[bytes]:
+    """
+    Normalizes base64-encoded images in parallel in the process pool,
+    including the base64 decode. Raises InvalidImageError if any image
+    cannot be decoded.
+    """
+    return await _run_in_pool("image_normalize", normalize_image_base64, images_data_base64, settings.IMAGE_MAX_DIMENSION, settings.IMAGE_JPEG_QUALITY)
+
+async def normalize_raw_images(images_data: List[bytes]) -> List[bytes]:
+    """
+    Normalizes raw image bytes (e.g. uploaded files) in parallel in the process pool.
+    """
+    return await _run_in_pool("image_normalize", normalize_image, images_data, settings.IMAGE_MAX_DIMENSION, settings.IMAGE_JPEG_QUALITY)
+
+async def normalize_image_files(paths: List[str]) -> List[bytes]:
+    """
+    Normalizes images stored on disk in parallel in the process pool;
+    only file paths cross the process boundary, not image bytes.
+    """
+    return await _run_in_pool("image_normalize", normalize_image_file, paths, settings.IMAGE_MAX_DIMENSION, settings.IMAGE_JPEG_QUALITY)
+
+async def perceptual_hashes(images_data: List[bytes]) -> List[str]:
+    """
+    dHashes of normalized images, computed in the process pool.
+    """
+    return await _run_in_pool("image_hash", dhash, images_data)
@@ -0,0 +1,66 @@
+import json
+from typing import Any, List, Tuple
+
+class JSONObjectStreamParser:
+    """
+    Incrementally parses a JSON object that arrives in chunks (e.g. a streamed
+    model response) and returns each top-level member as soon as its value is complete.
+
+        parser = JSONObjectStreamParser()
+        for chunk in chunks:
+            for key, value in parser.feed(chunk):
+                ...
+    """
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        # Start of the current top-level member in the buffer
+        self.member_start = None
+        self.finished = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        Adds a chunk of text and returns the top-level members completed by it.
+        """
+        self.buffer += chunk
+        members = []
+        while self.position < len(self.buffer) and not self.finished:
+            char = self.buffer[self.position]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+                if self.depth == 1:
+                    self.member_start = self.position + 1
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 1:
+                    # An object or array value just closed; don't wait for the next comma
+                    members += self._complete_member(self.position + 1)
+                elif self.depth == 0:
+                    members += self._complete_member(self.position)
+                    self.finished = True
+            elif char == "," and self.depth == 1:
+                members += self._complete_member(self.position)
+                self.member_start = self.position + 1
+            self.position += 1
+        return members
+
+    def _complete_member(self, end: int) -> List[Tuple[str, Any]]:
+        if self.member_start is None:
+            return []
+        text = self.buffer[self.member_start:end].strip()
+        self.member_start = None
+        if not text:
+            return []
+        return list(json.loads("{" + text + "}").items())
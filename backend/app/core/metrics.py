@@ -0,0 +1,180 @@
+"""
+Prometheus metrics. The API serves them at /metrics and the job worker on its
+own port (WORKER_METRICS_PORT). When several processes serve the API, set
+PROMETHEUS_MULTIPROC_DIR to a shared empty directory so /metrics adds them up.
+"""
+import os
+import glob
+import functools
+from typing import Tuple
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess, start_http_server,
+)
+
+# Pipeline stages take milliseconds (serialization) to seconds (image writes to S3)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Model calls take seconds to minutes
+MODEL_CALL_BUCKETS = (0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 45, 60, 90, 120)
+
+STAGE_SECONDS = Histogram(
+    "snapfeedback_stage_duration_seconds",
+    "Time spent in each stage of the submission pipeline",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+MODEL_CALL_SECONDS = Histogram(
+    "snapfeedback_openai_call_duration_seconds",
+    "Duration of OpenAI calls including queueing and retries (until the first byte for streams)",
+    ["model", "prompt_type", "outcome"],
+    buckets=MODEL_CALL_BUCKETS,
+)
+SCHEDULER_WAIT_SECONDS = Histogram(
+    "snapfeedback_openai_queue_wait_seconds",
+    "Time OpenAI calls waited in the scheduler queue",
+    ["priority"],
+    buckets=STAGE_BUCKETS + MODEL_CALL_BUCKETS[8:],
+)
+OPENAI_TOKENS = Counter(
+    "snapfeedback_openai_tokens_total",
+    "Tokens used by OpenAI calls",
+    ["model", "prompt_type", "token_type"],
+)
+OPENAI_RETRIES = Counter(
+    "snapfeedback_openai_retries_total",
+    "OpenAI calls retried by the scheduler",
+    ["reason"],
+)
+AI_CACHE_LOOKUPS = Counter(
+    "snapfeedback_ai_cache_lookups_total",
+    "AI response cache lookups",
+    ["result"],
+)
+CONDITIONAL_RESPONSES = Counter(
+    "snapfeedback_conditional_responses_total",
+    "Responses of polled documents: modified (sent in full) or not_modified (304)",
+    ["result"],
+)
+IMAGE_REUSE_LOOKUPS = Counter(
+    "snapfeedback_image_reuse_lookups_total",
+    "Image sets looked up for near-duplicate submissions, by whether their feedback was reused",
+    ["kind", "result"],
+)
+LONG_POLLS = Counter(
+    "snapfeedback_long_polls_total",
+    "Long-polling requests by result: ready (the document was found) or timeout",
+    ["result"],
+)
+READ_CACHE_LOOKUPS = Counter(
+    "snapfeedback_read_cache_lookups_total",
+    "Lookups of polled documents in the in-process read cache",
+    ["collection", "result"],
+)
+IDEMPOTENT_REQUESTS = Counter(
+    "snapfeedback_idempotent_requests_total",
+    "Deduplicated submissions: new, joined (waited for a running duplicate) or replayed",
+    ["outcome"],
+)
+JOBS = Counter(
+    "snapfeedback_jobs_total",
+    "Background jobs run by the worker, by outcome",
+    ["job_type", "outcome"],
+)
+SCHEDULER_QUEUE_DEPTH = Gauge(
+    "snapfeedback_openai_queue_depth",
+    "OpenAI calls waiting in the scheduler queue",
+    ["priority"],
+    multiprocess_mode="livesum",
+)
+SCHEDULER_IN_FLIGHT = Gauge(
+    "snapfeedback_openai_in_flight",
+    "OpenAI calls in flight",
+    multiprocess_mode="livesum",
+)
+SCHEDULER_CONCURRENCY_LIMIT = Gauge(
+    "snapfeedback_openai_concurrency_limit",
+    "Current adaptive concurrency limit of the OpenAI scheduler",
+    multiprocess_mode="livesum",
+)
+
+def stage(name: str):
+    """
+    Times a pipeline stage: `with metrics.stage("image_write"): ...`
+    """
+    return STAGE_SECONDS.labels(name).time()
+
+def timed(name: str):
+    """
+    Decorator timing an async function as a pipeline stage.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with STAGE_SECONDS.labels(name).time():
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_usage(usage, model: str, prompt_type: str) -> None:
+    """
+    Counts the tokens of a completion's usage object.
+    """
+    if usage is None:
+        return
+    OPENAI_TOKENS.labels(model, prompt_type, "prompt").inc(usage.prompt_tokens or 0)
+    OPENAI_TOKENS.labels(model, prompt_type, "completion").inc(usage.completion_tokens or 0)
+    # Prompt tokens read from the provider's prompt cache, a subset of "prompt"
+    OPENAI_TOKENS.labels(model, prompt_type, "cached_prompt").inc(cached_tokens(usage))
+
+def cached_tokens(usage) -> int:
+    details = getattr(usage, "prompt_tokens_details", None)
+    return (details.cached_tokens or 0) if details is not None else 0
+
+def render() -> Tuple[bytes, str]:
+    """
+    Metrics in the Prometheus text format and their content type.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def mark_process_dead(pid: int) -> None:
+    """
+    Removes the live gauges of an exited process from PROMETHEUS_MULTIPROC_DIR,
+    so livesum gauges such as the calls in flight stop counting it.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
+
+def process_exists(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def remove_dead_processes() -> None:
+    """
+    Marks dead the processes that left live gauges in PROMETHEUS_MULTIPROC_DIR
+    without shutting down, such as a killed worker the server restarted.
+    """
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not directory:
+        return
+    for path in glob.glob(os.path.join(directory, "gauge_live*_*.db")):
+        pid = int(os.path.basename(path)[:-len(".db")].rsplit("_", 1)[1])
+        if not process_exists(pid):
+            multiprocess.mark_process_dead(pid, directory)
+
+def start_metrics_server(port: int) -> None:
+    """
+    Serves /metrics from a background thread, for processes without a web app.
+    """
+    if port:
+        start_http_server(port)
+        print(f"Serving metrics on port {port}")
@@ -0,0 +1,114 @@
+"""
+In-process notification bus for requests that wait for a document to be
+written (long polling). Writes made by this process publish directly; writes
+made by other processes (the worker, other API workers) arrive through a
+MongoDB change stream on the collection. Change streams need a replica set
+or sharded cluster; without one, waiters fall back to re-reading the
+document every LONG_POLL_FALLBACK_INTERVAL_SECONDS.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, Set, TypeVar
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.errors import OperationFailure
+
+from . import metrics
+from .config import settings
+
+T = TypeVar("T")
+
+class NotificationBus:
+    def __init__(self):
+        self.waiters: Dict[str, Set[asyncio.Future]] = {}
+        # Change stream tasks and whether each stream is open, by collection name
+        self.watch_tasks: Dict[str, asyncio.Task] = {}
+        self.watching: Set[str] = set()
+        self.unsupported = not settings.CHANGE_STREAMS_ENABLED
+
+    def publish(self, topic: str) -> None:
+        """
+        Wakes every request waiting on topic.
+        """
+        for future in self.waiters.pop(topic, ()):
+            if not future.done():
+                future.set_result(None)
+
+    def watch(self, collection: AsyncCollection, key_field: str) -> None:
+        """
+        Publishes "<collection>:<key_field value>" for every document inserted or
+        updated in collection by any process. Started on first use; does nothing
+        once the deployment turned out not to support change streams.
+        """
+        task = self.watch_tasks.get(collection.name)
+        if self.unsupported or (task is not None and not task.done()):
+            return
+        self.watch_tasks[collection.name] = asyncio.create_task(self._watch(collection, key_field))
+
+    async def _watch(self, collection: AsyncCollection, key_field: str) -> None:
+        pipeline = [
+            {"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}},
+            {"$project": {f"fullDocument.{key_field}": 1}},
+        ]
+        try:
+            async with await collection.watch(pipeline, full_document="updateLookup") as stream:
+                self.watching.add(collection.name)
+                print(f"Watching {collection.name} for long-poll notifications")
+                async for change in stream:
+                    document = change.get("fullDocument")
+                    if document is not None:
+                        self.publish(f"{collection.name}:{document[key_field]}")
+        except asyncio.CancelledError:
+            raise
+        except OperationFailure as e:
+            # A standalone server can't open change streams; don't try again
+            print(f"Change streams unavailable, long polls re-read {collection.name} instead: {e}")
+            self.unsupported = True
+        except Exception as e:
+            # Reopened by the next waiter
+            print(f"Change stream on {collection.name} stopped: {e}")
+        finally:
+            self.watching.discard(collection.name)
+
+    async def wait_for(
+        self,
+        topic: str,
+        load: Callable[[], Awaitable[Optional[T]]],
+        timeout: float,
+        collection_name: str
+    ) -> Optional[T]:
+        """
+        Returns what load returns as soon as it isn't None, or None after timeout
+        seconds. load runs once up front and again after every notification,
+        or every fallback interval while collection_name isn't being watched.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            # Subscribe before loading, so a write right after the load isn't missed
+            future = loop.create_future()
+            self.waiters.setdefault(topic, set()).add(future)
+            try:
+                result = await load()
+                remaining = deadline - loop.time()
+                if result is not None or remaining <= 0:
+                    metrics.LONG_POLLS.labels("ready" if result is not None else "timeout").inc()
+                    return result
+                if collection_name not in self.watching:
+                    remaining = min(remaining, settings.LONG_POLL_FALLBACK_INTERVAL_SECONDS)
+                try:
+                    await asyncio.wait_for(future, timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+            finally:
+                waiters = self.waiters.get(topic)
+                if waiters is not None:
+                    waiters.discard(future)
+                    if not waiters:
+                        del self.waiters[topic]
+
+    async def close(self) -> None:
+        for task in self.watch_tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.watch_tasks.values(), return_exceptions=True)
+        self.watch_tasks.clear()
+
+bus = NotificationBus()
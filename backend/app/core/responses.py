@@ -0,0 +1,105 @@
+"""
+JSON responses for MongoDB documents, encoded with orjson. Datetimes are
+encoded natively and ObjectIds by bson_default, so a document is serialized
+in one pass instead of being copied to convert its ObjectIds and then
+validated again against the endpoint's response_model.
+
+Documents that clients poll are served with an ETag and Last-Modified
+derived from their updated_at, and a request whose validators still match
+gets a bodyless 304 instead of the encoded document.
+"""
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from functools import lru_cache
+from typing import Dict, Optional, Tuple, Type
+import orjson
+from bson import ObjectId
+from pydantic import BaseModel
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+from . import metrics
+
+def bson_default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=bson_default)
+
+class BSONJSONResponse(JSONResponse):
+    """
+    JSONResponse that also encodes ObjectIds.
+    """
+    def render(self, content) -> bytes:
+        with metrics.stage("response_encode"):
+            return dumps(content)
+
+@lru_cache(maxsize=None)
+def _response_fields(model: Type[BaseModel]) -> Tuple[Tuple[str, object], ...]:
+    return tuple(
+        (field.alias or name, None if field.is_required() else field.default)
+        for name, field in model.model_fields.items()
+    )
+
+def model_content(document: Dict, model: Type[BaseModel]) -> Dict:
+    """
+    The fields of model taken from a database document, leaving out internal
+    fields (job, hash and cache metadata). The document is not validated, so
+    it must come from the database rather than a client.
+    """
+    return {alias: document.get(alias, default) for alias, default in _response_fields(model)}
+
+def model_response(document: Dict, model: Type[BaseModel], status_code: int = 200) -> BSONJSONResponse:
+    """
+    Response with a database document's model_content, as the endpoint's
+    response_model would have returned it.
+    """
+    return BSONJSONResponse(model_content(document, model), status_code=status_code)
+
+def validators(document: Dict) -> Optional[Tuple[str, datetime]]:
+    """
+    The ETag and last-modified time of a document, or None for documents
+    without updated_at. MongoDB keeps milliseconds, so the ETag does too.
+    """
+    updated_at = document.get("updated_at")
+    if updated_at is None:
+        return None
+    updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return f'W/"{document["_id"]}-{int(updated_at.timestamp() * 1000)}"', updated_at
+
+def not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    """
+    Whether the client's copy is current. If-None-Match takes precedence over
+    If-Modified-Since, which only has one-second resolution.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag.removeprefix("W/") in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def conditional_model_response(request: Request, document: Dict, model: Type[BaseModel]) -> Response:
+    """
+    model_response with validators, or a 304 when the client already has the document.
+    Clients have to revalidate every time, since the document changes as its evaluation progresses.
+    """
+    document_validators = validators(document)
+    if document_validators is None:
+        return model_response(document, model)
+    etag, last_modified = document_validators
+    headers = {"ETag": etag, "Last-Modified": format_datetime(last_modified, usegmt=True), "Cache-Control": "no-cache"}
+    if not_modified(request, etag, last_modified):
+        metrics.CONDITIONAL_RESPONSES.labels("not_modified").inc()
+        return Response(status_code=304, headers=headers)
+    metrics.CONDITIONAL_RESPONSES.labels("modified").inc()
+    response = model_response(document, model)
+    response.headers.update(headers)
+    return response
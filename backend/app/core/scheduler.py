@@ -0,0 +1,220 @@
+import re
+import time
+import heapq
+import random
+import asyncio
+import itertools
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from openai import APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+
+from . import metrics
+from .config import settings
+
+# Interactive calls (a user waiting on /submit-design*) are dispatched before
+# background work (worker jobs) whenever calls have to queue.
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# Priority of the model calls made by the current task; the worker sets BACKGROUND
+current_priority: ContextVar[int] = ContextVar("openai_call_priority", default=INTERACTIVE)
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parses OpenAI's x-ratelimit-reset-* durations ("20ms", "1s", "6m0s") into seconds.
+    """
+    if not value:
+        return None
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (RateLimitError, APIConnectionError, APITimeoutError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+class OpenAIScheduler:
+    """
+    Admission control for OpenAI calls. Calls wait in a priority queue until
+    there is a free concurrency slot and the request and token budgets reported
+    in the rate-limit headers allow them. The concurrency limit adapts: it grows
+    by one per window of successful calls and halves on every 429 (AIMD).
+    Rate-limited, timed-out and 5xx calls are retried with jittered backoff.
+    """
+    def __init__(
+        self,
+        initial_concurrency: int,
+        min_concurrency: int,
+        max_concurrency: int,
+        max_retries: int,
+        retry_base_seconds: float,
+        retry_max_seconds: float
+    ):
+        self.concurrency_limit = float(initial_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+
+        self.in_flight = 0
+        self.waiters: List[Tuple[int, int, asyncio.Future, int]] = []
+        self.queued = {priority: 0 for priority in PRIORITY_NAMES}
+        self.sequence = itertools.count()
+        self.wake_handle: Optional[asyncio.TimerHandle] = None
+
+        # Budgets from the latest rate-limit headers; None until the first response
+        self.remaining_requests: Optional[int] = None
+        self.remaining_tokens: Optional[int] = None
+        self.requests_reset_at = 0.0
+        self.tokens_reset_at = 0.0
+
+        self.completed = 0
+        self.retries = 0
+        self.rate_limited = 0
+
+    def _budget_delay(self, estimated_tokens: int) -> float:
+        """
+        Seconds until the budgets allow another call of this size; 0 if it can go now.
+        """
+        now = time.monotonic()
+        delay = 0.0
+        if self.remaining_requests is not None and self.remaining_requests <= 0 and now < self.requests_reset_at:
+            delay = max(delay, self.requests_reset_at - now)
+        if self.remaining_tokens is not None and self.remaining_tokens < estimated_tokens and now < self.tokens_reset_at:
+            delay = max(delay, self.tokens_reset_at - now)
+        return delay
+
+    def _dispatch(self) -> None:
+        self._admit()
+        for priority, name in PRIORITY_NAMES.items():
+            metrics.SCHEDULER_QUEUE_DEPTH.labels(name).set(self.queued[priority])
+        metrics.SCHEDULER_IN_FLIGHT.set(self.in_flight)
+        metrics.SCHEDULER_CONCURRENCY_LIMIT.set(int(self.concurrency_limit))
+
+    def _admit(self) -> None:
+        """
+        Admits queued calls in priority order while slots and budget are available.
+        """
+        while self.waiters and self.in_flight < int(self.concurrency_limit):
+            priority, _, future, estimated_tokens = self.waiters[0]
+            if future.done():
+                heapq.heappop(self.waiters)
+                continue
+            delay = self._budget_delay(estimated_tokens)
+            if delay > 0:
+                if self.wake_handle is None:
+                    self.wake_handle = asyncio.get_running_loop().call_later(delay, self._wake)
+                return
+            heapq.heappop(self.waiters)
+            self.queued[priority] -= 1
+            self.in_flight += 1
+            # Reserve budget until the response reports the real numbers
+            if self.remaining_requests is not None:
+                self.remaining_requests -= 1
+            if self.remaining_tokens is not None:
+                self.remaining_tokens -= estimated_tokens
+            future.set_result(None)
+
+    def _wake(self) -> None:
+        self.wake_handle = None
+        self._dispatch()
+
+    async def _acquire(self, priority: int, estimated_tokens: int) -> None:
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.sequence), future, estimated_tokens))
+        self.queued[priority] += 1
+        queued_at = time.monotonic()
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # A slot granted just before cancellation must be handed back
+                self._release()
+            else:
+                self.queued[priority] -= 1
+                self._dispatch()
+            raise
+        metrics.SCHEDULER_WAIT_SECONDS.labels(PRIORITY_NAMES[priority]).observe(time.monotonic() - queued_at)
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _update_budgets(self, headers) -> None:
+        now = time.monotonic()
+        if headers.get("x-ratelimit-remaining-requests") is not None:
+            self.remaining_requests = int(headers["x-ratelimit-remaining-requests"])
+            self.requests_reset_at = now + (parse_reset_duration(headers.get("x-ratelimit-reset-requests")) or 0)
+        if headers.get("x-ratelimit-remaining-tokens") is not None:
+            self.remaining_tokens = int(headers["x-ratelimit-remaining-tokens"])
+            self.tokens_reset_at = now + (parse_reset_duration(headers.get("x-ratelimit-reset-tokens")) or 0)
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        retry_after = None
+        if isinstance(error, APIStatusError):
+            headers = error.response.headers
+            if headers.get("retry-after-ms"):
+                retry_after = float(headers["retry-after-ms"]) / 1000
+            elif headers.get("retry-after", "").isdigit():
+                retry_after = float(headers["retry-after"])
+        backoff = min(self.retry_base_seconds * (2 ** attempt), self.retry_max_seconds)
+        # Full jitter keeps retries from many callers from arriving together
+        return (retry_after or 0) + random.uniform(0, backoff)
+
+    async def call(self, request: Callable[[], Awaitable], *, estimated_tokens: int = 0):
+        """
+        Runs request (a coroutine factory returning a raw response, i.e. a
+        client.….with_raw_response call) under admission control and retries,
+        and returns the parsed response.
+        """
+        priority = current_priority.get()
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(priority, estimated_tokens)
+            try:
+                raw_response = await request()
+                self._update_budgets(raw_response.headers)
+                self.completed += 1
+                self.concurrency_limit = min(self.concurrency_limit + 1 / self.concurrency_limit, self.max_concurrency)
+                return raw_response.parse()
+            except Exception as e:
+                if isinstance(e, APIStatusError):
+                    self._update_budgets(e.response.headers)
+                if isinstance(e, RateLimitError):
+                    self.rate_limited += 1
+                    self.concurrency_limit = max(self.concurrency_limit / 2, self.min_concurrency)
+                if not is_retryable(e) or attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt, e)
+                self.retries += 1
+                metrics.OPENAI_RETRIES.labels(type(e).__name__).inc()
+                print(f"OpenAI call failed ({type(e).__name__}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            finally:
+                self._release()
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict:
+        return {
+            "queue_depth": {PRIORITY_NAMES[priority]: count for priority, count in self.queued.items()},
+            "in_flight": self.in_flight,
+            "concurrency_limit": int(self.concurrency_limit),
+            "remaining_requests": self.remaining_requests,
+            "remaining_tokens": self.remaining_tokens,
+            "completed": self.completed,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+        }
+
+scheduler = OpenAIScheduler(
+    initial_concurrency=settings.OPENAI_INITIAL_CONCURRENCY,
+    min_concurrency=settings.OPENAI_MIN_CONCURRENCY,
+    max_concurrency=settings.OPENAI_MAX_CONCURRENCY,
+    max_retries=settings.OPENAI_MAX_RETRIES,
+    retry_base_seconds=settings.OPENAI_RETRY_BASE_SECONDS,
+    retry_max_seconds=settings.OPENAI_RETRY_MAX_SECONDS,
+)
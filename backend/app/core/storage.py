@@ -0,0 +1,144 @@
+import os
+import asyncio
+import hashlib
+import tempfile
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from .config import settings
+
+class ImageStore(ABC):
+    """
+    Storage backend for uploaded images. Keys are derived from the image content,
+    so uploading the same image twice stores it once.
+    """
+    @staticmethod
+    def make_key(data: bytes, extension: str = "jpeg") -> str:
+        return f"{hashlib.sha256(data).hexdigest()}.{extension}"
+
+    @abstractmethod
+    async def put(self, data: bytes, content_type: str = "image/jpeg") -> str:
+        """
+        Stores an image and returns its key.
+        """
+
+    @abstractmethod
+    async def get(self, key: str) -> bytes:
+        """
+        Returns the bytes of a stored image.
+        """
+
+    def url_for(self, key: str) -> str:
+        """
+        URL clients use to fetch an image; served by the API under /images by default.
+        """
+        if settings.IMAGE_STORE_PUBLIC_BASE_URL:
+            return f"{settings.IMAGE_STORE_PUBLIC_BASE_URL.rstrip('/')}/{key}"
+        return f"/images/{key}"
+
+class LocalImageStore(ImageStore):
+    """
+    Stores images in a directory on the local filesystem.
+    File I/O runs in a thread so it doesn't block the event loop.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        path = os.path.realpath(os.path.join(self.directory, key))
+        if not path.startswith(os.path.realpath(self.directory) + os.sep):
+            raise ValueError(f"Invalid image key: {key}")
+        return path
+
+    def _write(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        # Write to a temporary file first so readers never see a partial image
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            # Don't leave the partial file in the served directory
+            os.unlink(tmp_path)
+            raise
+
+    def _read(self, key: str) -> bytes:
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    async def put(self, data: bytes, content_type: str = "image/jpeg") -> str:
+        key = self.make_key(data)
+        await asyncio.to_thread(self._write, key, data)
+        return key
+
+    async def get(self, key: str) -> bytes:
+        return await asyncio.to_thread(self._read, key)
+
+class S3ImageStore(ImageStore):
+    """
+    Stores images in an S3-compatible bucket (AWS S3, MinIO, ...).
+    Requires boto3; blocking SDK calls run in a thread.
+    """
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, region: Optional[str] = None, prefix: str = ""):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("IMAGE_STORE_BACKEND=s3 requires the boto3 package to be installed") from None
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            aws_access_key_id=settings.S3_ACCESS_KEY_ID or None,
+            aws_secret_access_key=settings.S3_SECRET_ACCESS_KEY or None,
+        )
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def _write(self, key: str, data: bytes, content_type: str) -> None:
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return
+        except ClientError:
+            pass
+        self.client.put_object(Bucket=self.bucket, Key=self._object_key(key), Body=data, ContentType=content_type)
+
+    def _read(self, key: str) -> bytes:
+        response = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))
+        return response["Body"].read()
+
+    async def put(self, data: bytes, content_type: str = "image/jpeg") -> str:
+        key = self.make_key(data)
+        await asyncio.to_thread(self._write, key, data, content_type)
+        return key
+
+    async def get(self, key: str) -> bytes:
+        return await asyncio.to_thread(self._read, key)
+
+_store: Optional[ImageStore] = None
+
+def get_image_store() -> ImageStore:
+    """
+    Returns the process-wide image store configured by IMAGE_STORE_BACKEND.
+    """
+    global _store
+    if _store is None:
+        if settings.IMAGE_STORE_BACKEND == "s3":
+            _store = S3ImageStore(
+                bucket=settings.S3_BUCKET,
+                endpoint_url=settings.S3_ENDPOINT_URL,
+                region=settings.S3_REGION,
+                prefix=settings.S3_PREFIX,
+            )
+        elif settings.IMAGE_STORE_BACKEND == "local":
+            _store = LocalImageStore(settings.IMAGE_STORE_LOCAL_DIR)
+        else:
+            raise ValueError(f"Unknown IMAGE_STORE_BACKEND: {settings.IMAGE_STORE_BACKEND}")
+    return _store
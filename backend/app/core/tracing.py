@@ -0,0 +1,110 @@
+"""
+OpenTelemetry tracing. Spans are created through the opentelemetry-api and
+are no-ops until init_tracing installs an SDK tracer provider from
+opentelemetry-sdk (and opentelemetry-exporter-otlp-proto-http for "otlp").
+
+TRACING_EXPORTER selects where spans go:
+- "otlp": an OTLP/HTTP collector (TRACING_OTLP_ENDPOINT, e.g. a local Jaeger)
+- "file": JSON lines in TRACING_FILE_PATH, for offline analysis
+- "console": stdout
+"""
+import functools
+from contextlib import contextmanager
+from typing import Dict, Optional
+from opentelemetry import context, propagate, trace
+
+from .config import settings
+
+tracer = trace.get_tracer("snapfeedback")
+
+_provider = None
+
+def init_tracing(service_name: str) -> None:
+    """
+    Installs a tracer provider exporting to TRACING_EXPORTER; does nothing if it is unset.
+    """
+    global _provider
+    if not settings.TRACING_EXPORTER or _provider is not None:
+        return
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    except ImportError:
+        raise RuntimeError("TRACING_EXPORTER requires the opentelemetry-sdk package to be installed") from None
+
+    if settings.TRACING_EXPORTER == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            raise RuntimeError("TRACING_EXPORTER=otlp requires the opentelemetry-exporter-otlp-proto-http package") from None
+        exporter = OTLPSpanExporter(endpoint=settings.TRACING_OTLP_ENDPOINT or None)
+    elif settings.TRACING_EXPORTER == "file":
+        exporter = ConsoleSpanExporter(
+            out=open(settings.TRACING_FILE_PATH, "a"),
+            formatter=lambda span: span.to_json(indent=None) + "\n",
+        )
+    elif settings.TRACING_EXPORTER == "console":
+        exporter = ConsoleSpanExporter()
+    else:
+        raise ValueError(f"Unknown TRACING_EXPORTER: {settings.TRACING_EXPORTER}")
+
+    _provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(_provider)
+    print(f"Tracing enabled ({settings.TRACING_EXPORTER})")
+
+def shutdown_tracing() -> None:
+    """
+    Flushes the spans that are still buffered.
+    """
+    if _provider is not None:
+        _provider.shutdown()
+
+def span(name: str, attributes: Optional[Dict] = None, **kwargs):
+    """
+    Starts a span as the current span: `with tracing.span("image_write"): ...`
+    """
+    return tracer.start_as_current_span(name, attributes=attributes, **kwargs)
+
+def traced(func):
+    """
+    Decorator running an async function in a span named after its module and
+    function, e.g. "crud.create_submission".
+    """
+    name = f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with tracer.start_as_current_span(name):
+            return await func(*args, **kwargs)
+    return wrapper
+
+def set_attributes(attributes: Dict) -> None:
+    """
+    Adds attributes to the current span.
+    """
+    trace.get_current_span().set_attributes({k: v for k, v in attributes.items() if v is not None})
+
+def inject_context() -> Dict[str, str]:
+    """
+    The current trace context as W3C headers (traceparent), for storing in a job.
+    """
+    carrier: Dict[str, str] = {}
+    propagate.inject(carrier)
+    return carrier
+
+@contextmanager
+def linked_span(name: str, carrier: Optional[Dict[str, str]], attributes: Optional[Dict] = None):
+    """
+    Starts a new trace linked to the span whose context was stored in carrier,
+    e.g. a background job linked to the request that queued it.
+    """
+    links = []
+    if carrier:
+        span_context = trace.get_current_span(propagate.extract(carrier)).get_span_context()
+        if span_context.is_valid:
+            links.append(trace.Link(span_context))
+    # An empty context makes the job the root of its own trace
+    with tracer.start_as_current_span(name, context=context.Context(), links=links, attributes=attributes) as job_span:
+        yield job_span
@@ -1,39 +1,130 @@
-from pymongo.database import Database
-from typing import Optional, Dict, List
+import time
+from collections import OrderedDict
+from pymongo import DESCENDING, ReturnDocument
+from pymongo.asynchronous.database import AsyncDatabase
+from typing import Optional, Dict, List, Tuple
 from bson import ObjectId
 from datetime import datetime
 
+from .core import metrics, notifications, tracing
+from .core.config import settings
+
 SUBMISSION_COLLECTION = "submissions"
 IMPROVEMENT_SUGGESTIONS_COLLECTION = "improvement_suggestions"
+BATCH_JOB_COLLECTION = "batch_jobs"
 
-def create_submission(db: Database, *, submission_data: dict) -> Dict:
+class DocumentCache:
+    """
+    In-process read-through cache of the documents clients poll, by collection
+    and submission id; a missing document is cached as None. Writes through
+    this module replace or drop their entries. Writes from other processes
+    (the worker, other API workers) show once an entry is older than ttl_seconds.
+    Cached documents are shared, so callers must not modify them.
+    """
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[Tuple[str, str], Tuple[float, Optional[Dict]]]" = OrderedDict()
+
+    def get(self, collection: str, submission_id: str) -> Tuple[bool, Optional[Dict]]:
+        """
+        Returns (True, document) on a hit and (False, None) on a miss.
+        """
+        entry = self.entries.get((collection, submission_id))
+        if entry is None or entry[0] < time.monotonic():
+            metrics.READ_CACHE_LOOKUPS.labels(collection, "miss").inc()
+            return False, None
+        self.entries.move_to_end((collection, submission_id))
+        metrics.READ_CACHE_LOOKUPS.labels(collection, "hit").inc()
+        return True, entry[1]
+
+    def set(self, collection: str, submission_id: str, document: Optional[Dict]) -> None:
+        if not self.ttl_seconds:
+            return
+        self.entries[(collection, submission_id)] = (time.monotonic() + self.ttl_seconds, document)
+        self.entries.move_to_end((collection, submission_id))
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def discard(self, collection: str, submission_id: str) -> None:
+        self.entries.pop((collection, submission_id), None)
+
+document_cache = DocumentCache(
+    max_entries=settings.READ_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.READ_CACHE_TTL_SECONDS,
+)
+
+# Query filters, shared with the query-plan checks in app.indexes
+def submission_query(submission_id: str) -> Dict:
+    return {"_id": ObjectId(submission_id)}
+
+def suggestions_query(submission_id: str) -> Dict:
+    return {"submission_id": ObjectId(submission_id)}
+
+def image_hash_query(bands: List[str], activity_description: Optional[str]) -> Dict:
+    return {"activity_description": activity_description, "image_hash_bands": {"$in": bands}, "status": "evaluated"}
+
+# Most recent candidates first
+IMAGE_HASH_SORT = [("_id", DESCENDING)]
+
+@tracing.traced
+@metrics.timed("mongo_insert")
+async def create_submission(db: AsyncDatabase, *, submission_data: dict) -> Dict:
     """
     Inserts a new submission record into the database.
     """
     submission_data['created_at'] = datetime.utcnow()
     submission_data['updated_at'] = datetime.utcnow()
-    result = db[SUBMISSION_COLLECTION].insert_one(submission_data)
-    inserted_doc = db[SUBMISSION_COLLECTION].find_one({"_id": result.inserted_id})
-    return inserted_doc
+    # insert_one sets '_id' on the document, so it is returned as stored
+    await db[SUBMISSION_COLLECTION].insert_one(submission_data)
+    return submission_data
 
-def create_submission_multi(db: Database, *, submission_data: dict) -> Dict:
+@tracing.traced
+@metrics.timed("mongo_insert")
+async def create_submission_multi(db: AsyncDatabase, *, submission_data: dict) -> Dict:
     """
     Inserts a new submission record with multiple images into the database.
     """
     submission_data['created_at'] = datetime.utcnow()
     submission_data['updated_at'] = datetime.utcnow()
-    result = db[SUBMISSION_COLLECTION].insert_one(submission_data)
-    inserted_doc = db[SUBMISSION_COLLECTION].find_one({"_id": result.inserted_id})
-    return inserted_doc
+    await db[SUBMISSION_COLLECTION].insert_one(submission_data)
+    return submission_data
 
-def get_submission(db: Database, *, submission_id: str) -> Optional[Dict]:
+@tracing.traced
+@metrics.timed("mongo_find")
+async def get_submission(db: AsyncDatabase, *, submission_id: str, use_cache: bool = False) -> Optional[Dict]:
     """
-    Retrieves a submission by its ID.
+    Retrieves a submission by its ID. With use_cache=True it may come from
+    document_cache, for endpoints that clients poll.
     """
-    return db[SUBMISSION_COLLECTION].find_one({"_id": ObjectId(submission_id)})
+    if use_cache:
+        found, document = document_cache.get(SUBMISSION_COLLECTION, submission_id)
+        if found:
+            return document
+    document = await db[SUBMISSION_COLLECTION].find_one(submission_query(submission_id))
+    document_cache.set(SUBMISSION_COLLECTION, submission_id, document)
+    return document
 
-def update_submission_feedback(
-    db: Database, *, submission_id: str, feedback_type: str, feedback_data: List[dict]
+@tracing.traced
+@metrics.timed("mongo_find")
+async def find_submissions_by_image_hash(
+    db: AsyncDatabase, *, bands: List[str], activity_description: Optional[str], limit: int
+) -> List[Dict]:
+    """
+    The most recent evaluated submissions with the same activity description
+    that share a perceptual hash band with the given image sets (see app.reuse).
+    Only their hashes and feedback are read.
+    """
+    cursor = db[SUBMISSION_COLLECTION].find(
+        image_hash_query(bands, activity_description),
+        {"playground_image_hashes": 1, "toy_image_hashes": 1, "playground_feedback": 1, "toy_feedback": 1},
+    ).sort(IMAGE_HASH_SORT).limit(limit)
+    return await cursor.to_list(length=limit)
+
+@tracing.traced
+@metrics.timed("mongo_update")
+async def update_submission_feedback(
+    db: AsyncDatabase, *, submission_id: str, feedback_type: str, feedback_data: List[dict]
 ) -> Optional[Dict]:
     """
     Updates a submission with feedback for either the playground or the toy.
@@ -49,35 +140,99 @@ def update_submission_feedback(
         }
     }
     
-    update_result = db[SUBMISSION_COLLECTION].update_one(
-        {"_id": ObjectId(submission_id)},
-        update_data
+    document = await db[SUBMISSION_COLLECTION].find_one_and_update(
+        submission_query(submission_id),
+        update_data,
+        return_document=ReturnDocument.AFTER
     )
-    
-    if update_result.modified_count == 1:
-        return db[SUBMISSION_COLLECTION].find_one({"_id": ObjectId(submission_id)})
-    
-    return None
+    document_cache.set(SUBMISSION_COLLECTION, submission_id, document)
+    return document
 
-def create_improvement_suggestions(db: Database, *, submission_id: str, suggestions_data: dict) -> Dict:
+@tracing.traced
+@metrics.timed("mongo_update")
+async def update_submission_evaluation(
+    db: AsyncDatabase,
+    *,
+    submission_id: str,
+    playground_feedback: Optional[Dict],
+    toy_feedback: Optional[Dict],
+    status: str
+) -> Optional[Dict]:
+    """
+    Stores playground and toy feedback together with the evaluation status
+    in a single round trip. Feedback passed as None is left unchanged.
+    """
+    fields = {"status": status, "updated_at": datetime.utcnow()}
+    if playground_feedback is not None:
+        fields["playground_feedback"] = playground_feedback
+    if toy_feedback is not None:
+        fields["toy_feedback"] = toy_feedback
+
+    document = await db[SUBMISSION_COLLECTION].find_one_and_update(
+        submission_query(submission_id),
+        {"$set": fields},
+        return_document=ReturnDocument.AFTER
+    )
+    document_cache.set(SUBMISSION_COLLECTION, submission_id, document)
+    return document
+
+@tracing.traced
+@metrics.timed("mongo_update")
+async def update_submission_status(
+    db: AsyncDatabase, *, submission_id: str, status: str, unless_status: Optional[List[str]] = None
+) -> Optional[Dict]:
+    """
+    Sets the evaluation status of a submission
+    ('pending', 'evaluating', 'evaluated' or 'failed'), unless its current
+    status is one of unless_status. Returns None if nothing was updated.
+    """
+    query = submission_query(submission_id)
+    if unless_status:
+        query["status"] = {"$nin": unless_status}
+    document = await db[SUBMISSION_COLLECTION].find_one_and_update(
+        query,
+        {"$set": {"status": status, "updated_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+    if document is None and unless_status:
+        # The submission may exist with a status that was left alone
+        document_cache.discard(SUBMISSION_COLLECTION, submission_id)
+    else:
+        document_cache.set(SUBMISSION_COLLECTION, submission_id, document)
+    return document
+
+@tracing.traced
+@metrics.timed("mongo_insert")
+async def create_improvement_suggestions(db: AsyncDatabase, *, submission_id: str, suggestions_data: dict) -> Dict:
     """
     Inserts improvement suggestions for a submission into the database.
     """
     suggestions_data['submission_id'] = ObjectId(submission_id)
     suggestions_data['created_at'] = datetime.utcnow()
     suggestions_data['updated_at'] = datetime.utcnow()
-    result = db[IMPROVEMENT_SUGGESTIONS_COLLECTION].insert_one(suggestions_data)
-    inserted_doc = db[IMPROVEMENT_SUGGESTIONS_COLLECTION].find_one({"_id": result.inserted_id})
-    return inserted_doc
+    await db[IMPROVEMENT_SUGGESTIONS_COLLECTION].insert_one(suggestions_data)
+    document_cache.discard(IMPROVEMENT_SUGGESTIONS_COLLECTION, submission_id)
+    notifications.bus.publish(f"{IMPROVEMENT_SUGGESTIONS_COLLECTION}:{submission_id}")
+    return suggestions_data
 
-def get_improvement_suggestions(db: Database, *, submission_id: str) -> Optional[Dict]:
+@tracing.traced
+@metrics.timed("mongo_find")
+async def get_improvement_suggestions(db: AsyncDatabase, *, submission_id: str, use_cache: bool = False) -> Optional[Dict]:
     """
-    Retrieves improvement suggestions by submission ID.
+    Retrieves improvement suggestions by submission ID, from document_cache with use_cache=True.
     """
-    return db[IMPROVEMENT_SUGGESTIONS_COLLECTION].find_one({"submission_id": ObjectId(submission_id)})
+    if use_cache:
+        found, document = document_cache.get(IMPROVEMENT_SUGGESTIONS_COLLECTION, submission_id)
+        if found:
+            return document
+    document = await db[IMPROVEMENT_SUGGESTIONS_COLLECTION].find_one(suggestions_query(submission_id))
+    document_cache.set(IMPROVEMENT_SUGGESTIONS_COLLECTION, submission_id, document)
+    return document
 
-def update_improvement_suggestions(
-    db: Database, *, submission_id: str, suggestions_data: dict
+@tracing.traced
+@metrics.timed("mongo_update")
+async def update_improvement_suggestions(
+    db: AsyncDatabase, *, submission_id: str, suggestions_data: dict
 ) -> Optional[Dict]:
     """
     Updates improvement suggestions for a submission.
@@ -86,16 +241,49 @@ def update_improvement_suggestions(
         "$set": {
             **suggestions_data,
             "updated_at": datetime.utcnow()
+        },
+        "$setOnInsert": {
+            "created_at": datetime.utcnow()
         }
     }
     
-    update_result = db[IMPROVEMENT_SUGGESTIONS_COLLECTION].update_one(
-        {"submission_id": ObjectId(submission_id)},
+    document = await db[IMPROVEMENT_SUGGESTIONS_COLLECTION].find_one_and_update(
+        suggestions_query(submission_id),
         update_data,
-        upsert=True
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    document_cache.set(IMPROVEMENT_SUGGESTIONS_COLLECTION, submission_id, document)
+    notifications.bus.publish(f"{IMPROVEMENT_SUGGESTIONS_COLLECTION}:{submission_id}")
+    return document
+
+@tracing.traced
+@metrics.timed("mongo_insert")
+async def create_batch_job(db: AsyncDatabase, *, batch_data: dict) -> Dict:
+    """
+    Records a batch evaluation submitted to the OpenAI Batch API.
+    """
+    batch_data['created_at'] = datetime.utcnow()
+    batch_data['updated_at'] = datetime.utcnow()
+    await db[BATCH_JOB_COLLECTION].insert_one(batch_data)
+    return batch_data
+
+@tracing.traced
+@metrics.timed("mongo_find")
+async def get_batch_job(db: AsyncDatabase, *, batch_job_id: str) -> Optional[Dict]:
+    """
+    Retrieves a batch evaluation by its ID.
+    """
+    return await db[BATCH_JOB_COLLECTION].find_one({"_id": ObjectId(batch_job_id)})
+
+@tracing.traced
+@metrics.timed("mongo_update")
+async def update_batch_job(db: AsyncDatabase, *, batch_job_id: str, fields: dict) -> Optional[Dict]:
+    """
+    Updates the progress of a batch evaluation.
+    """
+    return await db[BATCH_JOB_COLLECTION].find_one_and_update(
+        {"_id": ObjectId(batch_job_id)},
+        {"$set": {**fields, "updated_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
     )
-    
-    if update_result.modified_count >= 0:  # Modified or upserted
-        return db[IMPROVEMENT_SUGGESTIONS_COLLECTION].find_one({"submission_id": ObjectId(submission_id)})
-    
-    return None 
\ No newline at end of file
@@ -1,16 +1,39 @@
-from pymongo import MongoClient
+from typing import Optional
+from pymongo import AsyncMongoClient
+from pymongo.asynchronous.database import AsyncDatabase
 from .core.config import settings
 
-# Create a single, reusable MongoClient instance
-# It's recommended to have one MongoClient per process.
-client = MongoClient(settings.MONGO_URI)
+# A single, reusable client per process. It owns the connection pool and is
+# bound to the event loop it is first used on, so it is created on startup.
+client: Optional[AsyncMongoClient] = None
 
-# This will get the database name from your MONGO_URI
-# e.g., 'design_feedback_db'
-db =client["snapfeedback"]
+def connect_to_mongo() -> AsyncMongoClient:
+    """
+    Creates the process-wide MongoDB client if it does not exist yet.
+    Connections are opened lazily and pooled up to MONGO_MAX_POOL_SIZE.
+    """
+    global client
+    if client is None:
+        client = AsyncMongoClient(
+            settings.MONGO_URI,
+            maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+            minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=settings.MONGO_MAX_IDLE_TIME_MS,
+            waitQueueTimeoutMS=settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            connectTimeoutMS=settings.MONGO_CONNECT_TIMEOUT_MS,
+            serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            socketTimeoutMS=settings.MONGO_SOCKET_TIMEOUT_MS,
+        )
+    return client
+
+async def close_mongo_connection() -> None:
+    global client
+    if client is not None:
+        await client.close()
+        client = None
 
-def get_db():
+def get_db() -> AsyncDatabase:
     """
     Dependency function to get the database instance.
     """
-    return db 
\ No newline at end of file
+    return connect_to_mongo()[settings.MONGO_DB_NAME]
@@ -0,0 +1,94 @@
+"""
+Fused evaluation mode: each image set is evaluated and given improvement
+suggestions in a single model call, instead of an evaluation call followed
+by a suggestions call that sends the same images again.
+"""
+import asyncio
+from typing import Dict, List, Optional, Tuple
+from pymongo.asynchronous.database import AsyncDatabase
+
+from . import crud, schemas
+from .core import ai_models
+from .core.config import settings
+
+STANDARD_MODE = "standard"
+FUSED_MODE = "fused"
+
+def validate_fused(result: Dict) -> Dict:
+    """
+    Validates the evaluation of a fused answer. Its suggestions are validated
+    separately, since the evaluation is still usable without them.
+    """
+    return {**result, "evaluation": schemas.validate_feedback(result["evaluation"])}
+
+async def run_fused_evaluation(
+    db: AsyncDatabase,
+    *,
+    submission_id: str,
+    playground_images_base64: Optional[List[str]],
+    toy_images_base64: Optional[List[str]],
+    activity_description: Optional[str],
+    status_if_failed: str = "failed",
+    require_all: bool = False
+) -> Tuple[Optional[Dict], List[Exception]]:
+    """
+    Evaluates both image sets in fused mode and stores the feedback and the
+    improvement suggestions that validate. An image set passed as None already
+    has feedback stored (by an earlier attempt) and is skipped. The submission
+    is 'evaluated' if any feedback is stored, otherwise it gets status_if_failed.
+    With require_all, as for single-image submissions, it gets status_if_failed
+    unless every set was evaluated.
+    Returns the updated submission and the errors of the calls that failed.
+    """
+    prompts = {"playground": settings.AI_PLAYGROUND_PROMPT, "toy": settings.AI_TOY_PROMPT}
+    image_sets = {"playground": playground_images_base64, "toy": toy_images_base64}
+    kinds = [kind for kind, images_base64 in image_sets.items() if images_base64 is not None]
+    results = await asyncio.gather(
+        *[
+            ai_models.get_fused_feedback(
+                images_data_base64=image_sets[kind],
+                text_description=activity_description,
+                evaluation_prompt=prompts[kind],
+                suggestions_prompt=settings.AI_IMPROVEMENT_SUGGESTIONS_PROMPT,
+                model_name=settings.OPENAI_MODEL,
+                validate=validate_fused
+            )
+            for kind in kinds
+        ],
+        return_exceptions=True,
+    )
+
+    feedback = {}
+    suggestions = {}
+    errors = []
+    for kind, result in zip(kinds, results):
+        if isinstance(result, Exception):
+            print(f"Fused {kind} evaluation error: {result}")
+            errors.append(result)
+            continue
+        feedback[kind] = result["evaluation"]
+        try:
+            suggestions[f"{kind}_suggestions"] = schemas.CRITERIA_SUGGESTIONS.validate_python(result.get("improvement_suggestions"))
+        except Exception as e:
+            # The evaluation is still usable without suggestions
+            print(f"Fused {kind} suggestions error: {e}")
+
+    if require_all:
+        evaluated = not errors
+    else:
+        evaluated = bool(feedback) or len(kinds) < len(image_sets)
+    updated_submission = await crud.update_submission_evaluation(
+        db,
+        submission_id=submission_id,
+        playground_feedback=feedback.get("playground"),
+        toy_feedback=feedback.get("toy"),
+        status="evaluated" if evaluated else status_if_failed
+    )
+    if suggestions:
+        validated_suggestions = schemas.ImprovementSuggestions(**suggestions)
+        await crud.update_improvement_suggestions(
+            db,
+            submission_id=submission_id,
+            suggestions_data=validated_suggestions.model_dump(exclude_none=True)
+        )
+    return updated_submission, errors
@@ -0,0 +1,190 @@
+"""
+Idempotent submissions. A submission is keyed by its Idempotency-Key header
+or, without one, by a digest of its normalized images, description and
+options. The first request with a key evaluates it; duplicates that arrive
+while it runs wait for it and all later ones get its stored response, so a
+client retrying after a timeout never creates a second submission.
+
+Keys live in a Mongo collection whose documents expire through a TTL index,
+so duplicates are found across API workers. Within a process, duplicates
+wait on the running request directly instead of polling the collection.
+"""
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from fastapi.responses import Response
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.errors import DuplicateKeyError
+
+from .core import metrics, tracing
+from .core.config import settings
+
+IDEMPOTENCY_COLLECTION = "idempotency_keys"
+MAX_KEY_LENGTH = 255
+
+# Stored responses of the requests this process is running, by key
+_in_flight: Dict[str, asyncio.Future] = {}
+
+def payload_fingerprint(
+    scope: str,
+    images: List[bytes],
+    activity_description: Optional[str],
+    async_mode: bool,
+    evaluation_mode: str
+) -> str:
+    """
+    Digest of everything that determines a submission's response.
+    """
+    digest = hashlib.sha256()
+    for part in (scope, activity_description or "", str(async_mode), evaluation_mode, str(len(images))):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    for image_data in images:
+        digest.update(hashlib.sha256(image_data).digest())
+    return digest.hexdigest()
+
+def request_key(scope: str, idempotency_key: Optional[str], fingerprint: str) -> Tuple[Optional[str], int]:
+    """
+    The key a request is stored under and how long it is kept, or (None, 0)
+    when the request isn't deduplicated. Without an Idempotency-Key header,
+    identical payloads are only treated as retries for IDEMPOTENCY_PAYLOAD_TTL_SECONDS.
+    """
+    if not settings.IDEMPOTENCY_ENABLED:
+        return None, 0
+    if idempotency_key:
+        if len(idempotency_key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"Idempotency-Key exceeds maximum length of {MAX_KEY_LENGTH} characters.")
+        return f"key:{scope}:{idempotency_key}", settings.IDEMPOTENCY_KEY_TTL_SECONDS
+    if settings.IDEMPOTENCY_PAYLOAD_TTL_SECONDS:
+        return f"payload:{fingerprint}", settings.IDEMPOTENCY_PAYLOAD_TTL_SECONDS
+    return None, 0
+
+def takeover_query(key: str, now: datetime) -> Dict:
+    """
+    A key whose holder's lock has expired, or whose record has expired but
+    not been removed yet.
+    """
+    return {"_id": key, "$or": [
+        {"status": "in_progress", "locked_until": {"$lt": now}},
+        {"expires_at": {"$lte": now}},
+    ]}
+
+def in_progress_query(key: str) -> Dict:
+    return {"_id": key, "status": "in_progress"}
+
+@tracing.traced
+@metrics.timed("mongo_idempotency_claim")
+async def claim_key(db: AsyncDatabase, *, key: str, fingerprint: str, ttl_seconds: int) -> Optional[Dict]:
+    """
+    Claims a key for the calling request. Returns None once it is claimed,
+    otherwise the record of the request holding it. A key whose holder's lock
+    has expired (its process died), or whose record has expired but not been
+    removed yet, is taken over.
+    """
+    now = datetime.utcnow()
+    record = {
+        "fingerprint": fingerprint,
+        "status": "in_progress",
+        "response": None,
+        "locked_until": now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS),
+        "created_at": now,
+        "expires_at": now + timedelta(seconds=ttl_seconds),
+    }
+    collection = db[IDEMPOTENCY_COLLECTION]
+    try:
+        await collection.insert_one({"_id": key, **record})
+        return None
+    except DuplicateKeyError:
+        pass
+    taken_over = await collection.find_one_and_replace(takeover_query(key, now), record)
+    if taken_over is not None:
+        return None
+    existing = await collection.find_one({"_id": key})
+    # Released by a failed request in the meantime: claim it on the next attempt
+    return existing or {"_id": key, "fingerprint": fingerprint, "status": "released"}
+
+@tracing.traced
+@metrics.timed("mongo_idempotency_update")
+async def complete_key(db: AsyncDatabase, *, key: str, response: Dict) -> None:
+    await db[IDEMPOTENCY_COLLECTION].update_one(
+        {"_id": key},
+        {"$set": {"status": "completed", "response": response, "locked_until": None}},
+    )
+
+@tracing.traced
+@metrics.timed("mongo_idempotency_update")
+async def release_key(db: AsyncDatabase, *, key: str) -> None:
+    """
+    Forgets a key whose request failed, so a retry evaluates the submission again.
+    """
+    await db[IDEMPOTENCY_COLLECTION].delete_one(in_progress_query(key))
+
+def replay(stored: Dict) -> Response:
+    return Response(
+        content=stored["body"],
+        status_code=stored["status_code"],
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+async def run_once(
+    db: AsyncDatabase,
+    *,
+    key: Optional[str],
+    fingerprint: str,
+    ttl_seconds: int,
+    handler: Callable[[], Awaitable[Response]]
+) -> Response:
+    """
+    Runs handler once per key and answers duplicates with its response.
+    Duplicates wait up to IDEMPOTENCY_LOCK_SECONDS for the running request,
+    then get a 409 and should retry later.
+    """
+    if key is None:
+        return await handler()
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.IDEMPOTENCY_LOCK_SECONDS
+    while True:
+        if key in _in_flight:
+            stored = await asyncio.shield(_in_flight[key])
+            if stored is not None:
+                metrics.IDEMPOTENT_REQUESTS.labels("joined").inc()
+                return replay(stored)
+            continue
+
+        record = await claim_key(db, key=key, fingerprint=fingerprint, ttl_seconds=ttl_seconds)
+        if record is None:
+            break
+        if record["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different submission.")
+        if record["status"] == "completed":
+            metrics.IDEMPOTENT_REQUESTS.labels("replayed").inc()
+            return replay(record["response"])
+        if loop.time() >= deadline:
+            raise HTTPException(
+                status_code=409,
+                detail="An identical submission is still being processed, please try again shortly.",
+                headers={"Retry-After": str(int(settings.IDEMPOTENCY_POLL_INTERVAL_SECONDS) + 1)},
+            )
+        # Another worker is running it
+        await asyncio.sleep(settings.IDEMPOTENCY_POLL_INTERVAL_SECONDS)
+
+    metrics.IDEMPOTENT_REQUESTS.labels("new").inc()
+    future = loop.create_future()
+    _in_flight[key] = future
+    stored = None
+    try:
+        response = await handler()
+        if 200 <= response.status_code < 300:
+            stored = {"status_code": response.status_code, "body": bytes(response.body)}
+            await complete_key(db, key=key, response=stored)
+        return response
+    finally:
+        del _in_flight[key]
+        # Waiting duplicates get the response, or claim the key again if the request failed
+        future.set_result(stored)
+        if stored is None:
+            await release_key(db, key=key)
@@ -0,0 +1,224 @@
+"""
+Index management and query-plan checks for the collections the app queries.
+
+Indexes are created on API and worker startup. To verify that every query the
+app issues is served by an index (e.g. in CI against a scratch database), run:
+
+    python -m app.indexes check
+
+It exits with a nonzero status if any query plan contains a collection scan.
+`python -m app.indexes ensure` only creates the indexes.
+
+Changing DATA_RETENTION_DAYS takes effect the next time the indexes are
+ensured: the expiry of the created_at TTL indexes is updated in place, and
+the TTL is removed when retention is turned off.
+"""
+import sys
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.errors import OperationFailure, PyMongoError
+
+from . import crud, idempotency, jobs
+from .core import ai_models
+from .core.config import settings
+
+CREATED_AT_KEY = [("created_at", ASCENDING)]
+CREATED_AT_INDEX = "created_at_1"
+# Non-TTL variant created by earlier releases, superseded by CREATED_AT_INDEX
+LEGACY_CREATED_AT_INDEX = "created_at_-1"
+# Collections whose documents expire after DATA_RETENTION_DAYS
+RETENTION_COLLECTIONS = [crud.SUBMISSION_COLLECTION, crud.IMPROVEMENT_SUGGESTIONS_COLLECTION]
+
+# Code of the error returned when dropping an index that doesn't exist
+INDEX_NOT_FOUND = 27
+
+class IndexConflictError(Exception):
+    """
+    Raised when an index can't be created, e.g. because of duplicate
+    submission_ids or an existing index with the same name and other options.
+    """
+
+def retention_seconds() -> Optional[int]:
+    if settings.DATA_RETENTION_DAYS:
+        return settings.DATA_RETENTION_DAYS * 24 * 60 * 60
+    return None
+
+def created_at_index() -> IndexModel:
+    """
+    Index for listing documents by creation time; doubles as a TTL index
+    when DATA_RETENTION_DAYS is set. The key is the same either way, so
+    sync_retention can switch an existing index in place.
+    """
+    seconds = retention_seconds()
+    if seconds:
+        return IndexModel(CREATED_AT_KEY, expireAfterSeconds=seconds)
+    return IndexModel(CREATED_AT_KEY)
+
+def collection_indexes() -> Dict[str, List[IndexModel]]:
+    return {
+        crud.SUBMISSION_COLLECTION: [
+            created_at_index(),
+            # Multikey index of perceptual hash bands, for reuse lookups
+            IndexModel([("activity_description", ASCENDING), ("image_hash_bands", ASCENDING)]),
+        ],
+        crud.IMPROVEMENT_SUGGESTIONS_COLLECTION: [
+            IndexModel([("submission_id", ASCENDING)], unique=True),
+            created_at_index(),
+        ],
+        jobs.JOB_COLLECTION: [
+            # One index per branch of the claim query's $or
+            IndexModel([("status", ASCENDING), ("run_at", ASCENDING)]),
+            IndexModel([("status", ASCENDING), ("lease_expires_at", ASCENDING)]),
+        ],
+        ai_models.AI_RESPONSE_CACHE_COLLECTION: [
+            IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+        ],
+        idempotency.IDEMPOTENCY_COLLECTION: [
+            IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+        ],
+    }
+
+async def drop_index(db: AsyncDatabase, collection_name: str, name: str) -> None:
+    try:
+        await db[collection_name].drop_index(name)
+    except OperationFailure as e:
+        # Already dropped by another process starting at the same time
+        if e.code != INDEX_NOT_FOUND:
+            raise
+
+async def sync_retention(db: AsyncDatabase, collection_name: str) -> None:
+    """
+    Brings an existing created_at index in line with DATA_RETENTION_DAYS.
+    A changed expiry is applied with collMod; with retention turned off the TTL
+    index is dropped, and create_indexes then recreates it without a TTL.
+    """
+    existing = await db[collection_name].index_information()
+    if LEGACY_CREATED_AT_INDEX in existing:
+        await drop_index(db, collection_name, LEGACY_CREATED_AT_INDEX)
+    if CREATED_AT_INDEX not in existing:
+        return
+
+    current = existing[CREATED_AT_INDEX].get("expireAfterSeconds")
+    wanted = retention_seconds()
+    if current == wanted:
+        return
+    if wanted is None:
+        print(f"Data retention is off, removing the TTL index on {collection_name}")
+        await drop_index(db, collection_name, CREATED_AT_INDEX)
+    else:
+        print(f"Expiring {collection_name} after {settings.DATA_RETENTION_DAYS} days")
+        await db.command({"collMod": collection_name, "index": {"name": CREATED_AT_INDEX, "expireAfterSeconds": wanted}})
+
+async def ensure_indexes(db: AsyncDatabase) -> None:
+    """
+    Creates any missing indexes and applies DATA_RETENTION_DAYS to the TTL
+    indexes. Raises IndexConflictError, once every collection has been tried,
+    if any of them could not be brought up to date.
+    """
+    conflicts = []
+    for collection_name, indexes in collection_indexes().items():
+        try:
+            if collection_name in RETENTION_COLLECTIONS:
+                await sync_retention(db, collection_name)
+            await db[collection_name].create_indexes(indexes)
+        except OperationFailure as e:
+            conflicts.append(f"{collection_name}: {e}")
+    if conflicts:
+        raise IndexConflictError("Could not create indexes on " + "; ".join(conflicts))
+
+def query_plan_checks() -> List[Tuple[str, str, dict, list]]:
+    """
+    The filter and sort of every query in crud.py and jobs.py, as
+    (description, collection, filter, sort). The filters come from the same
+    builders the queries use, with sample values.
+    """
+    submission_id = str(ObjectId())
+    now = datetime.utcnow()
+    job_types = [jobs.EVALUATE_SUBMISSION_JOB, jobs.IMPROVEMENT_SUGGESTIONS_JOB]
+    job = {"_id": ObjectId(), "worker_id": "check", "attempts": 1}
+    idempotency_key = "payload:" + "0" * 64
+    return [
+        ("crud.get_submission / update_submission_*", crud.SUBMISSION_COLLECTION,
+            crud.submission_query(submission_id), []),
+        ("crud.find_submissions_by_image_hash", crud.SUBMISSION_COLLECTION,
+            crud.image_hash_query(["playground:0:00", "toy:0:00"], "Benchmark"), crud.IMAGE_HASH_SORT),
+        ("crud.get_improvement_suggestions / update_improvement_suggestions", crud.IMPROVEMENT_SUGGESTIONS_COLLECTION,
+            crud.suggestions_query(submission_id), []),
+        ("jobs.claim_next_job", jobs.JOB_COLLECTION, jobs.claimable_query(now, job_types), jobs.CLAIM_SORT),
+        ("jobs.fail_expired_job", jobs.JOB_COLLECTION, jobs.expired_out_of_attempts_query(now, job_types), []),
+        ("jobs.get_job", jobs.JOB_COLLECTION, jobs.job_query(str(job["_id"])), []),
+        ("jobs.renew_lease / complete_job / reschedule_job / fail_job", jobs.JOB_COLLECTION, jobs.owned_by(job), []),
+        ("AIResponseCache.get", ai_models.AI_RESPONSE_CACHE_COLLECTION,
+            ai_models.AIResponseCache.lookup_query("0" * 64, now), []),
+        ("idempotency.claim_key", idempotency.IDEMPOTENCY_COLLECTION,
+            idempotency.takeover_query(idempotency_key, now), []),
+        ("idempotency.release_key", idempotency.IDEMPOTENCY_COLLECTION,
+            idempotency.in_progress_query(idempotency_key), []),
+    ]
+
+def plan_stages(plan: dict) -> List[str]:
+    """
+    Lists every stage name in an explain() plan tree.
+    """
+    stages = [plan["stage"]] if "stage" in plan else []
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += plan_stages(child)
+    # Sharded clusters report one winning plan per shard
+    for shard in plan.get("shards", []):
+        stages += plan_stages(shard["winningPlan"])
+    return stages
+
+async def check_query_plans(db: AsyncDatabase) -> List[str]:
+    """
+    Explains every app query and returns a description of each one whose
+    winning plan scans a whole collection. An empty list means all queries use indexes.
+    """
+    problems = []
+    for description, collection_name, query, sort in query_plan_checks():
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        stages = plan_stages((await cursor.explain())["queryPlanner"]["winningPlan"])
+        if "COLLSCAN" in stages:
+            problems.append(f"{description}: collection scan on {collection_name} ({' -> '.join(stages)})")
+    return problems
+
+async def main(command: str) -> int:
+    from .database import get_db, connect_to_mongo, close_mongo_connection
+
+    connect_to_mongo()
+    try:
+        db = get_db()
+        await ensure_indexes(db)
+        if command == "ensure":
+            print("Indexes are up to date")
+            return 0
+
+        problems = await check_query_plans(db)
+        for problem in problems:
+            print(problem)
+        if problems:
+            return 1
+        print(f"All {len(query_plan_checks())} queries use an index")
+        return 0
+    except IndexConflictError as e:
+        print(e)
+        return 1
+    except PyMongoError as e:
+        print(f"Index check failed: {e}")
+        return 2
+    finally:
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    if command not in ("ensure", "check"):
+        sys.exit("Usage: python -m app.indexes [ensure|check]")
+    sys.exit(asyncio.run(main(command)))
@@ -0,0 +1,196 @@
+from pymongo import ReturnDocument
+from pymongo.asynchronous.database import AsyncDatabase
+from typing import Optional, Dict, List
+from bson import ObjectId
+from datetime import datetime, timedelta
+import random
+
+from .core import metrics, tracing
+from .core.config import settings
+
+JOB_COLLECTION = "jobs"
+
+EVALUATE_SUBMISSION_JOB = "evaluate_submission"
+IMPROVEMENT_SUGGESTIONS_JOB = "improvement_suggestions"
+INGEST_BATCH_JOB = "ingest_batch"
+
+@tracing.traced
+@metrics.timed("mongo_enqueue_job")
+async def enqueue_job(
+    db: AsyncDatabase, *, job_type: str, payload: dict, max_attempts: Optional[int] = None, delay_seconds: float = 0
+) -> Dict:
+    """
+    Inserts a new queued job that any worker can claim once delay_seconds have passed.
+    The current trace context is stored with it so the job's trace links back to it.
+    """
+    now = datetime.utcnow()
+    job = {
+        "type": job_type,
+        "payload": payload,
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": max_attempts or settings.JOB_MAX_ATTEMPTS,
+        "run_at": now + timedelta(seconds=delay_seconds),
+        "lease_expires_at": None,
+        "worker_id": None,
+        "last_error": None,
+        "trace_context": tracing.inject_context(),
+        "created_at": now,
+        "updated_at": now,
+    }
+    await db[JOB_COLLECTION].insert_one(job)
+    return job
+
+# A job whose worker died mid-attempt is claimed again once its lease expires,
+# unless that attempt was its last
+EXPIRED_LEASE_HAS_ATTEMPTS_LEFT = {"$expr": {"$lt": ["$attempts", "$max_attempts"]}}
+EXPIRED_LEASE_OUT_OF_ATTEMPTS = {"$expr": {"$gte": ["$attempts", "$max_attempts"]}}
+
+def claimable_query(now: datetime, job_types: Optional[List[str]] = None) -> Dict:
+    """
+    Jobs that are queued and due, or whose worker's lease has expired while
+    they have attempts left.
+    """
+    query = {
+        "$or": [
+            {"status": "queued", "run_at": {"$lte": now}},
+            {"status": "running", "lease_expires_at": {"$lt": now}, **EXPIRED_LEASE_HAS_ATTEMPTS_LEFT},
+        ]
+    }
+    if job_types:
+        query["type"] = {"$in": job_types}
+    return query
+
+# Oldest due job first
+CLAIM_SORT = [("run_at", 1)]
+
+def expired_out_of_attempts_query(now: datetime, job_types: Optional[List[str]] = None) -> Dict:
+    query = {"status": "running", "lease_expires_at": {"$lt": now}, **EXPIRED_LEASE_OUT_OF_ATTEMPTS}
+    if job_types:
+        query["type"] = {"$in": job_types}
+    return query
+
+def job_query(job_id: str) -> Dict:
+    return {"_id": ObjectId(job_id)}
+
+def owned_by(job: Dict) -> Dict:
+    """
+    Filter matching a job only while the claim it was returned by still holds,
+    so a worker whose lease expired can't overwrite the new owner's state.
+    """
+    return {"_id": job["_id"], "status": "running", "worker_id": job["worker_id"], "attempts": job["attempts"]}
+
+async def claim_next_job(db: AsyncDatabase, *, worker_id: str, job_types: Optional[List[str]] = None) -> Optional[Dict]:
+    """
+    Atomically claims the oldest runnable job for a worker.
+    A job is runnable when it is queued and due, or when a previous worker's lease
+    has expired and the job has attempts left.
+    """
+    now = datetime.utcnow()
+    return await db[JOB_COLLECTION].find_one_and_update(
+        claimable_query(now, job_types),
+        {
+            "$set": {
+                "status": "running",
+                "worker_id": worker_id,
+                "lease_expires_at": now + timedelta(seconds=settings.JOB_LEASE_SECONDS),
+                "updated_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=CLAIM_SORT,
+        return_document=ReturnDocument.AFTER,
+    )
+
+async def fail_expired_job(db: AsyncDatabase, *, job_types: Optional[List[str]] = None) -> Optional[Dict]:
+    """
+    Marks one job whose lease expired on its last attempt as failed, e.g. one
+    that keeps crashing its worker, and returns it. None if there is no such job.
+    """
+    now = datetime.utcnow()
+    return await db[JOB_COLLECTION].find_one_and_update(
+        expired_out_of_attempts_query(now, job_types),
+        {"$set": {
+            "status": "failed",
+            "lease_expires_at": None,
+            "last_error": "Lease expired on the last attempt",
+            "updated_at": now,
+        }},
+        return_document=ReturnDocument.AFTER,
+    )
+
+async def renew_lease(db: AsyncDatabase, *, job: Dict) -> bool:
+    """
+    Extends the lease of a running job by JOB_LEASE_SECONDS.
+    Returns False if the job is no longer held by this claim.
+    """
+    now = datetime.utcnow()
+    result = await db[JOB_COLLECTION].update_one(
+        owned_by(job),
+        {"$set": {"lease_expires_at": now + timedelta(seconds=settings.JOB_LEASE_SECONDS), "updated_at": now}}
+    )
+    return result.matched_count == 1
+
+async def complete_job(db: AsyncDatabase, *, job: Dict) -> bool:
+    """
+    Marks a job as successfully completed.
+    Returns False if the job is no longer held by this claim.
+    """
+    result = await db[JOB_COLLECTION].update_one(
+        owned_by(job),
+        {"$set": {
+            "status": "completed",
+            "lease_expires_at": None,
+            "last_error": None,
+            "updated_at": datetime.utcnow(),
+        }}
+    )
+    return result.matched_count == 1
+
+async def reschedule_job(db: AsyncDatabase, *, job: Dict, delay_seconds: float) -> bool:
+    """
+    Queues a job that isn't done yet (e.g. polling a batch) to run again after
+    delay_seconds. The run doesn't count as an attempt, since nothing failed.
+    Returns False if the job is no longer held by this claim.
+    """
+    now = datetime.utcnow()
+    result = await db[JOB_COLLECTION].update_one(
+        owned_by(job),
+        {
+            "$set": {
+                "status": "queued",
+                "run_at": now + timedelta(seconds=delay_seconds),
+                "lease_expires_at": None,
+                "updated_at": now,
+            },
+            "$inc": {"attempts": -1},
+        }
+    )
+    return result.matched_count == 1
+
+async def fail_job(db: AsyncDatabase, *, job: Dict, error: str) -> Optional[str]:
+    """
+    Records a failed attempt. The job is re-queued with exponential backoff
+    until it runs out of attempts, after which it is marked as failed.
+    Returns the job's new status, or None if the job is no longer held by this claim.
+    """
+    now = datetime.utcnow()
+    if job["attempts"] < job["max_attempts"]:
+        delay = min(
+            settings.JOB_RETRY_BASE_SECONDS * (2 ** (job["attempts"] - 1)),
+            settings.JOB_RETRY_MAX_SECONDS,
+        )
+        delay += random.uniform(0, settings.JOB_RETRY_BASE_SECONDS)
+        update = {"status": "queued", "run_at": now + timedelta(seconds=delay)}
+    else:
+        update = {"status": "failed"}
+
+    update.update({"lease_expires_at": None, "last_error": error, "updated_at": now})
+    result = await db[JOB_COLLECTION].update_one(owned_by(job), {"$set": update})
+    return update["status"] if result.matched_count == 1 else None
+
+async def get_job(db: AsyncDatabase, *, job_id: str) -> Optional[Dict]:
+    """
+    Retrieves a job by its ID.
+    """
+    return await db[JOB_COLLECTION].find_one(job_query(job_id))
@@ -1,20 +1,20 @@
 import os
-import uuid
+import sys
 import base64
-from typing import Dict, List, Optional
-from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks
+from contextlib import asynccontextmanager
+from typing import Dict, List, Literal, Optional, Tuple, Union
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, File, Form, Request, UploadFile
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from pymongo.database import Database
-from pydantic import ValidationError, parse_obj_as
-from bson import ObjectId
-from datetime import datetime
+from pymongo.asynchronous.database import AsyncDatabase
+from pydantic import ValidationError
 
-from . import crud, schemas
-from .core import ai_models
+from . import crud, idempotency, jobs, reuse, schemas
+from .core import images, metrics, notifications, responses, storage, tracing
 import asyncio
 from .core.config import settings
-from .database import get_db
+from .database import get_db, connect_to_mongo, close_mongo_connection
 
 # Validate required environment variables
 if not settings.MONGO_URI:
@@ -22,10 +22,89 @@ if not settings.MONGO_URI:
 if not settings.OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY environment variable is required but not set")
 
-# Create uploads directory on startup
-os.makedirs("uploaded_images", exist_ok=True)
+# The modules built on the openai SDK (ai_models, evaluation, batch, indexes,
+# scheduler) take about as long to import as everything else together, so they
+# are imported where they are used and requests that don't call the model never load them.
 
-app = FastAPI(title="Design Feedback App")
+def load_ai_models():
+    """
+    Imports ai_models and backs its response cache with Mongo on first use.
+    """
+    from .core import ai_models
+    if ai_models.response_cache.collection is None:
+        ai_models.response_cache.attach(get_db()[ai_models.AI_RESPONSE_CACHE_COLLECTION])
+    return ai_models
+
+async def startup() -> None:
+    """
+    Creates the process-wide clients, image store and image pool, and the indexes.
+    With LAZY_STARTUP each is created by the first request that uses it instead,
+    and the indexes are left to `python -m app.indexes ensure` at deploy time.
+    """
+    from . import indexes
+    # One pooled AI client and one pooled MongoDB client per process, shared by all requests
+    load_ai_models().init_openai_client()
+    connect_to_mongo()
+    await indexes.ensure_indexes(get_db())
+    storage.get_image_store()
+    images.init_image_pool()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # FastAPI traces each request itself once a tracer provider is installed
+    tracing.init_tracing("snapfeedback-api")
+    metrics.remove_dead_processes()
+    if not settings.LAZY_STARTUP:
+        await startup()
+    yield
+    if "app.core.ai_models" in sys.modules:
+        await load_ai_models().close_openai_client()
+    await notifications.bus.close()
+    await close_mongo_connection()
+    images.shutdown_image_pool()
+    tracing.shutdown_tracing()
+    metrics.mark_process_dead(os.getpid())
+
+app = FastAPI(title="Design Feedback App", lifespan=lifespan)
+
+# Image parts each upload endpoint accepts at most
+UPLOAD_PATHS = {"/submit-design-upload": 2, "/submit-design-multi-upload": 6}
+# Room for multipart boundaries, part headers and the activity description
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects upload requests that exceed what their images may add up to
+    before the body is parsed and spooled: by Content-Length when it is sent,
+    otherwise once that many bytes of a chunked body have been received.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in UPLOAD_PATHS:
+            return await self.app(scope, receive, send)
+
+        limit = settings.MAX_UPLOAD_BYTES * UPLOAD_PATHS[scope["path"]] + UPLOAD_FORM_OVERHEAD_BYTES
+        detail = f"Upload exceeds maximum size of {limit} bytes."
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            return await JSONResponse(status_code=413, content={"detail": detail})(scope, receive, send)
+
+        received = 0
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised while the form is parsed, so FastAPI answers it like any HTTPException
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+app.add_middleware(UploadSizeLimitMiddleware)
 
 # CORS Middleware
 app.add_middleware(
@@ -36,316 +115,809 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount static files for development
-app.mount("/images", StaticFiles(directory="uploaded_images"), name="images")
-
-def convert_objectids(obj):
-    if isinstance(obj, dict):
-        return {k: convert_objectids(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_objectids(i) for i in obj]
-    elif isinstance(obj, ObjectId):
-        return str(obj)
-    elif isinstance(obj, datetime):
-        return obj.isoformat()
-    else:
-        return obj
-
-async def generate_improvement_suggestions_background(
-    submission_id: str,
-    playground_images_base64: List[str],
-    toy_images_base64: List[str],
-    activity_description: Optional[str],
-    playground_feedback: Dict,
-    toy_feedback: Dict,
-    db: Database
-):
+class ImageStaticFiles(StaticFiles):
     """
-    Background task to generate improvement suggestions after evaluation is complete.
+    Serves the local image store, which is created (with its directory) on the first request rather than at import.
     """
-    try:
-        # Generate playground improvement suggestions
-        playground_suggestions = None
-        if playground_feedback and playground_images_base64:
-            playground_suggestions = await ai_models.get_improvement_suggestions(
-                images_data_base64=playground_images_base64,
-                text_description=activity_description,
-                evaluation_results=playground_feedback,
-                prompt_base=settings.AI_IMPROVEMENT_SUGGESTIONS_PROMPT,
-                openai_api_key=settings.OPENAI_API_KEY,
-                model_name=settings.OPENAI_MODEL
-            )
-
-        # Generate toy improvement suggestions
-        toy_suggestions = None
-        if toy_feedback and toy_images_base64:
-            toy_suggestions = await ai_models.get_improvement_suggestions(
-                images_data_base64=toy_images_base64,
-                text_description=activity_description,
-                evaluation_results=toy_feedback,
-                prompt_base=settings.AI_IMPROVEMENT_SUGGESTIONS_PROMPT,
-                openai_api_key=settings.OPENAI_API_KEY,
-                model_name=settings.OPENAI_MODEL
-            )
-
-        # Store improvement suggestions in database
-        suggestions_data = {}
-        if playground_suggestions:
-            suggestions_data['playground_suggestions'] = playground_suggestions
-        if toy_suggestions:
-            suggestions_data['toy_suggestions'] = toy_suggestions
-
-        if suggestions_data:
-            crud.create_improvement_suggestions(
-                db, 
-                submission_id=submission_id, 
-                suggestions_data=suggestions_data
-            )
-            print(f"Successfully generated and stored improvement suggestions for submission {submission_id}")
-        else:
-            print(f"No improvement suggestions generated for submission {submission_id}")
-
-    except Exception as e:
-        print(f"Error generating improvement suggestions for submission {submission_id}: {e}")
+    async def check_config(self) -> None:
+        storage.get_image_store()
+        await super().check_config()
+
+# Serve stored images; local files are served directly as static files
+if settings.IMAGE_STORE_BACKEND == "local":
+    app.mount("/images", ImageStaticFiles(directory=settings.IMAGE_STORE_LOCAL_DIR, check_dir=False), name="images")
+else:
+    @app.get("/images/{key}", tags=["Images"])
+    async def get_image(key: str):
+        try:
+            image_data = await storage.get_image_store().get(key)
+        except Exception:
+            raise HTTPException(status_code=404, detail="Image not found")
+        return Response(content=image_data, media_type="image/jpeg", headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+def accepted_response(db_submission: dict) -> JSONResponse:
+    """
+    202 response for submissions evaluated asynchronously by the worker.
+    """
+    submission_id = str(db_submission["_id"])
+    return JSONResponse(status_code=202, content={
+        "_id": submission_id,
+        "status": db_submission["status"],
+        "feedback_url": f"/feedback/{submission_id}",
+        "events_url": f"/feedback/{submission_id}/events",
+    })
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {responses.dumps(data).decode()}\n\n"
+
+async def feedback_events(db: AsyncDatabase, submission_id: str):
+    """
+    Yields server-sent events as the evaluation of a submission progresses:
+    status changes, playground feedback, toy feedback and finally improvement
+    suggestions, or an error event if the submission is deleted meanwhile.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.SSE_MAX_DURATION_SECONDS
+    last_sent = loop.time()
+    last_status = None
+    sent = set()
+
+    while loop.time() < deadline:
+        db_submission = await crud.get_submission(db, submission_id=submission_id, use_cache=True)
+        if db_submission is None:
+            # Deleted, or expired through DATA_RETENTION_DAYS, while the client was listening
+            yield sse_event("error", {"detail": "Submission not found"})
+            return
+        # Submissions created before statuses were tracked are complete
+        status = db_submission.get("status", "evaluated")
+        events = []
+
+        if status != last_status:
+            events.append(sse_event("status", {"status": status}))
+            last_status = status
+
+        for feedback_type in ("playground_feedback", "toy_feedback"):
+            if feedback_type not in sent and db_submission.get(feedback_type):
+                events.append(sse_event(feedback_type, db_submission[feedback_type]))
+                sent.add(feedback_type)
+
+        db_suggestions = None
+        if status == "evaluated":
+            db_suggestions = await crud.get_improvement_suggestions(db, submission_id=submission_id, use_cache=True)
+            if db_suggestions:
+                events.append(sse_event(
+                    "improvement_suggestions",
+                    responses.model_content(db_suggestions, schemas.ImprovementSuggestionsResponse)
+                ))
+
+        for event in events:
+            yield event
+        if events:
+            last_sent = loop.time()
+        elif loop.time() - last_sent >= settings.SSE_KEEPALIVE_SECONDS:
+            yield ": keep-alive\n\n"
+            last_sent = loop.time()
+
+        if db_suggestions or status == "failed":
+            return
+        await asyncio.sleep(settings.SSE_POLL_INTERVAL_SECONDS)
+
+    yield sse_event("timeout", {"status": last_status})
 
 @app.get("/", tags=["Root"])
 async def read_root():
     return {"message": "Welcome to the Design Feedback API!"}
 
-@app.post("/submit-design", response_model=schemas.SubmissionResponse, tags=["Submissions"])
-async def submit_design(
-    submission: schemas.SubmissionCreate,
-    background_tasks: BackgroundTasks,
-    db: Database = Depends(get_db)
-):
-    if submission.activity_description and len(submission.activity_description) > settings.MAX_ACTIVITY_DESCRIPTION_LENGTH:
+def validate_activity_description(activity_description: Optional[str]) -> None:
+    if activity_description and len(activity_description) > settings.MAX_ACTIVITY_DESCRIPTION_LENGTH:
         raise HTTPException(
             status_code=400,
             detail=f"Activity description exceeds maximum length of {settings.MAX_ACTIVITY_DESCRIPTION_LENGTH} characters."
         )
 
-    # Save images and get URLs
+async def normalize_uploads(uploads: List[UploadFile]) -> List[bytes]:
+    """
+    Normalizes uploaded images. Starlette has already received each part into
+    its own spooled temporary file. After every size has been checked, the parts
+    are read and normalized one at a time, and each part's file is closed once
+    read, so at most one raw image is held in memory besides the spooled parts.
+    """
+    for upload in uploads:
+        if upload.size is not None and upload.size > settings.MAX_UPLOAD_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Image '{upload.filename}' exceeds maximum size of {settings.MAX_UPLOAD_BYTES} bytes."
+            )
+    normalized = []
+    try:
+        for upload in uploads:
+            image_data = await upload.read()
+            await upload.close()
+            normalized += await images.normalize_raw_images([image_data])
+            del image_data
+    except images.InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return normalized
+
+ASYNC_MODE_QUERY = Query(
+    False,
+    alias="async",
+    description="Return 202 immediately and evaluate in the worker; poll /feedback/{id} or stream /feedback/{id}/events.",
+)
+
+EVALUATION_MODE_QUERY = Query(
+    None,
+    alias="mode",
+    description="'standard' or 'fused' (evaluation and improvement suggestions in one call per image set). Defaults to EVALUATION_MODE.",
+)
+
+IDEMPOTENCY_KEY_HEADER = Header(
+    None,
+    alias="Idempotency-Key",
+    description="Retries with the same key get the first request's response instead of creating another submission.",
+)
+
+async def normalize_submission_multi(submission: schemas.SubmissionCreateMulti) -> Tuple[List[bytes], List[bytes]]:
+    """
+    Normalizes the base64 images of a multi-image submission once; the
+    normalized bytes are stored and sent to the AI.
+    """
     try:
-        image_urls = {}
-        for key, b64_data in [("playground", submission.playground_image_data_base64), ("toy", submission.toy_image_data_base64)]:
-            image_data = base64.b64decode(b64_data.split(',')[1])
-            filename = f"{uuid.uuid4().hex}.jpeg"
-            filepath = os.path.join("uploaded_images", filename)
-            with open(filepath, "wb") as f:
-                f.write(image_data)
-            image_urls[key] = f"/images/{filename}"
-    except (base64.binascii.Error, IndexError) as e:
+        normalized_images = await images.normalize_images([
+            b64_data.split(',')[1]
+            for b64_data in submission.playground_images_data_base64 + submission.toy_images_data_base64
+        ])
+    except IndexError as e:
         raise HTTPException(status_code=400, detail=f"Invalid Base64 image data: {e}")
+    except images.InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    playground_images = normalized_images[:len(submission.playground_images_data_base64)]
+    toy_images = normalized_images[len(submission.playground_images_data_base64):]
+    return playground_images, toy_images
+
+async def process_submission(
+    db: AsyncDatabase,
+    playground_image: bytes,
+    toy_image: bytes,
+    activity_description: Optional[str],
+    async_mode: bool,
+    evaluation_mode: Optional[str] = None,
+    idempotency_key: Optional[str] = None
+):
+    """
+    Runs a submission once: a retry (same Idempotency-Key, or the same
+    payload shortly after) gets the response of the first request.
+    """
+    evaluation_mode = evaluation_mode or settings.EVALUATION_MODE
+    fingerprint = idempotency.payload_fingerprint(
+        "submission", [playground_image, toy_image], activity_description, async_mode, evaluation_mode
+    )
+    key, ttl_seconds = idempotency.request_key("submission", idempotency_key, fingerprint)
+    return await idempotency.run_once(
+        db, key=key, fingerprint=fingerprint, ttl_seconds=ttl_seconds,
+        handler=lambda: run_submission(db, playground_image, toy_image, activity_description, async_mode, evaluation_mode)
+    )
+
+async def run_submission(
+    db: AsyncDatabase,
+    playground_image: bytes,
+    toy_image: bytes,
+    activity_description: Optional[str],
+    async_mode: bool,
+    evaluation_mode: str
+):
+    """
+    Stores normalized playground and toy images and evaluates them,
+    or queues the evaluation when async_mode is set.
+    """
+    image_store = storage.get_image_store()
+    playground_hash, toy_hash = await images.perceptual_hashes([playground_image, toy_image])
+    # Save images and get URLs
+    with metrics.stage("image_write"):
+        playground_key, toy_key = await asyncio.gather(image_store.put(playground_image), image_store.put(toy_image))
+
+    # Fused evaluations also produce suggestions, so only standard ones reuse feedback
+    reused_feedback = {}
+    if evaluation_mode == "standard":
+        reused_feedback = await reuse.find_reusable_feedback(
+            db, playground_hashes=[playground_hash], toy_hashes=[toy_hash], activity_description=activity_description
+        )
 
     # Create initial submission in DB
     initial_submission_data = {
-        "playground_image_url": image_urls["playground"],
-        "toy_image_url": image_urls["toy"],
-        "activity_description": submission.activity_description,
+        "playground_image_url": image_store.url_for(playground_key),
+        "toy_image_url": image_store.url_for(toy_key),
+        "playground_image_key": playground_key,
+        "toy_image_key": toy_key,
+        "activity_description": activity_description,
         "playground_feedback": None,
-        "toy_feedback": None
+        "toy_feedback": None,
+        "status": "pending" if async_mode else "evaluating",
+        "evaluation_mode": evaluation_mode,
+        **reuse.hash_fields([playground_hash], [toy_hash]),
+        **reuse.seed_fields(reused_feedback),
     }
-    db_submission = crud.create_submission(db, submission_data=initial_submission_data)
+    db_submission = await crud.create_submission(db, submission_data=initial_submission_data)
 
-    # Parallel AI feedback calls for playground and toy
-    t_playground = ai_models.get_ai_feedback(
-        image_data_base64=submission.playground_image_data_base64.split(',')[1],
-        text_description=submission.activity_description,
-        prompt_base=settings.AI_PLAYGROUND_PROMPT,
-        openai_api_key=settings.OPENAI_API_KEY,
-        model_name=settings.OPENAI_MODEL
-    )
-    t_toy = ai_models.get_ai_feedback(
-        image_data_base64=submission.toy_image_data_base64.split(',')[1],
-        text_description=submission.activity_description,
-        prompt_base=settings.AI_TOY_PROMPT,
-        openai_api_key=settings.OPENAI_API_KEY,
-        model_name=settings.OPENAI_MODEL
-    )
-    playground_feedback_json, toy_feedback_json = await asyncio.gather(t_playground, t_toy)
+    if async_mode:
+        await jobs.enqueue_job(db, job_type=jobs.EVALUATE_SUBMISSION_JOB, payload={"submission_id": str(db_submission["_id"])})
+        return accepted_response(db_submission)
 
-    # Validate and update DB with feedback
     try:
+        return await evaluate_submission(db, db_submission, playground_image, toy_image, activity_description, evaluation_mode)
+    except Exception:
+        # Don't leave it 'evaluating' for pollers and the events stream to wait on
+        await crud.update_submission_status(
+            db, submission_id=str(db_submission["_id"]), status="failed", unless_status=["evaluated"]
+        )
+        raise
+
+async def evaluate_submission(
+    db: AsyncDatabase,
+    db_submission: Dict,
+    playground_image: bytes,
+    toy_image: bytes,
+    activity_description: Optional[str],
+    evaluation_mode: str
+):
+    """
+    Evaluates a stored single-image submission while the client waits.
+    """
+    ai_models = load_ai_models()
+    from . import evaluation
+
+    with metrics.stage("base64_encode"):
+        playground_image_base64 = base64.b64encode(playground_image).decode("utf-8")
+        toy_image_base64 = base64.b64encode(toy_image).decode("utf-8")
+
+    if evaluation_mode == evaluation.FUSED_MODE:
+        updated_submission, errors = await evaluation.run_fused_evaluation(
+            db,
+            submission_id=str(db_submission["_id"]),
+            playground_images_base64=[playground_image_base64],
+            toy_images_base64=[toy_image_base64],
+            activity_description=activity_description,
+            # Like the standard mode, a single-image submission needs both evaluations
+            require_all=True
+        )
+        if errors:
+            if isinstance(errors[0], HTTPException):
+                raise errors[0]
+            raise HTTPException(status_code=500, detail=f"AI returned data in an invalid format: {errors[0]}")
+        return responses.model_response(updated_submission, schemas.SubmissionResponse)
+
+    async def evaluate(feedback_type: str, image_base64: str, prompt_base: str) -> Dict:
+        # Feedback reused from a near-duplicate submission needs no model call
+        if db_submission[feedback_type]:
+            return db_submission[feedback_type]
         # The AI response should be a dictionary with criterion names as keys
         # and objects with score and justification as values
-        validated_playground_feedback = parse_obj_as(Dict[str, schemas.CriterionFeedback], playground_feedback_json)
-        validated_toy_feedback = parse_obj_as(Dict[str, schemas.CriterionFeedback], toy_feedback_json)
-        
-        # Convert pydantic models to dicts for the crud function
-        playground_feedback_dict = {k: v.model_dump() for k, v in validated_playground_feedback.items()}
-        toy_feedback_dict = {k: v.model_dump() for k, v in validated_toy_feedback.items()}
-        
-        crud.update_submission_feedback(db, submission_id=str(db_submission["_id"]), feedback_type="playground_feedback", feedback_data=playground_feedback_dict)
-        updated_submission = crud.update_submission_feedback(db, submission_id=str(db_submission["_id"]), feedback_type="toy_feedback", feedback_data=toy_feedback_dict)
-
-        # Start background task to generate improvement suggestions
-        background_tasks.add_task(
-            generate_improvement_suggestions_background,
-            submission_id=str(db_submission["_id"]),
-            playground_images_base64=[submission.playground_image_data_base64.split(',')[1]],
-            toy_images_base64=[submission.toy_image_data_base64.split(',')[1]],
-            activity_description=submission.activity_description,
-            playground_feedback=playground_feedback_dict,
-            toy_feedback=toy_feedback_dict,
-            db=db
+        return await ai_models.get_ai_feedback(
+            image_data_base64=image_base64,
+            text_description=activity_description,
+            prompt_base=prompt_base,
+            model_name=settings.OPENAI_MODEL,
+            validate=schemas.validate_feedback
         )
 
-    except ValidationError as e:
-        raise HTTPException(status_code=500, detail=f"AI returned data in an invalid format: {e}")
+    # Parallel AI feedback calls for playground and toy
+    playground_feedback_dict, toy_feedback_dict = await asyncio.gather(
+        evaluate("playground_feedback", playground_image_base64, settings.AI_PLAYGROUND_PROMPT),
+        evaluate("toy_feedback", toy_image_base64, settings.AI_TOY_PROMPT),
+    )
+
+    updated_submission = await crud.update_submission_evaluation(
+        db,
+        submission_id=str(db_submission["_id"]),
+        playground_feedback=playground_feedback_dict,
+        toy_feedback=toy_feedback_dict,
+        status="evaluated"
+    )
+
+    # Queue a job for the worker to generate improvement suggestions
+    await jobs.enqueue_job(db, job_type=jobs.IMPROVEMENT_SUGGESTIONS_JOB, payload={"submission_id": str(db_submission["_id"])})
 
     if not updated_submission:
         raise HTTPException(status_code=404, detail="Submission not found after update.")
 
-    # Convert all ObjectIds to strings for FastAPI response validation
-    updated_submission = convert_objectids(updated_submission)
-    return updated_submission
+    return responses.model_response(updated_submission, schemas.SubmissionResponse)
 
-@app.post("/submit-design-multi", response_model=schemas.SubmissionResponseMulti, tags=["Submissions"])
-async def submit_design_multi(
-    submission: schemas.SubmissionCreateMulti,
-    background_tasks: BackgroundTasks,
-    db: Database = Depends(get_db)
+@app.post("/submit-design", response_model=schemas.SubmissionResponse, responses={202: {"model": schemas.SubmissionAccepted}}, tags=["Submissions"])
+async def submit_design(
+    submission: schemas.SubmissionCreate,
+    async_mode: bool = ASYNC_MODE_QUERY,
+    evaluation_mode: Optional[Literal["standard", "fused"]] = EVALUATION_MODE_QUERY,
+    idempotency_key: Optional[str] = IDEMPOTENCY_KEY_HEADER,
+    db: AsyncDatabase = Depends(get_db)
 ):
-    if submission.activity_description and len(submission.activity_description) > settings.MAX_ACTIVITY_DESCRIPTION_LENGTH:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Activity description exceeds maximum length of {settings.MAX_ACTIVITY_DESCRIPTION_LENGTH} characters."
-        )
-
-    # Create submission folder
-    submission_id = str(uuid.uuid4())
-    submission_folder = os.path.join("uploaded_images", submission_id)
-    playground_folder = os.path.join(submission_folder, "playground")
-    toy_folder = os.path.join(submission_folder, "toy")
-    
-    os.makedirs(playground_folder, exist_ok=True)
-    os.makedirs(toy_folder, exist_ok=True)
+    validate_activity_description(submission.activity_description)
 
-    # Save images and get URLs
+    # Normalize images once; the normalized bytes are stored and sent to the AI
     try:
-        playground_urls = []
-        toy_urls = []
-        
-        # Save playground images
-        for i, b64_data in enumerate(submission.playground_images_data_base64):
-            image_data = base64.b64decode(b64_data.split(',')[1])
-            filename = f"image_{i+1}.jpeg"
-            filepath = os.path.join(playground_folder, filename)
-            with open(filepath, "wb") as f:
-                f.write(image_data)
-            playground_urls.append(f"/images/{submission_id}/playground/{filename}")
-        
-        # Save toy images
-        for i, b64_data in enumerate(submission.toy_images_data_base64):
-            image_data = base64.b64decode(b64_data.split(',')[1])
-            filename = f"image_{i+1}.jpeg"
-            filepath = os.path.join(toy_folder, filename)
-            with open(filepath, "wb") as f:
-                f.write(image_data)
-            toy_urls.append(f"/images/{submission_id}/toy/{filename}")
-            
-    except (base64.binascii.Error, IndexError) as e:
+        playground_image, toy_image = await images.normalize_images([
+            submission.playground_image_data_base64.split(',')[1],
+            submission.toy_image_data_base64.split(',')[1],
+        ])
+    except IndexError as e:
         raise HTTPException(status_code=400, detail=f"Invalid Base64 image data: {e}")
+    except images.InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return await process_submission(db, playground_image, toy_image, submission.activity_description, async_mode, evaluation_mode, idempotency_key)
+
+async def store_submission_multi(
+    db: AsyncDatabase,
+    playground_images: List[bytes],
+    toy_images: List[bytes],
+    activity_description: Optional[str],
+    status: str,
+    evaluation_mode: str,
+    reuse_feedback: bool = False
+) -> Dict:
+    """
+    Stores normalized playground and toy image sets and creates their submission.
+    With reuse_feedback, image sets of near-duplicate earlier submissions get their feedback.
+    """
+    image_store = storage.get_image_store()
+    image_hashes = await images.perceptual_hashes(playground_images + toy_images)
+    playground_hashes = image_hashes[:len(playground_images)]
+    toy_hashes = image_hashes[len(playground_images):]
+    # Save images and get URLs
+    with metrics.stage("image_write"):
+        image_keys = await asyncio.gather(*[image_store.put(image_data) for image_data in playground_images + toy_images])
+    playground_keys = image_keys[:len(playground_images)]
+    toy_keys = image_keys[len(playground_images):]
+
+    reused_feedback = {}
+    if reuse_feedback:
+        reused_feedback = await reuse.find_reusable_feedback(
+            db, playground_hashes=playground_hashes, toy_hashes=toy_hashes, activity_description=activity_description
+        )
 
     # Create initial submission in DB
     initial_submission_data = {
-        "playground_image_urls": playground_urls,
-        "toy_image_urls": toy_urls,
-        "activity_description": submission.activity_description,
+        "playground_image_urls": [image_store.url_for(key) for key in playground_keys],
+        "toy_image_urls": [image_store.url_for(key) for key in toy_keys],
+        "playground_image_keys": playground_keys,
+        "toy_image_keys": toy_keys,
+        "activity_description": activity_description,
         "playground_feedback": None,
-        "toy_feedback": None
+        "toy_feedback": None,
+        "status": status,
+        "evaluation_mode": evaluation_mode,
+        **reuse.hash_fields(playground_hashes, toy_hashes),
+        **reuse.seed_fields(reused_feedback),
     }
-    db_submission = crud.create_submission_multi(db, submission_data=initial_submission_data)
+    return await crud.create_submission_multi(db, submission_data=initial_submission_data)
 
-    # Parallel AI feedback calls for playground and toy images
-    playground_images_base64 = [img.split(',')[1] for img in submission.playground_images_data_base64]
-    toy_images_base64 = [img.split(',')[1] for img in submission.toy_images_data_base64]
-    t_playground = ai_models.get_ai_feedback_multi(
-        images_data_base64=playground_images_base64,
-        text_description=submission.activity_description,
-        prompt_base=settings.AI_PLAYGROUND_PROMPT,
-        openai_api_key=settings.OPENAI_API_KEY,
-        model_name=settings.OPENAI_MODEL
+async def process_submission_multi(
+    db: AsyncDatabase,
+    playground_images: List[bytes],
+    toy_images: List[bytes],
+    activity_description: Optional[str],
+    async_mode: bool,
+    evaluation_mode: Optional[str] = None,
+    idempotency_key: Optional[str] = None
+):
+    """
+    Runs a multi-image submission once, like process_submission.
+    """
+    evaluation_mode = evaluation_mode or settings.EVALUATION_MODE
+    # Playground and toy images are fingerprinted separately, so moving an image between the sets changes it
+    fingerprint = idempotency.payload_fingerprint(
+        f"submission_multi:{len(playground_images)}", playground_images + toy_images,
+        activity_description, async_mode, evaluation_mode
     )
-    t_toy = ai_models.get_ai_feedback_multi(
-        images_data_base64=toy_images_base64,
-        text_description=submission.activity_description,
-        prompt_base=settings.AI_TOY_PROMPT,
-        openai_api_key=settings.OPENAI_API_KEY,
-        model_name=settings.OPENAI_MODEL
+    key, ttl_seconds = idempotency.request_key("submission_multi", idempotency_key, fingerprint)
+    return await idempotency.run_once(
+        db, key=key, fingerprint=fingerprint, ttl_seconds=ttl_seconds,
+        handler=lambda: run_submission_multi(db, playground_images, toy_images, activity_description, async_mode, evaluation_mode)
     )
-    playground_feedback_json, toy_feedback_json = await asyncio.gather(t_playground, t_toy)
 
-    # Validate and update DB with feedback (catching partial failures)
-    playground_feedback_dict = None
-    toy_feedback_dict = None
-    
-    # Playground feedback
-    try:
-        validated_playground_feedback = parse_obj_as(Dict[str, schemas.CriterionFeedback], playground_feedback_json)
-        playground_feedback_dict = {k: v.model_dump() for k, v in validated_playground_feedback.items()}
-        crud.update_submission_feedback(db, submission_id=str(db_submission["_id"]), feedback_type="playground_feedback", feedback_data=playground_feedback_dict)
-    except Exception as e:
-        print(f"Playground feedback error: {e}")
+async def run_submission_multi(
+    db: AsyncDatabase,
+    playground_images: List[bytes],
+    toy_images: List[bytes],
+    activity_description: Optional[str],
+    async_mode: bool,
+    evaluation_mode: str
+):
+    """
+    Stores normalized playground and toy image sets and evaluates them,
+    or queues the evaluation when async_mode is set.
+    """
+    db_submission = await store_submission_multi(
+        db, playground_images, toy_images, activity_description,
+        status="pending" if async_mode else "evaluating",
+        evaluation_mode=evaluation_mode,
+        # Fused evaluations also produce suggestions, so only standard ones reuse feedback
+        reuse_feedback=evaluation_mode == "standard"
+    )
+
+    if async_mode:
+        await jobs.enqueue_job(db, job_type=jobs.EVALUATE_SUBMISSION_JOB, payload={"submission_id": str(db_submission["_id"])})
+        return accepted_response(db_submission)
 
-    # Toy feedback
     try:
-        validated_toy_feedback = parse_obj_as(Dict[str, schemas.CriterionFeedback], toy_feedback_json)
-        toy_feedback_dict = {k: v.model_dump() for k, v in validated_toy_feedback.items()}
-        crud.update_submission_feedback(db, submission_id=str(db_submission["_id"]), feedback_type="toy_feedback", feedback_data=toy_feedback_dict)
-    except Exception as e:
-        print(f"Toy feedback error: {e}")
-
-    # Start background task to generate improvement suggestions
-    background_tasks.add_task(
-        generate_improvement_suggestions_background,
+        return await evaluate_submission_multi(db, db_submission, playground_images, toy_images, activity_description, evaluation_mode)
+    except Exception:
+        # Don't leave it 'evaluating' for pollers and the events stream to wait on
+        await crud.update_submission_status(
+            db, submission_id=str(db_submission["_id"]), status="failed", unless_status=["evaluated"]
+        )
+        raise
+
+async def evaluate_submission_multi(
+    db: AsyncDatabase,
+    db_submission: Dict,
+    playground_images: List[bytes],
+    toy_images: List[bytes],
+    activity_description: Optional[str],
+    evaluation_mode: str
+):
+    """
+    Evaluates a stored multi-image submission while the client waits.
+    """
+    ai_models = load_ai_models()
+    from . import evaluation
+
+    # Parallel AI feedback calls for playground and toy images
+    with metrics.stage("base64_encode"):
+        playground_images_base64 = [base64.b64encode(img).decode("utf-8") for img in playground_images]
+        toy_images_base64 = [base64.b64encode(img).decode("utf-8") for img in toy_images]
+
+    if evaluation_mode == evaluation.FUSED_MODE:
+        # Partial failures are tolerated like in the standard mode below
+        updated_submission, _ = await evaluation.run_fused_evaluation(
+            db,
+            submission_id=str(db_submission["_id"]),
+            playground_images_base64=playground_images_base64,
+            toy_images_base64=toy_images_base64,
+            activity_description=activity_description
+        )
+        return responses.model_response(updated_submission, schemas.SubmissionResponseMulti)
+
+    async def evaluate(feedback_type: str, images_base64: List[str], prompt_base: str) -> Optional[Dict]:
+        # Feedback reused from a near-duplicate submission needs no model call
+        if db_submission[feedback_type]:
+            return db_submission[feedback_type]
+        try:
+            return await ai_models.get_ai_feedback_multi(
+                images_data_base64=images_base64,
+                text_description=activity_description,
+                prompt_base=prompt_base,
+                model_name=settings.OPENAI_MODEL,
+                validate=schemas.validate_feedback
+            )
+        except ai_models.InvalidAIResponseError as e:
+            # Partial failures are tolerated: the other image set is still stored
+            print(f"{feedback_type} error: {e.detail}")
+            return None
+
+    playground_feedback_dict, toy_feedback_dict = await asyncio.gather(
+        evaluate("playground_feedback", playground_images_base64, settings.AI_PLAYGROUND_PROMPT),
+        evaluate("toy_feedback", toy_images_base64, settings.AI_TOY_PROMPT),
+    )
+
+    # Store both feedbacks and the final status in one update
+    updated_submission = await crud.update_submission_evaluation(
+        db,
         submission_id=str(db_submission["_id"]),
-        playground_images_base64=playground_images_base64,
-        toy_images_base64=toy_images_base64,
-        activity_description=submission.activity_description,
         playground_feedback=playground_feedback_dict,
         toy_feedback=toy_feedback_dict,
-        db=db
+        status="evaluated" if playground_feedback_dict or toy_feedback_dict else "failed"
     )
 
-    # Fetch the fully updated submission
-    updated_submission = crud.get_submission(db, submission_id=str(db_submission["_id"]))
-    # Convert all ObjectIds to strings for FastAPI response validation
-    updated_submission = convert_objectids(updated_submission)
-    return updated_submission
+    # Queue a job for the worker to generate improvement suggestions
+    if playground_feedback_dict or toy_feedback_dict:
+        await jobs.enqueue_job(db, job_type=jobs.IMPROVEMENT_SUGGESTIONS_JOB, payload={"submission_id": str(db_submission["_id"])})
+
+    return responses.model_response(updated_submission, schemas.SubmissionResponseMulti)
+
+@app.post("/submit-design-multi", response_model=schemas.SubmissionResponseMulti, responses={202: {"model": schemas.SubmissionAccepted}}, tags=["Submissions"])
+async def submit_design_multi(
+    submission: schemas.SubmissionCreateMulti,
+    async_mode: bool = ASYNC_MODE_QUERY,
+    evaluation_mode: Optional[Literal["standard", "fused"]] = EVALUATION_MODE_QUERY,
+    idempotency_key: Optional[str] = IDEMPOTENCY_KEY_HEADER,
+    db: AsyncDatabase = Depends(get_db)
+):
+    validate_activity_description(submission.activity_description)
+    playground_images, toy_images = await normalize_submission_multi(submission)
+    return await process_submission_multi(db, playground_images, toy_images, submission.activity_description, async_mode, evaluation_mode, idempotency_key)
+
+# Keeps fire-and-forget tasks referenced until they finish
+background_tasks: set = set()
+
+async def streamed_evaluation_events(
+    db: AsyncDatabase,
+    db_submission: Dict,
+    playground_images_base64: List[str],
+    toy_images_base64: List[str],
+    activity_description: Optional[str]
+):
+    """
+    Evaluates playground and toy images with streamed completions and yields a
+    server-sent event for each criterion as soon as the model has written it.
+    """
+    ai_models = load_ai_models()
+    submission_id = str(db_submission["_id"])
+    yield sse_event("submission", {"_id": submission_id, "status": db_submission["status"]})
+
+    queue: asyncio.Queue = asyncio.Queue()
+    feedback = {"playground_feedback": {}, "toy_feedback": {}}
+
+    async def evaluate(feedback_type: str, images_base64: List[str], prompt_base: str) -> None:
+        try:
+            async for criterion, criterion_json in ai_models.stream_ai_feedback_multi(
+                images_data_base64=images_base64,
+                text_description=activity_description,
+                prompt_base=prompt_base,
+                model_name=settings.OPENAI_MODEL,
+                validate=schemas.validate_feedback
+            ):
+                try:
+                    criterion_feedback = schemas.CriterionFeedback.model_validate(criterion_json).model_dump()
+                except ValidationError as e:
+                    print(f"{feedback_type} criterion '{criterion}' error: {e}")
+                    continue
+                feedback[feedback_type][criterion] = criterion_feedback
+                await queue.put(sse_event("criterion", {"feedback_type": feedback_type, "criterion": criterion, "feedback": criterion_feedback}))
+            await queue.put(sse_event("feedback_complete", {"feedback_type": feedback_type}))
+        except Exception as e:
+            print(f"Streamed {feedback_type} error: {e}")
+            await queue.put(sse_event("error", {"feedback_type": feedback_type, "detail": getattr(e, "detail", str(e))}))
+        finally:
+            await queue.put(None)
+
+    tasks = [
+        asyncio.create_task(evaluate("playground_feedback", playground_images_base64, settings.AI_PLAYGROUND_PROMPT)),
+        asyncio.create_task(evaluate("toy_feedback", toy_images_base64, settings.AI_TOY_PROMPT)),
+    ]
+    streamed = False
+    try:
+        remaining = len(tasks)
+        while remaining:
+            event = await queue.get()
+            if event is None:
+                remaining -= 1
+            else:
+                yield event
+        streamed = True
+    finally:
+        if not streamed:
+            # The client disconnected mid-stream: stop the model calls and let the worker finish the evaluation
+            for task in tasks:
+                task.cancel()
+            task = asyncio.create_task(
+                jobs.enqueue_job(db, job_type=jobs.EVALUATE_SUBMISSION_JOB, payload={"submission_id": submission_id})
+            )
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
 
-@app.get("/feedback/{submission_id}", response_model=schemas.SubmissionResponse, tags=["Submissions"])
-async def get_feedback(submission_id: str, db: Database = Depends(get_db)):
-    db_submission = crud.get_submission(db, submission_id=submission_id)
+    updated_submission = await crud.update_submission_evaluation(
+        db,
+        submission_id=submission_id,
+        playground_feedback=feedback["playground_feedback"] or None,
+        toy_feedback=feedback["toy_feedback"] or None,
+        status="evaluated" if feedback["playground_feedback"] or feedback["toy_feedback"] else "failed"
+    )
+    if feedback["playground_feedback"] or feedback["toy_feedback"]:
+        await jobs.enqueue_job(db, job_type=jobs.IMPROVEMENT_SUGGESTIONS_JOB, payload={"submission_id": submission_id})
+    if updated_submission is None:
+        yield sse_event("error", {"detail": "Submission not found"})
+        return
+    yield sse_event("done", responses.model_content(updated_submission, schemas.SubmissionResponseMulti))
+
+@app.post("/submit-design-multi-stream", tags=["Submissions"])
+async def submit_design_multi_stream(
+    submission: schemas.SubmissionCreateMulti,
+    db: AsyncDatabase = Depends(get_db)
+):
+    """
+    Same as /submit-design-multi, but streams the evaluation as server-sent events:
+    'submission' first, then a 'criterion' event per finished criterion, and
+    'done' with the stored submission.
+    """
+    from . import evaluation
+    validate_activity_description(submission.activity_description)
+    playground_images, toy_images = await normalize_submission_multi(submission)
+    db_submission = await store_submission_multi(
+        db, playground_images, toy_images, submission.activity_description,
+        status="evaluating",
+        evaluation_mode=evaluation.STANDARD_MODE
+    )
+    return StreamingResponse(
+        streamed_evaluation_events(
+            db,
+            db_submission,
+            playground_images_base64=[base64.b64encode(img).decode("utf-8") for img in playground_images],
+            toy_images_base64=[base64.b64encode(img).decode("utf-8") for img in toy_images],
+            activity_description=submission.activity_description
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/submit-design-upload", response_model=schemas.SubmissionResponse, responses={202: {"model": schemas.SubmissionAccepted}}, tags=["Submissions"])
+async def submit_design_upload(
+    playground_image: UploadFile = File(...),
+    toy_image: UploadFile = File(...),
+    activity_description: Optional[str] = Form(None),
+    async_mode: bool = ASYNC_MODE_QUERY,
+    evaluation_mode: Optional[Literal["standard", "fused"]] = EVALUATION_MODE_QUERY,
+    idempotency_key: Optional[str] = IDEMPOTENCY_KEY_HEADER,
+    db: AsyncDatabase = Depends(get_db)
+):
+    """
+    multipart/form-data variant of /submit-design.
+    """
+    validate_activity_description(activity_description)
+    playground_normalized, toy_normalized = await normalize_uploads([playground_image, toy_image])
+    return await process_submission(db, playground_normalized, toy_normalized, activity_description, async_mode, evaluation_mode, idempotency_key)
+
+@app.post("/submit-design-multi-upload", response_model=schemas.SubmissionResponseMulti, responses={202: {"model": schemas.SubmissionAccepted}}, tags=["Submissions"])
+async def submit_design_multi_upload(
+    playground_images: List[UploadFile] = File(...),
+    toy_images: List[UploadFile] = File(...),
+    activity_description: Optional[str] = Form(None),
+    async_mode: bool = ASYNC_MODE_QUERY,
+    evaluation_mode: Optional[Literal["standard", "fused"]] = EVALUATION_MODE_QUERY,
+    idempotency_key: Optional[str] = IDEMPOTENCY_KEY_HEADER,
+    db: AsyncDatabase = Depends(get_db)
+):
+    """
+    multipart/form-data variant of /submit-design-multi.
+    """
+    validate_activity_description(activity_description)
+    for name, uploads in [("playground_images", playground_images), ("toy_images", toy_images)]:
+        if not 1 <= len(uploads) <= 3:
+            raise HTTPException(status_code=400, detail=f"Between 1 and 3 {name} are required.")
+
+    normalized_images = await normalize_uploads(playground_images + toy_images)
+    playground_normalized = normalized_images[:len(playground_images)]
+    toy_normalized = normalized_images[len(playground_images):]
+
+    return await process_submission_multi(db, playground_normalized, toy_normalized, activity_description, async_mode, evaluation_mode, idempotency_key)
+
+@app.post("/submit-batch", status_code=202, response_model=schemas.BatchResponse, tags=["Batches"])
+async def submit_batch(
+    submission: schemas.BatchSubmissionCreate,
+    db: AsyncDatabase = Depends(get_db)
+):
+    """
+    Evaluates many image sets through the OpenAI Batch API. Results are stored
+    in the submissions as the batch completes; poll /batches/{batch_id}.
+    """
+    if len(submission.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch can contain at most {settings.BATCH_MAX_ITEMS} items.")
+    for item in submission.items:
+        validate_activity_description(item.activity_description)
+
+    # Normalize every image of the batch in one pass through the process pool
+    try:
+        normalized_images = iter(await images.normalize_images([
+            b64_data.split(',')[1]
+            for item in submission.items
+            for b64_data in item.playground_images_data_base64 + item.toy_images_data_base64
+        ]))
+    except IndexError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid Base64 image data: {e}")
+    except images.InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    items = [
+        (
+            [next(normalized_images) for _ in item.playground_images_data_base64],
+            [next(normalized_images) for _ in item.toy_images_data_base64],
+            item.activity_description,
+        )
+        for item in submission.items
+    ]
+
+    load_ai_models()
+    from . import batch
+    batch_job = await batch.create_batch(db, items)
+    return responses.model_response(batch_job, schemas.BatchResponse, status_code=202)
+
+@app.get("/batches/{batch_id}", response_model=schemas.BatchResponse, tags=["Batches"])
+async def get_batch(batch_id: str, db: AsyncDatabase = Depends(get_db)):
+    db_batch = await crud.get_batch_job(db, batch_job_id=batch_id)
+    if db_batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return responses.model_response(db_batch, schemas.BatchResponse)
+
+@app.get("/feedback/{submission_id}", response_model=Union[schemas.SubmissionResponseMulti, schemas.SubmissionResponse], tags=["Submissions"])
+async def get_feedback(submission_id: str, request: Request, db: AsyncDatabase = Depends(get_db)):
+    """
+    Clients polling for progress should send If-None-Match (or If-Modified-Since) to get a 304 while nothing has changed.
+    """
+    db_submission = await crud.get_submission(db, submission_id=submission_id, use_cache=True)
     if db_submission is None:
         raise HTTPException(status_code=404, detail="Submission not found")
-    # Convert all ObjectIds to strings for FastAPI response validation
-    db_submission = convert_objectids(db_submission)
-    return db_submission
+    if "playground_image_urls" in db_submission:
+        return responses.conditional_model_response(request, db_submission, schemas.SubmissionResponseMulti)
+    return responses.conditional_model_response(request, db_submission, schemas.SubmissionResponse)
+
+@app.get("/feedback/{submission_id}/events", tags=["Submissions"])
+async def stream_feedback(submission_id: str, db: AsyncDatabase = Depends(get_db)):
+    """
+    Server-sent event stream that pushes feedback and improvement suggestions as each completes.
+    """
+    if await crud.get_submission(db, submission_id=submission_id) is None:
+        raise HTTPException(status_code=404, detail="Submission not found")
+    return StreamingResponse(
+        feedback_events(db, submission_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/improvement-suggestions/{submission_id}", response_model=schemas.ImprovementSuggestionsResponse, tags=["Improvement Suggestions"])
-async def get_improvement_suggestions(submission_id: str, db: Database = Depends(get_db)):
+async def get_improvement_suggestions(
+    submission_id: str,
+    request: Request,
+    wait: float = Query(0, ge=0, le=settings.LONG_POLL_MAX_SECONDS, description="Seconds to wait for the suggestions to be written before answering 404."),
+    db: AsyncDatabase = Depends(get_db)
+):
     """
-    Get improvement suggestions for a submission.
+    Get improvement suggestions for a submission. Supports conditional requests like /feedback/{submission_id}.
+    With ?wait=N the request is answered as soon as the suggestions are written, instead of the client polling.
     """
-    db_suggestions = crud.get_improvement_suggestions(db, submission_id=submission_id)
+    if wait:
+        collection = db[crud.IMPROVEMENT_SUGGESTIONS_COLLECTION]
+        notifications.bus.watch(collection, "submission_id")
+        # Read from the database each time; the cache can lag behind a notification
+        db_suggestions = await notifications.bus.wait_for(
+            f"{crud.IMPROVEMENT_SUGGESTIONS_COLLECTION}:{submission_id}",
+            lambda: crud.get_improvement_suggestions(db, submission_id=submission_id),
+            timeout=wait,
+            collection_name=collection.name,
+        )
+    else:
+        db_suggestions = await crud.get_improvement_suggestions(db, submission_id=submission_id, use_cache=True)
     if db_suggestions is None:
         raise HTTPException(status_code=404, detail="Improvement suggestions not found")
-    # Convert all ObjectIds to strings for FastAPI response validation
-    db_suggestions = convert_objectids(db_suggestions)
-    return db_suggestions
+    return responses.conditional_model_response(request, db_suggestions, schemas.ImprovementSuggestionsResponse)
+
+@app.get("/cache/stats", tags=["Cache"])
+async def get_cache_stats():
+    """
+    Hit/miss counters of the AI response cache for this process.
+    """
+    return load_ai_models().response_cache.stats()
 
-@app.post("/improvement-suggestions/{submission_id}/regenerate", response_model=schemas.ImprovementSuggestionsResponse, tags=["Improvement Suggestions"])
+@app.get("/reuse/stats", tags=["Cache"])
+async def get_reuse_stats():
+    """
+    How many image sets this process looked up for near-duplicate submissions and how many reused their feedback.
+    """
+    return reuse.stats()
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Prometheus metrics of this process (of all processes in multiprocess mode).
+    """
+    content, content_type = metrics.render()
+    return Response(content=content, media_type=content_type)
+
+@app.get("/scheduler/stats", tags=["Scheduler"])
+async def get_scheduler_stats():
+    """
+    Queue depth, concurrency limit and rate-limit budget of this process's OpenAI scheduler.
+    """
+    from .core.scheduler import scheduler
+    return scheduler.stats()
+
+@app.post("/improvement-suggestions/{submission_id}/regenerate", status_code=202, tags=["Improvement Suggestions"])
 async def regenerate_improvement_suggestions(
     submission_id: str,
-    background_tasks: BackgroundTasks,
-    db: Database = Depends(get_db)
+    db: AsyncDatabase = Depends(get_db)
 ):
     """
     Regenerate improvement suggestions for a submission.
     """
     # Get the submission to access images and feedback
-    db_submission = crud.get_submission(db, submission_id=submission_id)
+    db_submission = await crud.get_submission(db, submission_id=submission_id)
     if db_submission is None:
         raise HTTPException(status_code=404, detail="Submission not found")
     
@@ -353,20 +925,7 @@ async def regenerate_improvement_suggestions(
     if not db_submission.get("playground_feedback") and not db_submission.get("toy_feedback"):
         raise HTTPException(status_code=400, detail="No evaluation feedback available for this submission")
     
-    # For now, we'll need to reconstruct the base64 images from URLs
-    # This is a limitation - in a production system, you might want to store base64 data
-    # or implement a more sophisticated image retrieval system
-    
-    # Start background task to regenerate improvement suggestions
-    background_tasks.add_task(
-        generate_improvement_suggestions_background,
-        submission_id=submission_id,
-        playground_images_base64=[],  # Would need to be implemented with image retrieval
-        toy_images_base64=[],  # Would need to be implemented with image retrieval
-        activity_description=db_submission.get("activity_description"),
-        playground_feedback=db_submission.get("playground_feedback"),
-        toy_feedback=db_submission.get("toy_feedback"),
-        db=db
-    )
+    # The worker reloads the stored images and feedback for the submission
+    job = await jobs.enqueue_job(db, job_type=jobs.IMPROVEMENT_SUGGESTIONS_JOB, payload={"submission_id": submission_id, "regenerate": True})
     
-    return {"message": "Improvement suggestions regeneration started"} 
\ No newline at end of file
+    return {"message": "Improvement suggestions regeneration started", "job_id": str(job["_id"])}
@@ -0,0 +1,125 @@
+"""
+Reuse of evaluations for near-duplicate photos. Every stored image gets a
+perceptual dHash (see images.dhash), kept on its submission together with
+the hash's 8-bit bands. Two hashes within 7 bits of each other share at
+least one band, so candidates are found with an indexed lookup of the bands,
+and only they are compared bit by bit. IMAGE_REUSE_MAX_DISTANCE is therefore
+limited to 7.
+
+With IMAGE_REUSE_ENABLED, an image set (playground or toy) whose images are
+all within IMAGE_REUSE_MAX_DISTANCE of an earlier evaluated submission's
+set, with the same activity description, takes that submission's feedback
+instead of being sent to the model: it is returned by synchronous
+submissions and seeds asynchronous ones, whose worker only evaluates the
+sets left without feedback.
+"""
+from typing import Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo.asynchronous.database import AsyncDatabase
+
+from . import crud
+from .core import images, metrics
+from .core.config import settings, IMAGE_HASH_BANDS
+
+FEEDBACK_TYPES = {"playground": "playground_feedback", "toy": "toy_feedback"}
+HASH_BANDS = IMAGE_HASH_BANDS
+
+# Image sets looked up and reused by this process
+lookups = 0
+reused = 0
+
+def hash_bands(kind: str, hashes: List[str]) -> List[str]:
+    """
+    The indexed bands of an image set's hashes, as "<kind>:<band>:<value>".
+    """
+    width = len(hashes[0]) // HASH_BANDS if hashes else 0
+    return sorted({
+        f"{kind}:{band}:{image_hash[band * width:(band + 1) * width]}"
+        for image_hash in hashes
+        for band in range(HASH_BANDS)
+    })
+
+def hash_fields(playground_hashes: List[str], toy_hashes: List[str]) -> Dict:
+    """
+    Fields stored on a submission for its images' hashes.
+    """
+    return {
+        "playground_image_hashes": playground_hashes,
+        "toy_image_hashes": toy_hashes,
+        "image_hash_bands": hash_bands("playground", playground_hashes) + hash_bands("toy", toy_hashes),
+    }
+
+def set_distance(hashes: List[str], candidate_hashes: Optional[List[str]]) -> Optional[int]:
+    """
+    Largest distance between an image and its closest counterpart in the other
+    set, or None if the sets have different sizes. Each candidate image is
+    matched at most once.
+    """
+    if not candidate_hashes or len(candidate_hashes) != len(hashes):
+        return None
+    remaining = list(candidate_hashes)
+    distance = 0
+    for image_hash in hashes:
+        closest = min(remaining, key=lambda candidate: images.hamming_distance(image_hash, candidate))
+        distance = max(distance, images.hamming_distance(image_hash, closest))
+        remaining.remove(closest)
+    return distance
+
+async def find_reusable_feedback(
+    db: AsyncDatabase,
+    *,
+    playground_hashes: List[str],
+    toy_hashes: List[str],
+    activity_description: Optional[str]
+) -> Dict[str, Tuple[ObjectId, Dict]]:
+    """
+    Feedback of earlier submissions with near-duplicate image sets, as
+    {feedback_type: (submission_id, feedback)}. Empty when reuse is disabled.
+    """
+    global lookups, reused
+    if not settings.IMAGE_REUSE_ENABLED:
+        return {}
+    image_sets = {"playground": playground_hashes, "toy": toy_hashes}
+    candidates = await crud.find_submissions_by_image_hash(
+        db,
+        bands=[band for kind, hashes in image_sets.items() for band in hash_bands(kind, hashes)],
+        activity_description=activity_description,
+        limit=settings.IMAGE_REUSE_MAX_CANDIDATES,
+    )
+
+    found = {}
+    for kind, hashes in image_sets.items():
+        feedback_type = FEEDBACK_TYPES[kind]
+        best = None
+        for candidate in candidates:
+            if not candidate.get(feedback_type):
+                continue
+            distance = set_distance(hashes, candidate.get(f"{kind}_image_hashes"))
+            if distance is not None and distance <= settings.IMAGE_REUSE_MAX_DISTANCE and (best is None or distance < best[0]):
+                best = (distance, candidate)
+        lookups += 1
+        if best is not None:
+            reused += 1
+            found[feedback_type] = (best[1]["_id"], best[1][feedback_type])
+        metrics.IMAGE_REUSE_LOOKUPS.labels(kind, "reused" if best is not None else "miss").inc()
+    return found
+
+def seed_fields(reused_feedback: Dict[str, Tuple[ObjectId, Dict]]) -> Dict:
+    """
+    Fields of a new submission that reuses feedback: the feedback itself and
+    the submissions it came from.
+    """
+    if not reused_feedback:
+        return {}
+    return {
+        **{feedback_type: feedback for feedback_type, (_, feedback) in reused_feedback.items()},
+        "reused_feedback_from": {feedback_type: source_id for feedback_type, (source_id, _) in reused_feedback.items()},
+    }
+
+def stats() -> Dict:
+    return {
+        "enabled": settings.IMAGE_REUSE_ENABLED,
+        "lookups": lookups,
+        "reused": reused,
+        "reuse_rate": reused / lookups if lookups else 0.0,
+    }
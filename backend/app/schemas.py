@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, ConfigDict, RootModel
+from pydantic import BaseModel, Field, ConfigDict, RootModel, TypeAdapter
 from typing import List, Optional, Dict, Union
 from datetime import datetime
 from bson import ObjectId
@@ -42,6 +42,16 @@ class ImprovementSuggestions(BaseModel):
 class FeedbackDetails(RootModel):
     root: Dict[str, CriterionFeedback]
 
+# Built once at import; parse_obj_as rebuilt the validator on every call
+CRITERIA_FEEDBACK = TypeAdapter(Dict[str, CriterionFeedback])
+CRITERIA_SUGGESTIONS = TypeAdapter(Dict[str, List[str]])
+
+def validate_feedback(feedback_json) -> Dict[str, dict]:
+    """
+    Validates the model's feedback and returns it as plain dicts for storing.
+    """
+    return CRITERIA_FEEDBACK.dump_python(CRITERIA_FEEDBACK.validate_python(feedback_json))
+
 class SubmissionCreate(BaseModel):
     playground_image_data_base64: str
     toy_image_data_base64: str
@@ -91,6 +101,8 @@ class SubmissionResponse(BaseModel):
     activity_description: Optional[str] = None
     playground_feedback: Optional[Dict[str, CriterionFeedback]] = None
     toy_feedback: Optional[Dict[str, CriterionFeedback]] = None
+    status: Optional[str] = None
+    evaluation_mode: Optional[str] = None
     created_at: datetime
     updated_at: datetime
 
@@ -107,6 +119,38 @@ class SubmissionResponseMulti(BaseModel):
     activity_description: Optional[str] = None
     playground_feedback: Optional[Dict[str, CriterionFeedback]] = None
     toy_feedback: Optional[Dict[str, CriterionFeedback]] = None
+    status: Optional[str] = None
+    evaluation_mode: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+    model_config = ConfigDict(
+        populate_by_name=True,
+        arbitrary_types_allowed=True,
+        json_encoders={ObjectId: str},
+    )
+
+class SubmissionAccepted(BaseModel):
+    id: str = Field(alias="_id")
+    status: str
+    feedback_url: str
+    events_url: str
+
+    model_config = ConfigDict(populate_by_name=True)
+
+class BatchSubmissionCreate(BaseModel):
+    items: List[SubmissionCreateMulti] = Field(..., min_length=1)
+
+class BatchResponse(BaseModel):
+    id: str = Field(alias="_id")
+    openai_batch_id: Optional[str] = None
+    status: str
+    submission_ids: List[str]
+    request_count: int
+    request_counts: Optional[Dict[str, int]] = None
+    ingested_at: Optional[datetime] = None
+    # Submissions deleted or expired before their results were ingested
+    missing_submissions: int = 0
     created_at: datetime
     updated_at: datetime
 
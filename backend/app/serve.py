@@ -0,0 +1,74 @@
+"""
+Production launcher for the API: uvicorn with several worker processes,
+uvloop and httptools, configured from Settings (SERVER_*).
+
+    python -m app.serve
+
+Workers are spawned, not forked, so each one imports the app and runs its
+startup, creating its own MongoDB client, OpenAI client, scheduler and image
+pool; no connections or threads are shared across processes. The supervisor
+restarts workers that die and, on SIGTERM, gives in-flight requests
+SERVER_GRACEFUL_TIMEOUT_SECONDS to finish. Metric files left in
+PROMETHEUS_MULTIPROC_DIR by an earlier run are removed at start.
+"""
+import glob
+import os
+import shutil
+import tempfile
+from typing import Dict
+import uvicorn
+
+from .core.config import settings
+
+def worker_count() -> int:
+    if settings.SERVER_WORKERS:
+        return settings.SERVER_WORKERS
+    # The cores this process may run on, which in a container can be fewer than the host's
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def server_options() -> Dict:
+    """
+    uvicorn options of the production server.
+    """
+    workers = worker_count()
+    return {
+        "host": settings.SERVER_HOST,
+        "port": settings.SERVER_PORT,
+        "workers": workers,
+        "loop": "uvloop",
+        "http": "httptools",
+        "backlog": settings.SERVER_BACKLOG,
+        # Longer than the load balancer's idle timeout, so it never reuses a connection the server has closed
+        "timeout_keep_alive": settings.SERVER_KEEPALIVE_SECONDS,
+        "timeout_graceful_shutdown": settings.SERVER_GRACEFUL_TIMEOUT_SECONDS,
+        # Recycling workers bounds memory growth; the jitter keeps them from restarting together.
+        # A single worker is not supervised, so it would not come back
+        "limit_max_requests": settings.SERVER_MAX_REQUESTS if workers > 1 and settings.SERVER_MAX_REQUESTS else None,
+        "limit_max_requests_jitter": settings.SERVER_MAX_REQUESTS_JITTER,
+        "proxy_headers": True,
+        "forwarded_allow_ips": settings.SERVER_FORWARDED_ALLOW_IPS,
+        "access_log": settings.SERVER_ACCESS_LOG,
+    }
+
+def main() -> None:
+    options = server_options()
+    metrics_dir = None
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        # Files of an earlier run would be added up with this one's
+        for path in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+            os.remove(path)
+    elif options["workers"] > 1:
+        # /metrics adds up the workers' metrics through files in a shared directory
+        metrics_dir = tempfile.mkdtemp(prefix="snapfeedback-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+    print(f"Starting {options['workers']} API workers on {options['host']}:{options['port']}")
+    try:
+        uvicorn.run("app.main:app", **options)
+    finally:
+        if metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""
+Job worker for slow, non-interactive AI work: async-mode evaluations and
+improvement suggestions.
+
+Run it as a separate process next to the API:
+
+    python -m app.worker
+"""
+import os
+import uuid
+import base64
+import signal
+import socket
+import asyncio
+import traceback
+from typing import Dict, List, Optional, Tuple
+from pymongo.asynchronous.database import AsyncDatabase
+
+from . import batch, crud, evaluation, indexes, jobs, schemas
+from .core import ai_models, metrics, scheduler, storage, tracing
+from .core.config import settings
+from .database import get_db, connect_to_mongo, close_mongo_connection
+
+async def load_images_base64(image_keys: List[str]) -> List[str]:
+    """
+    Reads stored images back from the image store as base64 strings.
+    """
+    store = storage.get_image_store()
+    images = await asyncio.gather(*[store.get(key) for key in image_keys])
+    return [base64.b64encode(image_data).decode("utf-8") for image_data in images]
+
+def submission_image_keys(db_submission: dict) -> Tuple[List[str], List[str]]:
+    """
+    Returns the image store keys of a submission's playground and toy images.
+    Single-image submissions store one key, multi-image submissions a list.
+    Submissions stored before keys were recorded fall back to their local /images/ path.
+    """
+    def keys(kind: str) -> List[str]:
+        if db_submission.get(f"{kind}_image_keys"):
+            return db_submission[f"{kind}_image_keys"]
+        if db_submission.get(f"{kind}_image_key"):
+            return [db_submission[f"{kind}_image_key"]]
+        urls = db_submission.get(f"{kind}_image_urls") or [db_submission[f"{kind}_image_url"]]
+        return [url.removeprefix("/images/") for url in urls]
+
+    return keys("playground"), keys("toy")
+
+async def generate_improvement_suggestions(
+    submission_id: str,
+    playground_images_base64: List[str],
+    toy_images_base64: List[str],
+    activity_description: Optional[str],
+    playground_feedback: Optional[Dict],
+    toy_feedback: Optional[Dict],
+    db: AsyncDatabase,
+    use_cache: bool = True
+) -> None:
+    """
+    Generates improvement suggestions for an evaluated submission and stores them.
+    Errors are raised so the job can be retried.
+    """
+    async def suggest(images_base64: List[str], feedback: Optional[Dict]) -> Optional[dict]:
+        if not feedback or not images_base64:
+            return None
+        return await ai_models.get_improvement_suggestions(
+            images_data_base64=images_base64,
+            text_description=activity_description,
+            evaluation_results=feedback,
+            prompt_base=settings.AI_IMPROVEMENT_SUGGESTIONS_PROMPT,
+            model_name=settings.OPENAI_MODEL,
+            use_cache=use_cache,
+            validate=schemas.CRITERIA_SUGGESTIONS.validate_python
+        )
+
+    playground_suggestions, toy_suggestions = await asyncio.gather(
+        suggest(playground_images_base64, playground_feedback),
+        suggest(toy_images_base64, toy_feedback),
+    )
+
+    # Store improvement suggestions in database
+    suggestions_data = {}
+    if playground_suggestions:
+        suggestions_data['playground_suggestions'] = playground_suggestions
+    if toy_suggestions:
+        suggestions_data['toy_suggestions'] = toy_suggestions
+
+    if suggestions_data:
+        await crud.update_improvement_suggestions(
+            db,
+            submission_id=submission_id,
+            suggestions_data=suggestions_data
+        )
+        print(f"Successfully generated and stored improvement suggestions for submission {submission_id}")
+    else:
+        print(f"No improvement suggestions generated for submission {submission_id}")
+
+def has_feedback(db_submission: Optional[dict]) -> bool:
+    return bool(db_submission and (db_submission.get("playground_feedback") or db_submission.get("toy_feedback")))
+
+async def run_evaluate_submission_job(db: AsyncDatabase, job: dict) -> None:
+    """
+    Evaluates a submission accepted in async mode. Playground and toy feedback are
+    stored as soon as each completes; feedback stored by an earlier attempt is kept.
+    Failures are retried, except that a multi-image submission is evaluated with
+    one set's feedback when the other set failed the way the synchronous endpoint
+    tolerates.
+    """
+    submission_id = job["payload"]["submission_id"]
+    # A retry must not move a submission an earlier attempt evaluated back to 'evaluating'
+    db_submission = await crud.update_submission_status(
+        db, submission_id=submission_id, status="evaluating", unless_status=["evaluated"]
+    )
+    if db_submission is None:
+        db_submission = await crud.get_submission(db, submission_id=submission_id)
+    if db_submission is None:
+        raise ValueError(f"Submission {submission_id} not found")
+
+    playground_keys, toy_keys = submission_image_keys(db_submission)
+    is_multi = "playground_image_urls" in db_submission
+
+    if db_submission.get("evaluation_mode") == evaluation.FUSED_MODE:
+        async def unevaluated_images(feedback_type: str, image_keys: List[str]) -> Optional[List[str]]:
+            # Sets evaluated by an earlier attempt are skipped
+            return None if db_submission.get(feedback_type) else await load_images_base64(image_keys)
+
+        # Suggestions come with the evaluation, so no suggestions job is queued
+        updated_submission, errors = await evaluation.run_fused_evaluation(
+            db,
+            submission_id=submission_id,
+            playground_images_base64=await unevaluated_images("playground_feedback", playground_keys),
+            toy_images_base64=await unevaluated_images("toy_feedback", toy_keys),
+            activity_description=db_submission.get("activity_description"),
+            status_if_failed="failed" if job["attempts"] >= job["max_attempts"] else "evaluating",
+            require_all=not is_multi
+        )
+        # Like the synchronous endpoint, a multi-image submission keeps the set that was evaluated
+        if errors and not (is_multi and has_feedback(updated_submission)):
+            raise errors[0]
+        return
+
+    async def evaluate(feedback_type: str, image_keys: List[str], prompt_base: str) -> None:
+        if db_submission.get(feedback_type):
+            return
+        images_base64 = await load_images_base64(image_keys)
+        if is_multi:
+            feedback_dict = await ai_models.get_ai_feedback_multi(
+                images_data_base64=images_base64,
+                text_description=db_submission.get("activity_description"),
+                prompt_base=prompt_base,
+                model_name=settings.OPENAI_MODEL,
+                validate=schemas.validate_feedback
+            )
+        else:
+            feedback_dict = await ai_models.get_ai_feedback(
+                image_data_base64=images_base64[0],
+                text_description=db_submission.get("activity_description"),
+                prompt_base=prompt_base,
+                model_name=settings.OPENAI_MODEL,
+                validate=schemas.validate_feedback
+            )
+        await crud.update_submission_feedback(db, submission_id=submission_id, feedback_type=feedback_type, feedback_data=feedback_dict)
+
+    results = await asyncio.gather(
+        evaluate("playground_feedback", playground_keys, settings.AI_PLAYGROUND_PROMPT),
+        evaluate("toy_feedback", toy_keys, settings.AI_TOY_PROMPT),
+        return_exceptions=True,
+    )
+    errors = [r for r in results if isinstance(r, Exception)]
+    # Like the synchronous endpoint, an invalid answer for one set of a multi-image
+    # submission is kept as that set's error while the other set's feedback is used
+    per_set_errors = is_multi and len(errors) < len(results) and all(
+        isinstance(e, ai_models.InvalidAIResponseError) for e in errors
+    )
+    for error in errors if per_set_errors else []:
+        print(f"Submission {submission_id} keeps a set without feedback: {error.detail}")
+    if errors and not per_set_errors:
+        if job["attempts"] >= job["max_attempts"]:
+            await crud.update_submission_status(db, submission_id=submission_id, status="failed", unless_status=["evaluated"])
+        raise errors[0]
+
+    await crud.update_submission_status(db, submission_id=submission_id, status="evaluated")
+    await jobs.enqueue_job(db, job_type=jobs.IMPROVEMENT_SUGGESTIONS_JOB, payload={"submission_id": submission_id})
+
+async def run_improvement_suggestions_job(db: AsyncDatabase, job: dict) -> None:
+    submission_id = job["payload"]["submission_id"]
+    db_submission = await crud.get_submission(db, submission_id=submission_id)
+    if db_submission is None:
+        raise ValueError(f"Submission {submission_id} not found")
+
+    playground_keys, toy_keys = submission_image_keys(db_submission)
+
+    await generate_improvement_suggestions(
+        submission_id=submission_id,
+        playground_images_base64=await load_images_base64(playground_keys),
+        toy_images_base64=await load_images_base64(toy_keys),
+        activity_description=db_submission.get("activity_description"),
+        playground_feedback=db_submission.get("playground_feedback"),
+        toy_feedback=db_submission.get("toy_feedback"),
+        db=db,
+        use_cache=not job["payload"].get("regenerate", False)
+    )
+
+async def run_ingest_batch_job(db: AsyncDatabase, job: dict) -> Optional[float]:
+    """
+    Ingests a batch evaluation once OpenAI has finished it; until then the
+    same job runs again every BATCH_POLL_INTERVAL_SECONDS.
+    """
+    if not await batch.ingest_batch(db, batch_job_id=job["payload"]["batch_job_id"]):
+        return settings.BATCH_POLL_INTERVAL_SECONDS
+    return None
+
+# A handler that returns a number of seconds isn't done yet and runs again after that delay
+JOB_HANDLERS = {
+    jobs.EVALUATE_SUBMISSION_JOB: run_evaluate_submission_job,
+    jobs.IMPROVEMENT_SUGGESTIONS_JOB: run_improvement_suggestions_job,
+    jobs.INGEST_BATCH_JOB: run_ingest_batch_job,
+}
+
+# Evaluations have a user polling for them; their model calls go ahead of suggestions
+JOB_PRIORITIES = {
+    jobs.EVALUATE_SUBMISSION_JOB: scheduler.INTERACTIVE,
+}
+
+class Worker:
+    """
+    Claims jobs from the jobs collection and runs them with bounded concurrency.
+    """
+    def __init__(self, db: AsyncDatabase, concurrency: int = settings.JOB_WORKER_CONCURRENCY):
+        self.db = db
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.stopping = asyncio.Event()
+        self.tasks: set = set()
+
+    async def keep_lease(self, job: dict, job_task: asyncio.Task) -> None:
+        """
+        Renews a running job's lease every third of JOB_LEASE_SECONDS, so long
+        model calls don't let another worker claim it. Cancels the job if its
+        lease was lost anyway (e.g. this worker was paused past the lease).
+        """
+        while True:
+            await asyncio.sleep(settings.JOB_LEASE_SECONDS / 3)
+            if not await jobs.renew_lease(self.db, job=job):
+                print(f"Job {job['_id']} ({job['type']}) lost its lease, cancelling it")
+                job_task.cancel()
+                return
+
+    async def run_job(self, job: dict) -> None:
+        # Each job runs in its own task, so this only applies to the job's own model calls
+        scheduler.current_priority.set(JOB_PRIORITIES.get(job["type"], scheduler.BACKGROUND))
+        attributes = {"job.id": str(job["_id"]), "job.type": job["type"], "job.attempt": job["attempts"]}
+        lease_task = asyncio.create_task(self.keep_lease(job, asyncio.current_task()))
+        try:
+            with tracing.linked_span(f"job {job['type']}", job.get("trace_context"), attributes) as job_span:
+                try:
+                    delay_seconds = await JOB_HANDLERS[job["type"]](self.db, job)
+                    lease_task.cancel()
+                    if delay_seconds is not None:
+                        if await jobs.reschedule_job(self.db, job=job, delay_seconds=delay_seconds):
+                            metrics.JOBS.labels(job["type"], "rescheduled").inc()
+                        else:
+                            print(f"Job {job['_id']} ({job['type']}) lost its lease before it was rescheduled")
+                    elif await jobs.complete_job(self.db, job=job):
+                        metrics.JOBS.labels(job["type"], "completed").inc()
+                        print(f"Job {job['_id']} ({job['type']}) completed")
+                    else:
+                        print(f"Job {job['_id']} ({job['type']}) completed after losing its lease")
+                except Exception as e:
+                    lease_task.cancel()
+                    job_span.record_exception(e)
+                    status = await jobs.fail_job(self.db, job=job, error=f"{type(e).__name__}: {e}")
+                    if status is None:
+                        print(f"Job {job['_id']} ({job['type']}) attempt {job['attempts']} failed after losing its lease: {e}")
+                        return
+                    metrics.JOBS.labels(job["type"], "retried" if status == "queued" else "failed").inc()
+                    job_span.set_attribute("job.status", status)
+                    print(f"Job {job['_id']} ({job['type']}) attempt {job['attempts']} failed, now {status}: {e}")
+                    if status == "failed":
+                        traceback.print_exc()
+        finally:
+            lease_task.cancel()
+            self.semaphore.release()
+
+    async def fail_expired_jobs(self) -> None:
+        """
+        Fails the jobs whose lease expired on their last attempt, which the claim
+        query no longer picks up, and their submissions if they were evaluations.
+        """
+        while (job := await jobs.fail_expired_job(self.db, job_types=list(JOB_HANDLERS))) is not None:
+            metrics.JOBS.labels(job["type"], "failed").inc()
+            print(f"Job {job['_id']} ({job['type']}) lease expired on attempt {job['attempts']}, now failed")
+            if job["type"] == jobs.EVALUATE_SUBMISSION_JOB:
+                await crud.update_submission_status(
+                    self.db, submission_id=job["payload"]["submission_id"], status="failed", unless_status=["evaluated"]
+                )
+
+    async def run(self) -> None:
+        print(f"Worker {self.worker_id} started")
+        loop = asyncio.get_running_loop()
+        next_expiry_check = loop.time()
+        while not self.stopping.is_set():
+            if loop.time() >= next_expiry_check:
+                await self.fail_expired_jobs()
+                next_expiry_check = loop.time() + settings.JOB_LEASE_SECONDS / 3
+            await self.semaphore.acquire()
+            # Stopping may have been requested while waiting for a free slot
+            if self.stopping.is_set():
+                self.semaphore.release()
+                break
+            job = await jobs.claim_next_job(self.db, worker_id=self.worker_id, job_types=list(JOB_HANDLERS))
+            if job is None:
+                self.semaphore.release()
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), timeout=settings.JOB_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(self.run_job(job))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+        # Let in-flight jobs finish before exiting
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        print(f"Worker {self.worker_id} stopped")
+
+async def main() -> None:
+    metrics.start_metrics_server(settings.WORKER_METRICS_PORT)
+    tracing.init_tracing("snapfeedback-worker")
+    ai_models.init_openai_client()
+    connect_to_mongo()
+    await indexes.ensure_indexes(get_db())
+    ai_models.response_cache.attach(get_db()[ai_models.AI_RESPONSE_CACHE_COLLECTION])
+    worker = Worker(get_db())
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stopping.set)
+
+    try:
+        await worker.run()
+    finally:
+        await ai_models.close_openai_client()
+        await close_mongo_connection()
+        tracing.shutdown_tracing()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,121 @@
+"""
+Counts MongoDB round trips and wall time per submission for the CRUD write path,
+comparing the previous insert-then-find / update-then-find pattern with app.crud.
+
+    python -m benchmarks.crud_roundtrips [--mongo-uri URI] [--iterations N]
+
+Without --mongo-uri an in-memory mongomock database is used (pip install mongomock-motor).
+"""
+import time
+import asyncio
+import argparse
+from datetime import datetime
+
+from app import crud
+
+# Collection methods that each cost one round trip to the server
+ROUND_TRIP_METHODS = {
+    "insert_one", "find_one", "update_one", "find_one_and_update",
+    "replace_one", "delete_one", "count_documents",
+}
+
+class CountingCollection:
+    def __init__(self, collection, counter):
+        self._collection = collection
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in ROUND_TRIP_METHODS:
+            return attr
+
+        async def counted(*args, **kwargs):
+            self._counter["round_trips"] += 1
+            return await attr(*args, **kwargs)
+        return counted
+
+class CountingDatabase:
+    def __init__(self, db):
+        self._db = db
+        self.counter = {"round_trips": 0}
+
+    def __getitem__(self, name):
+        return CountingCollection(self._db[name], self.counter)
+
+FEEDBACK = {
+    name: {"score": 0.5, "what_went_well": "Well", "what_could_be_improved": "Better"}
+    for name in ["Narrative Setting", "Multi Sensory", "Boundary", "Movement and Layout", "Clean up and Resetting"]
+}
+
+def new_submission() -> dict:
+    return {
+        "playground_image_urls": ["/images/a.jpeg", "/images/b.jpeg"],
+        "toy_image_urls": ["/images/c.jpeg"],
+        "activity_description": "Benchmark",
+        "playground_feedback": None,
+        "toy_feedback": None,
+        "status": "evaluating",
+    }
+
+async def legacy_flow(db) -> dict:
+    """
+    The write path of /submit-design-multi before the CRUD rewrite.
+    """
+    collection = db[crud.SUBMISSION_COLLECTION]
+    data = new_submission()
+    data["created_at"] = data["updated_at"] = datetime.utcnow()
+    result = await collection.insert_one(data)
+    submission_id = (await collection.find_one({"_id": result.inserted_id}))["_id"]
+    for feedback_type in ("playground_feedback", "toy_feedback"):
+        await collection.update_one({"_id": submission_id}, {"$set": {feedback_type: FEEDBACK, "updated_at": datetime.utcnow()}})
+        await collection.find_one({"_id": submission_id})
+    return await collection.find_one({"_id": submission_id})
+
+async def current_flow(db) -> dict:
+    db_submission = await crud.create_submission_multi(db, submission_data=new_submission())
+    return await crud.update_submission_evaluation(
+        db,
+        submission_id=str(db_submission["_id"]),
+        playground_feedback=FEEDBACK,
+        toy_feedback=FEEDBACK,
+        status="evaluated",
+    )
+
+async def run(flow, db, iterations: int) -> dict:
+    counting_db = CountingDatabase(db)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        result = await flow(counting_db)
+        assert result["toy_feedback"] == FEEDBACK
+    elapsed = time.perf_counter() - start
+    return {
+        "round_trips_per_submission": counting_db.counter["round_trips"] / iterations,
+        "ms_per_submission": elapsed * 1000 / iterations,
+    }
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-uri", help="Benchmark against a real MongoDB instead of mongomock")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.mongo_uri:
+        from pymongo import AsyncMongoClient
+        client = AsyncMongoClient(args.mongo_uri)
+        db = client["snapfeedback_benchmark"]
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+        client = AsyncMongoMockClient()
+        db = client["snapfeedback_benchmark"]
+
+    try:
+        for name, flow in [("legacy", legacy_flow), ("current", current_flow)]:
+            stats = await run(flow, db, args.iterations)
+            print(f"{name:>8}: {stats['round_trips_per_submission']:.1f} round trips, {stats['ms_per_submission']:.2f} ms per submission")
+    finally:
+        if args.mongo_uri:
+            await client.drop_database("snapfeedback_benchmark")
+            await client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
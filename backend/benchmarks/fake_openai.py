@@ -0,0 +1,288 @@
+"""
+Local stand-in for the parts of the OpenAI API the app uses: chat completions,
+files and batches. Answers are canned but match the shape the prompts ask for,
+and batches complete as soon as they are polled.
+
+Chat completions carry x-ratelimit-* headers. Set FAKE_OPENAI_RPM and/or
+FAKE_OPENAI_TPM to enforce limits, which are answered with 429s like the
+real API (FAKE_OPENAI_RATE_WINDOW_SECONDS shortens the one-minute window).
+
+To mimic the model's latency, FAKE_OPENAI_LATENCY_SECONDS sets the median
+time before a completion starts, drawn from a log-normal distribution with
+FAKE_OPENAI_LATENCY_SIGMA (0 keeps it constant). FAKE_OPENAI_ERROR_RATE
+answers that fraction of completions with a 500.
+
+Usage reports cached prompt tokens like the real prompt cache: the longest
+prefix of message parts already seen with the same prompt_cache_key, from
+1024 tokens in steps of 128.
+
+    uvicorn benchmarks.fake_openai:app --port 8001
+
+Then point the API and the worker at it:
+
+    OPENAI_BASE_URL=http://localhost:8001/v1 OPENAI_API_KEY=fake ...
+"""
+import os
+import re
+import json
+import time
+import uuid
+import random
+import hashlib
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+app = FastAPI(title="Fake OpenAI API")
+
+# Pause between streamed chunks, to mimic token generation
+CHUNK_DELAY_SECONDS = float(os.environ.get("FAKE_OPENAI_CHUNK_DELAY_SECONDS", "0.01"))
+CHUNK_SIZE = 16
+
+# Rate limits per window; 0 means unlimited
+RPM_LIMIT = int(os.environ.get("FAKE_OPENAI_RPM", "0"))
+TPM_LIMIT = int(os.environ.get("FAKE_OPENAI_TPM", "0"))
+RATE_WINDOW_SECONDS = float(os.environ.get("FAKE_OPENAI_RATE_WINDOW_SECONDS", "60"))
+UNLIMITED = 1_000_000_000
+
+LATENCY_SECONDS = float(os.environ.get("FAKE_OPENAI_LATENCY_SECONDS", "0"))
+LATENCY_SIGMA = float(os.environ.get("FAKE_OPENAI_LATENCY_SIGMA", "0"))
+ERROR_RATE = float(os.environ.get("FAKE_OPENAI_ERROR_RATE", "0"))
+
+files: Dict[str, dict] = {}
+batches: Dict[str, dict] = {}
+rate_window = {"started_at": 0.0, "requests": 0, "tokens": 0}
+rate_limit_stats = {"accepted": 0, "rejected": 0, "errors": 0}
+# Digests of the prompt prefixes seen so far, with their token counts
+prompt_cache: Dict[str, int] = {}
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_INCREMENT = 128
+
+def prompt_text(messages: List[dict]) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts += [part["text"] for part in content if part.get("type") == "text"]
+    return "\n".join(parts)
+
+def fake_answer(messages: List[dict], response_format: Optional[dict] = None) -> dict:
+    """
+    Builds an answer for every criterion named in the prompt's example output.
+    """
+    text = prompt_text(messages)
+    criteria = list(dict.fromkeys(re.findall(r'^\s*"([^"]+)": [\[{]', text, flags=re.M))) or ["Overall"]
+    suggestions = {name: [f"Suggestion for {name}"] for name in criteria}
+    evaluation = {
+        name: {"score": 0.5, "what_went_well": f"{name} is partly there.", "what_could_be_improved": f"Strengthen {name}."}
+        for name in criteria
+    }
+    if (response_format or {}).get("type") == "json_schema":
+        return {"evaluation": evaluation, "improvement_suggestions": suggestions}
+    if "actionable improvement" in text:
+        return suggestions
+    return evaluation
+
+def message_parts(messages: List[dict]) -> List[Tuple[str, dict]]:
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        for part in ([{"type": "text", "text": content}] if isinstance(content, str) else content):
+            parts.append((message["role"], part))
+    return parts
+
+def part_tokens(part: dict) -> int:
+    return len(part["text"]) // 4 if part["type"] == "text" else 85
+
+def prompt_usage(body: dict) -> Tuple[int, int]:
+    """
+    Prompt tokens of a request and how many of them a prefix cache would serve.
+    """
+    digest = hashlib.sha256((body.get("prompt_cache_key") or "").encode("utf-8"))
+    tokens = cached = 0
+    for role, part in message_parts(body["messages"]):
+        digest.update(json.dumps([role, part], sort_keys=True).encode("utf-8"))
+        tokens += part_tokens(part)
+        key = digest.hexdigest()
+        if key in prompt_cache:
+            cached = tokens
+        else:
+            prompt_cache[key] = tokens
+    if cached < PROMPT_CACHE_MIN_TOKENS:
+        cached = 0
+    return tokens, cached // PROMPT_CACHE_INCREMENT * PROMPT_CACHE_INCREMENT
+
+def chat_completion(body: dict) -> dict:
+    prompt_tokens, cached_tokens = prompt_usage(body)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": json.dumps(fake_answer(body["messages"], body.get("response_format")))},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": 100,
+            "total_tokens": prompt_tokens + 100,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        },
+    }
+
+async def stream_chat_completion(completion: dict, include_usage: bool = False):
+    """
+    Sends a completion as chat.completion.chunk server-sent events.
+    """
+    content = completion["choices"][0]["message"]["content"]
+    for i in range(0, len(content), CHUNK_SIZE):
+        chunk = {
+            "id": completion["id"],
+            "object": "chat.completion.chunk",
+            "created": completion["created"],
+            "model": completion["model"],
+            "choices": [{"index": 0, "delta": {"content": content[i:i + CHUNK_SIZE]}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(CHUNK_DELAY_SECONDS)
+    last = {**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+    yield f"data: {json.dumps(last)}\n\n"
+    if include_usage:
+        usage = {**chunk, "choices": [], "usage": completion["usage"]}
+        yield f"data: {json.dumps(usage)}\n\n"
+    yield "data: [DONE]\n\n"
+
+def request_tokens(body: dict) -> int:
+    """
+    Tokens a request counts against the limit: prompt estimate plus max_tokens.
+    """
+    return (body.get("max_tokens") or 0) + sum(part_tokens(part) for _, part in message_parts(body["messages"]))
+
+def take_rate_limit(tokens: int) -> Tuple[bool, Dict[str, str]]:
+    """
+    Counts a request against the current window.
+    Returns whether it is allowed and the rate-limit headers to send.
+    """
+    now = time.monotonic()
+    if now - rate_window["started_at"] >= RATE_WINDOW_SECONDS:
+        rate_window.update(started_at=now, requests=0, tokens=0)
+    rpm = RPM_LIMIT or UNLIMITED
+    tpm = TPM_LIMIT or UNLIMITED
+    allowed = rate_window["requests"] + 1 <= rpm and rate_window["tokens"] + tokens <= tpm
+    if allowed:
+        rate_window["requests"] += 1
+        rate_window["tokens"] += tokens
+    reset = f"{max(RATE_WINDOW_SECONDS - (now - rate_window['started_at']), 0):.3f}s"
+    headers = {
+        "x-ratelimit-limit-requests": str(rpm),
+        "x-ratelimit-limit-tokens": str(tpm),
+        "x-ratelimit-remaining-requests": str(rpm - rate_window["requests"]),
+        "x-ratelimit-remaining-tokens": str(tpm - rate_window["tokens"]),
+        "x-ratelimit-reset-requests": reset,
+        "x-ratelimit-reset-tokens": reset,
+    }
+    rate_limit_stats["accepted" if allowed else "rejected"] += 1
+    return allowed, headers
+
+@app.post("/v1/chat/completions")
+async def create_chat_completion(request: Request):
+    body = await request.json()
+    allowed, headers = take_rate_limit(request_tokens(body))
+    if not allowed:
+        error = {"message": "Rate limit reached", "type": "requests", "param": None, "code": "rate_limit_exceeded"}
+        return JSONResponse({"error": error}, status_code=429, headers=headers)
+    if LATENCY_SECONDS:
+        await asyncio.sleep(LATENCY_SECONDS * random.lognormvariate(0, LATENCY_SIGMA))
+    if random.random() < ERROR_RATE:
+        rate_limit_stats["errors"] += 1
+        error = {"message": "The server had an error while processing your request", "type": "server_error", "param": None, "code": None}
+        return JSONResponse({"error": error}, status_code=500, headers=headers)
+    completion = chat_completion(body)
+    if body.get("stream"):
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+        return StreamingResponse(stream_chat_completion(completion, include_usage), media_type="text/event-stream", headers=headers)
+    return JSONResponse(completion, headers=headers)
+
+@app.get("/stats")
+async def get_stats():
+    """
+    How many chat completions were accepted, rejected with a 429 and failed with a 500.
+    """
+    return rate_limit_stats
+
+def file_object(file_id: str) -> dict:
+    f = files[file_id]
+    return {
+        "id": file_id, "object": "file", "bytes": len(f["content"]), "created_at": f["created_at"],
+        "filename": f["filename"], "purpose": f["purpose"], "status": "processed",
+    }
+
+def store_file(content: bytes, filename: str, purpose: str) -> str:
+    file_id = f"file-{uuid.uuid4().hex}"
+    files[file_id] = {"content": content, "filename": filename, "purpose": purpose, "created_at": int(time.time())}
+    return file_id
+
+@app.post("/v1/files")
+async def create_file(file: UploadFile = File(...), purpose: str = Form(...)):
+    return file_object(store_file(await file.read(), file.filename, purpose))
+
+@app.get("/v1/files/{file_id}/content")
+async def get_file_content(file_id: str):
+    if file_id not in files:
+        raise HTTPException(status_code=404, detail="File not found")
+    return PlainTextResponse(files[file_id]["content"])
+
+def run_batch(batch: dict) -> None:
+    """
+    Answers every request of a batch and writes the output file.
+    """
+    lines = files[batch["input_file_id"]]["content"].decode("utf-8").splitlines()
+    output = []
+    for line in filter(None, lines):
+        request = json.loads(line)
+        output.append({
+            "id": f"batch_req_{uuid.uuid4().hex}",
+            "custom_id": request["custom_id"],
+            "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": chat_completion(request["body"])},
+            "error": None,
+        })
+    batch["output_file_id"] = store_file("\n".join(json.dumps(o) for o in output).encode("utf-8"), "batch_output.jsonl", "batch_output")
+    batch["status"] = "completed"
+    batch["completed_at"] = int(time.time())
+    batch["request_counts"] = {"total": len(output), "completed": len(output), "failed": 0}
+
+@app.post("/v1/batches")
+async def create_batch(request: Request):
+    body = await request.json()
+    if body["input_file_id"] not in files:
+        raise HTTPException(status_code=400, detail="Unknown input_file_id")
+    batch_id = f"batch_{uuid.uuid4().hex}"
+    batches[batch_id] = {
+        "id": batch_id,
+        "object": "batch",
+        "endpoint": body["endpoint"],
+        "input_file_id": body["input_file_id"],
+        "completion_window": body["completion_window"],
+        "status": "validating",
+        "output_file_id": None,
+        "error_file_id": None,
+        "created_at": int(time.time()),
+        "metadata": body.get("metadata"),
+        "request_counts": {"total": 0, "completed": 0, "failed": 0},
+    }
+    return batches[batch_id]
+
+@app.get("/v1/batches/{batch_id}")
+async def retrieve_batch(batch_id: str):
+    if batch_id not in batches:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    batch = batches[batch_id]
+    if batch["status"] != "completed":
+        run_batch(batch)
+    return batch
@@ -0,0 +1,279 @@
+"""
+Load test of the submission hot path. Boots the fake OpenAI server and the API
+(with an in-memory mongomock database and an in-process job worker, or a real
+MongoDB with --mongo-uri), then drives /submit-design, /submit-design-multi,
+/feedback/{id} and /improvement-suggestions/{id} at rising concurrency.
+Reports throughput, p50/p95/p99 latency per endpoint and the API's peak RSS.
+
+    python -m benchmarks.loadtest [--concurrency 1,4,16,32] [--requests 40]
+        [--latency 0.5 --latency-sigma 0.3 --error-rate 0.01]
+        [--mongo-uri mongodb://localhost:27017]
+        [--json results.json] [--baseline results.json --tolerance 0.2] [--long-poll]
+
+With --baseline the run fails (exit code 1) if any endpoint's p95 or the
+throughput is worse than the baseline by more than the tolerance. With
+--long-poll, clients wait for the improvement suggestions with ?wait=
+instead of polling for them.
+"""
+import io
+import os
+import sys
+import json
+import time
+import base64
+import shutil
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SUGGESTIONS_POLL_SECONDS = 0.1
+SUGGESTIONS_TIMEOUT_SECONDS = 120.0
+SUGGESTIONS_WAIT_SECONDS = 30
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def make_image(width: int = 1600, height: int = 1200) -> str:
+    """
+    A noisy photo-sized JPEG, so normalization has real work to do.
+    """
+    img = Image.effect_noise((width, height), 48).convert("RGB")
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=90)
+    return "data:image/jpeg;base64," + base64.b64encode(output.getvalue()).decode("utf-8")
+
+def start_server(module: str, port: int, env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", module, "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **env},
+    )
+
+async def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server for {url} exited with code {process.returncode}")
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server for {url} did not start within {timeout}s")
+
+def peak_rss_mb(pid: int) -> Optional[float]:
+    """
+    Peak resident set size of a running process (Linux only).
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    index = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+async def run_level(client: httpx.AsyncClient, concurrency: int, total: int, image: str, long_poll: bool = False) -> Dict:
+    """
+    Runs `total` submission scenarios with `concurrency` of them in flight.
+    A scenario submits a design (alternating single and multi), then reads its
+    feedback and improvement suggestions; "suggestions ready" is the time from
+    submitting until the suggestions could be read.
+    """
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+    counter = iter(range(total))
+
+    async def timed(name: str, method: str, url: str, **kwargs) -> httpx.Response:
+        started_at = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        latencies[name].append(time.perf_counter() - started_at)
+        statuses[name][response.status_code] += 1
+        return response
+
+    async def scenario(i: int) -> None:
+        # A distinct description per submission keeps the AI response cache from answering
+        description = f"Load test submission {i}"
+        submitted_at = time.perf_counter()
+        if i % 2:
+            response = await timed("POST /submit-design-multi", "POST", "/submit-design-multi", json={
+                "playground_images_data_base64": [image, image],
+                "toy_images_data_base64": [image],
+                "activity_description": description,
+            })
+        else:
+            response = await timed("POST /submit-design", "POST", "/submit-design", json={
+                "playground_image_data_base64": image,
+                "toy_image_data_base64": image,
+                "activity_description": description,
+            })
+        if response.status_code != 200:
+            return
+        submission_id = response.json()["_id"]
+        await timed("GET /feedback/{id}", "GET", f"/feedback/{submission_id}")
+        # Suggestions are generated by a background job, so poll (or long-poll) until they exist
+        url = f"/improvement-suggestions/{submission_id}" + (f"?wait={SUGGESTIONS_WAIT_SECONDS}" if long_poll else "")
+        deadline = time.monotonic() + SUGGESTIONS_TIMEOUT_SECONDS
+        while time.monotonic() < deadline:
+            response = await timed("GET /improvement-suggestions/{id}", "GET", url)
+            if response.status_code != 404:
+                break
+            if not long_poll:
+                await asyncio.sleep(SUGGESTIONS_POLL_SECONDS)
+        if response.status_code == 200:
+            latencies["suggestions ready"].append(time.perf_counter() - submitted_at)
+            statuses["suggestions ready"][200] += 1
+
+    async def runner() -> None:
+        for i in counter:
+            await scenario(i)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*[runner() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started_at
+
+    endpoints = {}
+    for name, values in latencies.items():
+        values.sort()
+        endpoints[name] = {
+            "requests": len(values),
+            "statuses": dict(statuses[name]),
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+        }
+    return {
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "requests_per_second": sum(len(v) for k, v in latencies.items() if k != "suggestions ready") / elapsed,
+        "submissions_per_second": total / elapsed,
+        "endpoints": endpoints,
+    }
+
+def print_level(level: Dict) -> None:
+    print(f"\nconcurrency {level['concurrency']}: {level['submissions_per_second']:.1f} submissions/s, "
+          f"{level['requests_per_second']:.1f} requests/s")
+    for name, stats in level["endpoints"].items():
+        statuses = " ".join(f"{code}x{count}" for code, count in sorted(stats["statuses"].items()))
+        print(f"  {name:<36} p50 {stats['p50_ms']:8.1f} ms  p95 {stats['p95_ms']:8.1f} ms  "
+              f"p99 {stats['p99_ms']:8.1f} ms  [{statuses}]")
+
+def regressions(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Describes every level where p95 latency or throughput got worse than the baseline by more than tolerance.
+    """
+    found = []
+    baseline_levels = {level["concurrency"]: level for level in baseline["levels"]}
+    for level in results["levels"]:
+        base = baseline_levels.get(level["concurrency"])
+        if base is None:
+            continue
+        if level["submissions_per_second"] < base["submissions_per_second"] * (1 - tolerance):
+            found.append(f"concurrency {level['concurrency']}: throughput {level['submissions_per_second']:.1f}/s "
+                         f"vs {base['submissions_per_second']:.1f}/s")
+        for name, stats in level["endpoints"].items():
+            base_stats = base["endpoints"].get(name)
+            if base_stats and stats["p95_ms"] > base_stats["p95_ms"] * (1 + tolerance):
+                found.append(f"concurrency {level['concurrency']}: {name} p95 {stats['p95_ms']:.1f} ms "
+                             f"vs {base_stats['p95_ms']:.1f} ms")
+    return found
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,4,16,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=40, help="Submissions per concurrency level")
+    parser.add_argument("--latency", type=float, default=0.5, help="Median fake model latency in seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.3, help="Log-normal sigma of the model latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of model calls failing with a 500")
+    parser.add_argument("--mongo-uri", help="Use a real MongoDB (and a separate worker process) instead of mongomock")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression against the baseline")
+    parser.add_argument("--long-poll", action="store_true", help="Wait for the suggestions with ?wait= instead of polling")
+    args = parser.parse_args()
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    openai_port, api_port = free_port(), free_port()
+    image_dir = tempfile.mkdtemp(prefix="snapfeedback-loadtest-")
+    app_env = {
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "OPENAI_API_KEY": "fake",
+        "MONGO_URI": args.mongo_uri or "mongodb://unused",
+        "MONGO_DB_NAME": "snapfeedback_loadtest",
+        "IMAGE_STORE_BACKEND": "local",
+        "IMAGE_STORE_LOCAL_DIR": image_dir,
+        "JOB_POLL_INTERVAL_SECONDS": "0.2",
+        "WORKER_METRICS_PORT": "0",
+    }
+    processes = []
+    try:
+        fake_openai = start_server("benchmarks.fake_openai:app", openai_port, {
+            "FAKE_OPENAI_LATENCY_SECONDS": str(args.latency),
+            "FAKE_OPENAI_LATENCY_SIGMA": str(args.latency_sigma),
+            "FAKE_OPENAI_ERROR_RATE": str(args.error_rate),
+        })
+        processes.append(fake_openai)
+        if args.mongo_uri:
+            api = start_server("app.main:app", api_port, app_env)
+            processes.append(subprocess.Popen([sys.executable, "-m", "app.worker"], cwd=BACKEND_DIR, env={**os.environ, **app_env}))
+        else:
+            api = start_server("benchmarks.loadtest_app:app", api_port, app_env)
+        processes.append(api)
+        await wait_until_up(f"http://127.0.0.1:{openai_port}/stats", fake_openai)
+        await wait_until_up(f"http://127.0.0.1:{api_port}/", api)
+
+        image = make_image()
+        limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+        results = {"args": vars(args), "levels": []}
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{api_port}", limits=limits, timeout=300) as client:
+            for concurrency in levels:
+                level = await run_level(client, concurrency, args.requests, image, args.long_poll)
+                results["levels"].append(level)
+                print_level(level)
+
+        results["api_peak_rss_mb"] = peak_rss_mb(api.pid)
+        if results["api_peak_rss_mb"] is not None:
+            print(f"\nAPI peak RSS: {results['api_peak_rss_mb']:.0f} MB")
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+        shutil.rmtree(image_dir, ignore_errors=True)
+        if args.mongo_uri:
+            from pymongo import AsyncMongoClient
+            mongo = AsyncMongoClient(args.mongo_uri)
+            await mongo.drop_database("snapfeedback_loadtest")
+            await mongo.close()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for regression in found:
+            print(f"REGRESSION {regression}")
+        return 1 if found else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,46 @@
+"""
+The API backed by an in-memory mongomock database, with the job worker running
+in the same process since mongomock can't be shared between processes.
+Started by benchmarks.loadtest when no --mongo-uri is given:
+
+    MONGO_URI=mongodb://unused uvicorn benchmarks.loadtest_app:app
+
+LOADTEST_JOB_WORKER=false leaves the worker out, for benchmarks of the API alone.
+mongomock has no change streams; long polls are woken by the in-process worker.
+"""
+import os
+import asyncio
+from contextlib import asynccontextmanager
+from mongomock_motor import AsyncMongoMockClient
+
+os.environ.setdefault("CHANGE_STREAMS_ENABLED", "false")
+from app import database
+
+client = AsyncMongoMockClient()
+
+async def close() -> None:
+    # mongomock's close is not a coroutine
+    pass
+
+client.close = close
+# connect_to_mongo keeps an existing client, so the app picks this one up
+database.client = client
+
+from app import main, worker
+
+app = main.app
+app_lifespan = app.router.lifespan_context
+
+@asynccontextmanager
+async def lifespan(app):
+    async with app_lifespan(app):
+        if os.environ.get("LOADTEST_JOB_WORKER", "true") == "false":
+            yield
+            return
+        job_worker = worker.Worker(database.get_db())
+        task = asyncio.create_task(job_worker.run())
+        yield
+        job_worker.stopping.set()
+        await task
+
+app.router.lifespan_context = lifespan
@@ -0,0 +1,76 @@
+"""
+How far apart the perceptual hashes (images.dhash) of edited copies of the
+demo photos are from the original's, compared with the distance between
+different photos, and how long hashing a normalized image takes. Used to
+choose IMAGE_REUSE_MAX_DISTANCE.
+
+    python -m benchmarks.perceptual_hash [--images ../Demo_Images]
+"""
+import io
+import os
+import glob
+import time
+import argparse
+from typing import Dict
+
+from PIL import Image, ImageEnhance
+
+from app.core import images
+from app.core.config import settings
+
+def encode(img: Image.Image, quality: int = 85) -> bytes:
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+def variants(image_data: bytes) -> Dict[str, bytes]:
+    """
+    Edits a teacher resubmitting the same room might make.
+    """
+    img = Image.open(io.BytesIO(image_data))
+    w, h = img.size
+    return {
+        "re-encoded q40": encode(img, 40),
+        "half size": encode(img.resize((w // 2, h // 2))),
+        "brighter": encode(ImageEnhance.Brightness(img).enhance(1.2)),
+        "shifted 3%": encode(img.crop((int(w * 0.03), 0, w, h))),
+        "cropped 5%": encode(img.crop((int(w * 0.05), int(h * 0.05), w, h))),
+        "rotated 3deg": encode(img.rotate(3)),
+        "cropped 10%": encode(img.crop((int(w * 0.1), int(h * 0.1), w, h))),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    default_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "Demo_Images")
+    parser.add_argument("--images", default=default_dir, help="Directory searched recursively for photos")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    paths = sorted(
+        path for path in glob.glob(os.path.join(args.images, "**", "*"), recursive=True)
+        if path.lower().endswith((".jpg", ".jpeg", ".png"))
+    )
+    normalized = {
+        os.path.relpath(path, args.images): images.normalize_image(open(path, "rb").read(), settings.IMAGE_MAX_DIMENSION, settings.IMAGE_JPEG_QUALITY)
+        for path in paths
+    }
+    hashes = {name: images.dhash(image_data) for name, image_data in normalized.items()}
+
+    print(f"Hamming distance to the original (of 64 bits; reused up to {settings.IMAGE_REUSE_MAX_DISTANCE})")
+    for name, image_data in normalized.items():
+        distances = {edit: images.hamming_distance(hashes[name], images.dhash(data)) for edit, data in variants(image_data).items()}
+        print(f"  {name:<28}" + "  ".join(f"{edit} {distance:>2}" for edit, distance in distances.items()))
+
+    names = list(hashes)
+    unrelated = [images.hamming_distance(hashes[a], hashes[b]) for i, a in enumerate(names) for b in names[i + 1:]]
+    if unrelated:
+        print(f"Different photos: min {min(unrelated)}, max {max(unrelated)}")
+
+    image_data = next(iter(normalized.values()))
+    started_at = time.perf_counter()
+    for _ in range(args.iterations):
+        images.dhash(image_data)
+    print(f"dhash of a normalized image: {(time.perf_counter() - started_at) / args.iterations * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    main()
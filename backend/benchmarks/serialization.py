@@ -0,0 +1,108 @@
+"""
+CPU time per submit response for feedback validation and response serialization,
+comparing the previous path (parse_obj_as, model_dump per criterion,
+convert_objectids, then FastAPI validating and encoding the response_model)
+with schemas.validate_feedback and responses.model_response.
+
+    python -m benchmarks.serialization [--iterations N]
+"""
+import json
+import time
+import argparse
+from datetime import datetime
+from typing import Dict
+
+from bson import ObjectId
+from pydantic import TypeAdapter, parse_obj_as
+
+from app import schemas
+from app.core import responses
+
+def sample_feedback() -> Dict:
+    criteria = ["Narrative Setting", "Multi Sensory", "Boundary", "Movement and Layout", "Clean up and Resetting"]
+    return {
+        criterion: {
+            "score": 0.5,
+            "what_went_well": "The classroom features a variety of themed play zones, fostering imaginative play.",
+            "what_could_be_improved": "There is no clear overarching theme or story that ties the zones together.",
+        }
+        for criterion in criteria
+    }
+
+def sample_submission(playground_feedback: Dict, toy_feedback: Dict) -> Dict:
+    return {
+        "_id": ObjectId(),
+        "playground_image_url": "/images/3f2c9a.jpg",
+        "toy_image_url": "/images/81be07.jpg",
+        "playground_image_key": "3f2c9a.jpg",
+        "toy_image_key": "81be07.jpg",
+        "activity_description": "Children build a boat from recycled materials",
+        "playground_feedback": playground_feedback,
+        "toy_feedback": toy_feedback,
+        "status": "evaluated",
+        "evaluation_mode": "standard",
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow(),
+    }
+
+def convert_objectids(obj):
+    if isinstance(obj, dict):
+        return {k: convert_objectids(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [convert_objectids(i) for i in obj]
+    elif isinstance(obj, ObjectId):
+        return str(obj)
+    elif isinstance(obj, datetime):
+        return obj.isoformat()
+    else:
+        return obj
+
+# What FastAPI does with a returned dict when the endpoint has a response_model
+response_adapter = TypeAdapter(schemas.SubmissionResponse)
+
+def previous_path(playground_json: Dict, toy_json: Dict) -> bytes:
+    playground = parse_obj_as(Dict[str, schemas.CriterionFeedback], playground_json)
+    toy = parse_obj_as(Dict[str, schemas.CriterionFeedback], toy_json)
+    submission = sample_submission(
+        {k: v.model_dump() for k, v in playground.items()},
+        {k: v.model_dump() for k, v in toy.items()},
+    )
+    content = convert_objectids(submission)
+    validated = response_adapter.validate_python(content)
+    encoded = response_adapter.dump_python(validated, mode="json", by_alias=True)
+    return json.dumps(encoded, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+def current_path(playground_json: Dict, toy_json: Dict) -> bytes:
+    submission = sample_submission(
+        schemas.validate_feedback(playground_json),
+        schemas.validate_feedback(toy_json),
+    )
+    return responses.model_response(submission, schemas.SubmissionResponse).body
+
+def cpu_time(path, iterations: int) -> float:
+    playground_json, toy_json = sample_feedback(), sample_feedback()
+    path(playground_json, toy_json)
+    started_at = time.process_time()
+    for _ in range(iterations):
+        path(playground_json, toy_json)
+    return (time.process_time() - started_at) / iterations
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    previous = json.loads(previous_path(sample_feedback(), sample_feedback()))
+    current = json.loads(current_path(sample_feedback(), sample_feedback()))
+    assert previous.keys() == current.keys(), "responses differ"
+
+    previous_seconds = cpu_time(previous_path, args.iterations)
+    current_seconds = cpu_time(current_path, args.iterations)
+    print(f"{'path':<10} {'CPU us/response':>16}")
+    print(f"{'previous':<10} {previous_seconds * 1e6:>16.1f}")
+    print(f"{'current':<10} {current_seconds * 1e6:>16.1f}")
+    print(f"saved {(previous_seconds - current_seconds) * 1e6:.1f} us of CPU per response "
+          f"({previous_seconds / current_seconds:.1f}x faster)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Throughput of the API served as before (a single `uvicorn app.main:app`
+process with default options) and by the production launcher (app.serve:
+several workers, uvloop, httptools, SERVER_* options), under a closed-loop
+load of concurrent clients.
+
+    python -m benchmarks.server_throughput [--workers 2,4] [--concurrency 64] [--duration 15]
+
+Each worker uses its own in-memory mongomock database (see loadtest_app), so
+the load consists of requests that don't depend on earlier ones:
+- submit: POST /submit-design?async=true, which normalizes and stores the
+  images and queues the evaluation (no model calls)
+- read: GET /feedback/{id} of a submission that doesn't exist
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.loadtest import BACKEND_DIR, free_port, make_image, percentile, peak_rss_mb, wait_until_up
+
+MISSING_SUBMISSION = "/feedback/000000000000000000000000"
+
+def start_profile(profile: str, workers: int, port: int, image_dir: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "MONGO_URI": "mongodb://unused",
+        "OPENAI_API_KEY": "fake",
+        "LOADTEST_JOB_WORKER": "false",
+        "SERVER_PORT": str(port),
+        "SERVER_WORKERS": str(workers),
+        "SERVER_ACCESS_LOG": "false",
+        "IMAGE_STORE_LOCAL_DIR": image_dir,
+    }
+    if profile == "single":
+        command = ["-m", "uvicorn", "benchmarks.loadtest_app:app", "--port", str(port), "--no-access-log"]
+    else:
+        # app.serve's options, serving the mongomock app instead of app.main
+        command = ["-c", "import uvicorn; from app import serve; uvicorn.run('benchmarks.loadtest_app:app', **serve.server_options())"]
+    return subprocess.Popen([sys.executable, *command], cwd=BACKEND_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+async def drive(base_url: str, mix: str, concurrency: int, duration: float, image: str) -> Dict:
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def client_loop(client: httpx.AsyncClient, i: int) -> None:
+        nonlocal errors
+        n = 0
+        while time.monotonic() < deadline:
+            started_at = time.perf_counter()
+            if mix == "submit":
+                response = await client.post("/submit-design?async=true", json={
+                    "playground_image_data_base64": image,
+                    "toy_image_data_base64": image,
+                    "activity_description": f"Throughput benchmark {i}-{n}",
+                })
+                ok = response.status_code == 202
+            else:
+                response = await client.get(MISSING_SUBMISSION)
+                ok = response.status_code == 404
+            latencies.append(time.perf_counter() - started_at)
+            errors += not ok
+            n += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        started_at = time.perf_counter()
+        await asyncio.gather(*[client_loop(client, i) for i in range(concurrency)])
+        elapsed = time.perf_counter() - started_at
+    latencies.sort()
+    return {
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "errors": errors,
+    }
+
+def total_rss_mb(process: subprocess.Popen) -> float:
+    """
+    Peak RSS of the server and its worker processes (children of the supervisor).
+    """
+    pids = [process.pid]
+    children = f"/proc/{process.pid}/task/{process.pid}/children"
+    if os.path.exists(children):
+        with open(children) as f:
+            pids += [int(pid) for pid in f.read().split()]
+    return sum(peak_rss_mb(pid) or 0 for pid in pids)
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default=f"{os.cpu_count() or 1}", help="Comma-separated worker counts of the production profile")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds of load per profile and mix")
+    args = parser.parse_args()
+
+    # A small photo, so the submit mix isn't dominated by image processing
+    image = make_image(800, 600)
+    profiles = [("single", 1)] + [("production", int(w)) for w in args.workers.split(",")]
+    image_dir = tempfile.mkdtemp(prefix="snapfeedback-throughput-")
+    print(f"{'profile':<16}{'mix':<8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}{'RSS MB':>9}")
+    for profile, workers in profiles:
+        port = free_port()
+        process = start_profile(profile, workers, port, image_dir)
+        try:
+            await wait_until_up(f"http://127.0.0.1:{port}/", process)
+            # Give every worker time to finish its startup
+            await asyncio.sleep(1 + workers)
+            for mix in ("read", "submit"):
+                result = await drive(f"http://127.0.0.1:{port}", mix, args.concurrency, args.duration, image)
+                label = profile if profile == "single" else f"{profile} x{workers}"
+                print(f"{label:<16}{mix:<8}{result['requests_per_second']:>10.1f}{result['p50_ms']:>10.1f}"
+                      f"{result['p99_ms']:>10.1f}{result['errors']:>8}{total_rss_mb(process):>9.0f}")
+        finally:
+            process.terminate()
+            process.wait()
+    shutil.rmtree(image_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,133 @@
+"""
+Cold start of the API as deployed with uvicorn (app.main:app) and with Mangum
+(api/index.py), with and without LAZY_STARTUP. Each case runs in a fresh
+process against an in-memory mongomock database and reports the import time,
+the startup time (the lifespan, for uvicorn), the first requests and a warm
+request, and whether the openai SDK had to be loaded.
+
+    python -m benchmarks.startup [--repeat 3]
+
+Needs mongomock-motor (pip install mongomock-motor).
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+import statistics
+from typing import Dict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MISSING_SUBMISSION = "/feedback/000000000000000000000000"
+
+def use_mongomock() -> None:
+    """
+    Installs a mongomock client that stays connected across app shutdowns,
+    which mongomock can't reconnect. Eager Mangum would reconnect to a real
+    MongoDB on every invocation, so its numbers here are a lower bound.
+    """
+    from mongomock_motor import AsyncMongoMockClient
+    from app import database, main
+
+    async def close_mongo_connection() -> None:
+        pass
+
+    database.client = AsyncMongoMockClient()
+    main.close_mongo_connection = close_mongo_connection
+
+def api_gateway_event(path: str) -> Dict:
+    return {
+        "version": "2.0",
+        "routeKey": "$default",
+        "rawPath": path,
+        "rawQueryString": "",
+        "headers": {"host": "localhost"},
+        "requestContext": {
+            "http": {"method": "GET", "path": path, "protocol": "HTTP/1.1", "sourceIp": "127.0.0.1", "userAgent": "benchmark"},
+            "stage": "$default",
+        },
+        "isBase64Encoded": False,
+    }
+
+def run_mangum() -> Dict:
+    result = {}
+    started_at = time.perf_counter()
+    import api.index
+    result["import"] = time.perf_counter() - started_at
+    use_mongomock()
+    result["startup"] = 0.0
+    for name, path in [("first_request", "/"), ("first_db_request", MISSING_SUBMISSION), ("warm_request", MISSING_SUBMISSION)]:
+        started_at = time.perf_counter()
+        response = api.index.handler(api_gateway_event(path), None)
+        result[name] = time.perf_counter() - started_at
+        assert response["statusCode"] in (200, 404), response
+    return result
+
+async def run_uvicorn() -> Dict:
+    import httpx
+    import uvicorn
+
+    result = {}
+    started_at = time.perf_counter()
+    from app.main import app
+    result["import"] = time.perf_counter() - started_at
+    use_mongomock()
+
+    server = uvicorn.Server(uvicorn.Config(app, port=0, log_level="warning"))
+    started_at = time.perf_counter()
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.001)
+    result["startup"] = time.perf_counter() - started_at
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+        for name, path in [("first_request", "/"), ("first_db_request", MISSING_SUBMISSION), ("warm_request", MISSING_SUBMISSION)]:
+            started_at = time.perf_counter()
+            response = await client.get(path)
+            result[name] = time.perf_counter() - started_at
+            assert response.status_code in (200, 404), response.text
+    server.should_exit = True
+    await task
+    return result
+
+def child(deployment: str) -> None:
+    result = run_mangum() if deployment == "mangum" else asyncio.run(run_uvicorn())
+    result["openai_loaded"] = "openai" in sys.modules
+    print(json.dumps(result))
+
+def measure(deployment: str, lazy: bool) -> Dict:
+    env = {
+        **os.environ,
+        "MONGO_URI": "mongodb://unused",
+        "OPENAI_API_KEY": "fake",
+        "LAZY_STARTUP": "true" if lazy else "false",
+    }
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", "--child", deployment],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh processes per case; the median is reported")
+    parser.add_argument("--child", choices=["uvicorn", "mangum"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child)
+        return
+
+    columns = ["import", "startup", "first_request", "first_db_request", "warm_request"]
+    print(f"{'deployment':<20}" + "".join(f"{column:>18}" for column in columns) + f"{'openai loaded':>15}")
+    # api/index.py defaults LAZY_STARTUP to true; the eager case shows the previous behaviour
+    for deployment, lazy in [("uvicorn", False), ("uvicorn", True), ("mangum", False), ("mangum", True)]:
+        runs = [measure(deployment, lazy) for _ in range(args.repeat)]
+        label = f"{deployment} {'lazy' if lazy else 'eager'}"
+        cells = "".join(f"{statistics.median(run[column] for run in runs) * 1000:>15.1f} ms" for column in columns)
+        print(f"{label:<20}{cells}{str(runs[0]['openai_loaded']):>15}")
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,6 @@
 #!/bin/bash
-uvicorn app.main:app --host 0.0.0.0 --port 10000 
\ No newline at end of file
+# Starts the API only. The job worker (python -m app.worker) runs as its own
+# service so the platform restarts it when it dies, as in docker-compose.yml
+# One API worker per core, configured by the SERVER_* settings
+export SERVER_PORT=${SERVER_PORT:-10000}
+exec python -m app.serve
@@ -0,0 +1,74 @@
+"""
+Shared fixtures: an in-memory Mongo (mongomock), the OpenAI client pointed
+at benchmarks/fake_openai.py served in-process, and images stored in a
+temporary directory.
+"""
+import os
+
+# Settings are read on import, so these have to be set before any app module is loaded
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("OPENAI_API_KEY", "fake")
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from app import database
+from app.core import ai_models, storage
+from app.core.config import settings
+from app.core.ai_models import httpx
+from benchmarks import fake_openai
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+def db(monkeypatch):
+    """
+    An in-memory database, also installed as the process-wide client so that
+    code calling get_db() sees the same data.
+    """
+    client = AsyncMongoMockClient()
+    async def close():
+        pass
+    client.close = close
+    monkeypatch.setattr(database, "client", client)
+    monkeypatch.setattr(database, "connect_to_mongo", lambda: client)
+    return client[settings.MONGO_DB_NAME]
+
+@pytest.fixture
+async def openai_stub():
+    """
+    Routes the shared AsyncOpenAI client to the fake API and returns the
+    fake's request stats.
+    """
+    fake_openai.rate_limit_stats.update(accepted=0, rejected=0, errors=0)
+    fake_openai.rate_window.update(started_at=0.0, requests=0, tokens=0)
+    ai_models._client = AsyncOpenAI(
+        api_key="fake",
+        base_url="http://fake-openai/v1",
+        http_client=DefaultAsyncHttpxClient(transport=httpx.ASGITransport(app=fake_openai.app)),
+        max_retries=0,
+    )
+    yield fake_openai.rate_limit_stats
+    await ai_models.close_openai_client()
+
+@pytest.fixture
+def response_cache(db):
+    """
+    A fresh AI response cache backed by the test database, in place of the shared one.
+    """
+    cache = ai_models.AIResponseCache(max_entries=16, ttl_seconds=60)
+    cache.attach(db[ai_models.AI_RESPONSE_CACHE_COLLECTION])
+    original = ai_models.response_cache
+    ai_models.response_cache = cache
+    yield cache
+    ai_models.response_cache = original
+
+@pytest.fixture
+def image_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "IMAGE_STORE_LOCAL_DIR", str(tmp_path / "images"))
+    monkeypatch.setattr(storage, "_store", None)
+    yield storage.get_image_store()
+    storage._store = None
@@ -0,0 +1,34 @@
+import pytest
+
+from app import schemas
+from app.core import ai_models
+
+pytestmark = pytest.mark.anyio
+
+PROMPT = """Evaluate the image. Answer with JSON like:
+{
+  "Narrative Setting": {"score": 0, "what_went_well": "", "what_could_be_improved": ""}
+}"""
+
+IMAGE = "aGVsbG8="
+
+async def test_valid_response_is_cached(db, openai_stub, response_cache):
+    feedback = await ai_models.get_ai_feedback(IMAGE, "slide", PROMPT, "fake-model", validate=schemas.validate_feedback)
+    assert feedback["Narrative Setting"]["score"] == 0.5
+
+    again = await ai_models.get_ai_feedback(IMAGE, "slide", PROMPT, "fake-model", validate=schemas.validate_feedback)
+    assert again == feedback
+    assert openai_stub["accepted"] == 1
+    assert response_cache.memory_hits == 1
+    assert await db[ai_models.AI_RESPONSE_CACHE_COLLECTION].count_documents({}) == 1
+
+async def test_invalid_response_is_not_cached(db, openai_stub, response_cache):
+    # The fake answers with criterion objects, which aren't suggestion lists
+    for _ in range(2):
+        with pytest.raises(ai_models.InvalidAIResponseError):
+            await ai_models.get_ai_feedback(
+                IMAGE, "slide", PROMPT, "fake-model", validate=schemas.CRITERIA_SUGGESTIONS.validate_python
+            )
+    assert openai_stub["accepted"] == 2
+    assert response_cache.entries == {}
+    assert await db[ai_models.AI_RESPONSE_CACHE_COLLECTION].count_documents({}) == 0
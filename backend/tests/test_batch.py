@@ -0,0 +1,89 @@
+import base64
+import io
+
+import httpx
+import pytest
+from PIL import Image
+
+from app import crud, jobs, main, worker
+from app.core.config import settings
+from benchmarks import fake_openai
+
+pytestmark = pytest.mark.anyio
+
+def image_data_url(color: str) -> str:
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(buf, "JPEG")
+    return "data:image/jpeg;base64," + base64.b64encode(buf.getvalue()).decode()
+
+ITEM = {
+    "playground_images_data_base64": [image_data_url("red"), image_data_url("green")],
+    "toy_images_data_base64": [image_data_url("blue")],
+    "activity_description": "Block building",
+}
+
+@pytest.fixture
+async def api(db, openai_stub, image_store, monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_POLL_INTERVAL_SECONDS", 0)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        yield client
+
+@pytest.fixture
+def batch_in_progress(monkeypatch):
+    """
+    Keeps the stub's batches running until the returned function is called.
+    """
+    run_batch = fake_openai.run_batch
+    monkeypatch.setattr(fake_openai, "run_batch", lambda batch: None)
+    return lambda: monkeypatch.setattr(fake_openai, "run_batch", run_batch)
+
+async def run_next_job(db):
+    job_worker = worker.Worker(db, concurrency=1)
+    job = await jobs.claim_next_job(db, worker_id=job_worker.worker_id, job_types=[jobs.INGEST_BATCH_JOB])
+    await job_worker.semaphore.acquire()
+    await job_worker.run_job(job)
+    return job
+
+async def test_batch_is_submitted_and_ingested(db, api):
+    response = await api.post("/submit-batch", json={"items": [ITEM, ITEM]})
+    assert response.status_code == 202
+    batch_job = response.json()
+    assert batch_job["request_count"] == 4
+    assert batch_job["openai_batch_id"] in fake_openai.batches
+    for submission_id in batch_job["submission_ids"]:
+        assert (await crud.get_submission(db, submission_id=submission_id))["status"] == "evaluating"
+
+    await run_next_job(db)
+
+    batch_job = (await api.get(f"/batches/{batch_job['_id']}")).json()
+    assert batch_job["status"] == "completed"
+    assert batch_job["ingested_at"] is not None
+    for submission_id in batch_job["submission_ids"]:
+        feedback = (await api.get(f"/feedback/{submission_id}")).json()
+        assert feedback["status"] == "evaluated"
+        assert feedback["playground_feedback"] and feedback["toy_feedback"]
+    assert await db[jobs.JOB_COLLECTION].count_documents({"type": jobs.IMPROVEMENT_SUGGESTIONS_JOB}) == 2
+
+async def test_unfinished_batch_reschedules_its_ingest_job(db, api, batch_in_progress):
+    batch_job = (await api.post("/submit-batch", json={"items": [ITEM]})).json()
+
+    first = await run_next_job(db)
+    assert await db[jobs.JOB_COLLECTION].count_documents({"type": jobs.INGEST_BATCH_JOB}) == 1
+    stored = await jobs.get_job(db, job_id=str(first["_id"]))
+    assert (stored["status"], stored["attempts"]) == ("queued", 0)
+    assert (await api.get(f"/batches/{batch_job['_id']}")).json()["ingested_at"] is None
+
+    batch_in_progress()
+    second = await run_next_job(db)
+    assert second["_id"] == first["_id"]
+    assert (await jobs.get_job(db, job_id=str(first["_id"])))["status"] == "completed"
+    assert (await api.get(f"/batches/{batch_job['_id']}")).json()["ingested_at"] is not None
+
+async def test_deleted_submissions_are_counted_as_missing(db, api):
+    batch_job = (await api.post("/submit-batch", json={"items": [ITEM, ITEM]})).json()
+    await db[crud.SUBMISSION_COLLECTION].delete_one({"_id": crud.submission_query(batch_job["submission_ids"][0])["_id"]})
+
+    await run_next_job(db)
+    batch_job = (await api.get(f"/batches/{batch_job['_id']}")).json()
+    assert batch_job["missing_submissions"] == 1
+    assert (await crud.get_submission(db, submission_id=batch_job["submission_ids"][1]))["status"] == "evaluated"
@@ -0,0 +1,64 @@
+import pytest
+from fastapi import HTTPException
+
+from app import crud, evaluation, main, worker
+from app.core import ai_models
+from app.core.config import settings
+
+pytestmark = pytest.mark.anyio
+
+FEEDBACK = {"Boundary": {"score": 1, "what_went_well": "a", "what_could_be_improved": "b"}}
+
+@pytest.fixture(autouse=True)
+def invalid_toy_answers(monkeypatch):
+    """
+    The model answers the fused playground prompt and gives an invalid answer to the toy prompt.
+    """
+    async def get_fused_feedback(images_data_base64, evaluation_prompt, **kwargs):
+        if evaluation_prompt == settings.AI_TOY_PROMPT:
+            raise ai_models.InvalidAIResponseError(ValueError("not a criterion"))
+        return {"evaluation": FEEDBACK, "improvement_suggestions": {}}
+    monkeypatch.setattr(ai_models, "get_fused_feedback", get_fused_feedback)
+
+@pytest.fixture
+def stub_images(monkeypatch):
+    async def load_images_base64(image_keys):
+        return ["aGVsbG8="] * len(image_keys)
+    monkeypatch.setattr(worker, "load_images_base64", load_images_base64)
+
+async def stored_submission(db, submission_data):
+    return await crud.create_submission(db, submission_data={
+        "activity_description": None,
+        "playground_feedback": None,
+        "toy_feedback": None,
+        "status": "evaluating",
+        "evaluation_mode": evaluation.FUSED_MODE,
+        **submission_data,
+    })
+
+async def test_failed_single_image_request_stores_failed(db):
+    submission = await stored_submission(db, {"playground_image_url": "p", "toy_image_url": "t"})
+    with pytest.raises(HTTPException) as exc_info:
+        await main.evaluate_submission(db, submission, b"p", b"t", None, evaluation.FUSED_MODE)
+    assert exc_info.value.status_code == 500
+
+    stored = await crud.get_submission(db, submission_id=str(submission["_id"]))
+    assert (stored["status"], stored["playground_feedback"]) == ("failed", FEEDBACK)
+
+async def test_multi_image_request_keeps_the_set_that_was_evaluated(db):
+    submission = await stored_submission(db, {"playground_image_urls": ["p"], "toy_image_urls": ["t"]})
+    response = await main.evaluate_submission_multi(db, submission, [b"p"], [b"t"], None, evaluation.FUSED_MODE)
+    assert response.status_code == 200
+
+    stored = await crud.get_submission(db, submission_id=str(submission["_id"]))
+    assert (stored["status"], stored["playground_feedback"]) == ("evaluated", FEEDBACK)
+
+@pytest.mark.parametrize("attempts, status", [(1, "evaluating"), (3, "failed")])
+async def test_single_image_job_is_not_evaluated_until_both_sets_are(db, stub_images, attempts, status):
+    submission = await stored_submission(db, {"playground_image_url": "p", "toy_image_url": "t"})
+    job = {"payload": {"submission_id": str(submission["_id"])}, "attempts": attempts, "max_attempts": 3}
+    with pytest.raises(ai_models.InvalidAIResponseError):
+        await worker.run_evaluate_submission_job(db, job)
+
+    stored = await crud.get_submission(db, submission_id=str(submission["_id"]))
+    assert (stored["status"], stored["playground_feedback"]) == (status, FEEDBACK)
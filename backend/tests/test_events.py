@@ -0,0 +1,87 @@
+import base64
+import io
+import json
+
+import httpx
+import pytest
+from PIL import Image
+
+from app import crud, jobs, main, schemas
+from app.core.config import settings
+
+pytestmark = pytest.mark.anyio
+
+def image_data_url(color: str) -> str:
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(buf, "JPEG")
+    return "data:image/jpeg;base64," + base64.b64encode(buf.getvalue()).decode()
+
+def parse_events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+@pytest.fixture
+async def api(db, openai_stub, image_store, monkeypatch):
+    monkeypatch.setattr(settings, "SSE_POLL_INTERVAL_SECONDS", 0.01)
+    monkeypatch.setattr(crud.document_cache, "ttl_seconds", 0)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        yield client
+
+async def test_streamed_evaluation_sends_criteria_then_the_stored_submission(db, api):
+    response = await api.post("/submit-design-multi-stream", json={
+        "playground_images_data_base64": [image_data_url("red")],
+        "toy_images_data_base64": [image_data_url("blue")],
+    })
+    events = parse_events(response.text)
+    names = [name for name, _ in events]
+    assert names[0] == "submission"
+    assert names[-1] == "done"
+    assert names.count("feedback_complete") == 2
+    criteria = [data for name, data in events if name == "criterion"]
+    assert {data["feedback_type"] for data in criteria} == {"playground_feedback", "toy_feedback"}
+
+    done = events[-1][1]
+    assert set(done) == {field.alias or name for name, field in schemas.SubmissionResponseMulti.model_fields.items()}
+    assert done["status"] == "evaluated"
+    assert done["playground_feedback"] == {
+        data["criterion"]: data["feedback"] for data in criteria if data["feedback_type"] == "playground_feedback"
+    }
+    assert await db[jobs.JOB_COLLECTION].count_documents({"type": jobs.IMPROVEMENT_SUGGESTIONS_JOB}) == 1
+
+async def test_events_send_feedback_and_suggestions_without_internal_fields(db, api):
+    submission = await crud.create_submission(db, submission_data={
+        "playground_image_url": "/images/p.jpeg",
+        "toy_image_url": "/images/t.jpeg",
+        "playground_image_hashes": ["0" * 16],
+        "image_hash_bands": ["playground:0:00"],
+        "playground_feedback": {"Boundary": {"score": 1, "what_went_well": "a", "what_could_be_improved": "b"}},
+        "toy_feedback": None,
+        "status": "evaluated",
+    })
+    submission_id = str(submission["_id"])
+    await crud.update_improvement_suggestions(db, submission_id=submission_id, suggestions_data={
+        "playground_suggestions": {"Boundary": ["Add a rug"]},
+    })
+    await db[crud.IMPROVEMENT_SUGGESTIONS_COLLECTION].update_one({}, {"$set": {"job_id": "internal"}})
+
+    events = parse_events((await api.get(f"/feedback/{submission_id}/events")).text)
+    assert [name for name, _ in events] == ["status", "playground_feedback", "improvement_suggestions"]
+    suggestions = events[-1][1]
+    assert set(suggestions) == {field.alias or name for name, field in schemas.ImprovementSuggestionsResponse.model_fields.items()}
+    assert suggestions["playground_suggestions"] == {"Boundary": ["Add a rug"]}
+
+async def test_events_end_with_an_error_when_the_submission_is_deleted(db, api):
+    submission = await crud.create_submission(db, submission_data={
+        "playground_image_url": "/images/p.jpeg",
+        "toy_image_url": "/images/t.jpeg",
+        "status": "evaluating",
+    })
+    events = main.feedback_events(db, str(submission["_id"]))
+    assert await anext(events) == main.sse_event("status", {"status": "evaluating"})
+
+    await db[crud.SUBMISSION_COLLECTION].delete_one({"_id": submission["_id"]})
+    assert [event async for event in events] == [main.sse_event("error", {"detail": "Submission not found"})]
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from app import idempotency
+
+pytestmark = pytest.mark.anyio
+
+def counting_handler(calls, status_code=200):
+    async def handler():
+        calls.append(1)
+        return JSONResponse({"_id": f"submission-{len(calls)}"}, status_code=status_code)
+    return handler
+
+async def test_duplicate_gets_the_stored_response(db):
+    calls = []
+    first = await idempotency.run_once(
+        db, key="key:test:abc", fingerprint="f", ttl_seconds=60, handler=counting_handler(calls)
+    )
+    replayed = await idempotency.run_once(
+        db, key="key:test:abc", fingerprint="f", ttl_seconds=60, handler=counting_handler(calls)
+    )
+    assert len(calls) == 1
+    assert "Idempotent-Replayed" not in first.headers
+    assert replayed.headers["Idempotent-Replayed"] == "true"
+    assert replayed.status_code == 200
+    assert json.loads(replayed.body) == json.loads(first.body) == {"_id": "submission-1"}
+
+async def test_key_reused_for_a_different_payload_is_rejected(db):
+    await idempotency.run_once(db, key="key:test:abc", fingerprint="f", ttl_seconds=60, handler=counting_handler([]))
+    with pytest.raises(HTTPException) as error:
+        await idempotency.run_once(db, key="key:test:abc", fingerprint="g", ttl_seconds=60, handler=counting_handler([]))
+    assert error.value.status_code == 422
+
+async def test_failed_request_releases_its_key(db):
+    calls = []
+    failed = await idempotency.run_once(
+        db, key="key:test:abc", fingerprint="f", ttl_seconds=60, handler=counting_handler(calls, status_code=500)
+    )
+    assert failed.status_code == 500
+    assert await db[idempotency.IDEMPOTENCY_COLLECTION].find_one({"_id": "key:test:abc"}) is None
+
+    retried = await idempotency.run_once(
+        db, key="key:test:abc", fingerprint="f", ttl_seconds=60, handler=counting_handler(calls)
+    )
+    assert len(calls) == 2
+    assert retried.status_code == 200
+    assert "Idempotent-Replayed" not in retried.headers
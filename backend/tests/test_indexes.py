@@ -0,0 +1,115 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from pymongo import IndexModel
+
+from app import crud, indexes, jobs
+from app.core.config import settings
+
+pytestmark = pytest.mark.anyio
+
+DAY = 24 * 60 * 60
+
+async def created_at_index(db):
+    return (await db[crud.SUBMISSION_COLLECTION].index_information()).get(indexes.CREATED_AT_INDEX)
+
+@pytest.fixture
+def commands(db, monkeypatch):
+    """
+    Records database commands and applies collMod like the server would,
+    since mongomock doesn't implement it.
+    """
+    sent = []
+    async def command(spec):
+        sent.append(spec)
+        collection = db[spec["collMod"]]
+        await collection.drop_index(spec["index"]["name"])
+        await collection.create_indexes([
+            IndexModel(indexes.CREATED_AT_KEY, expireAfterSeconds=spec["index"]["expireAfterSeconds"]),
+        ])
+        return {"ok": 1}
+    monkeypatch.setattr(db, "command", command)
+    return sent
+
+async def test_indexes_are_created(db):
+    await indexes.ensure_indexes(db)
+    for collection_name, models in indexes.collection_indexes().items():
+        existing = await db[collection_name].index_information()
+        assert {model.document["name"] for model in models} <= set(existing)
+    assert "expireAfterSeconds" not in await created_at_index(db)
+
+async def test_retention_creates_a_ttl_index(db, monkeypatch):
+    monkeypatch.setattr(settings, "DATA_RETENTION_DAYS", 30)
+    await indexes.ensure_indexes(db)
+    assert (await created_at_index(db))["expireAfterSeconds"] == 30 * DAY
+
+async def test_changed_retention_is_applied_in_place(db, monkeypatch, commands):
+    monkeypatch.setattr(settings, "DATA_RETENTION_DAYS", 30)
+    await indexes.ensure_indexes(db)
+    monkeypatch.setattr(settings, "DATA_RETENTION_DAYS", 60)
+    await indexes.ensure_indexes(db)
+    assert commands == [
+        {"collMod": name, "index": {"name": indexes.CREATED_AT_INDEX, "expireAfterSeconds": 60 * DAY}}
+        for name in indexes.RETENTION_COLLECTIONS
+    ]
+    assert (await created_at_index(db))["expireAfterSeconds"] == 60 * DAY
+
+async def test_enabling_retention_is_applied_in_place(db, monkeypatch, commands):
+    await indexes.ensure_indexes(db)
+    monkeypatch.setattr(settings, "DATA_RETENTION_DAYS", 7)
+    await indexes.ensure_indexes(db)
+    assert [spec["index"]["expireAfterSeconds"] for spec in commands] == [7 * DAY] * len(indexes.RETENTION_COLLECTIONS)
+    assert (await created_at_index(db))["expireAfterSeconds"] == 7 * DAY
+
+async def test_disabling_retention_removes_the_ttl(db, monkeypatch, commands):
+    monkeypatch.setattr(settings, "DATA_RETENTION_DAYS", 30)
+    await indexes.ensure_indexes(db)
+    monkeypatch.setattr(settings, "DATA_RETENTION_DAYS", 0)
+    await indexes.ensure_indexes(db)
+    assert "expireAfterSeconds" not in await created_at_index(db)
+    assert commands == []
+
+async def test_legacy_created_at_index_is_replaced(db):
+    await db[crud.SUBMISSION_COLLECTION].create_index([("created_at", -1)])
+    await indexes.ensure_indexes(db)
+    existing = await db[crud.SUBMISSION_COLLECTION].index_information()
+    assert indexes.LEGACY_CREATED_AT_INDEX not in existing
+    assert indexes.CREATED_AT_INDEX in existing
+
+async def test_conflict_is_raised_after_trying_every_collection(db):
+    suggestions = db[crud.IMPROVEMENT_SUGGESTIONS_COLLECTION]
+    await suggestions.insert_many([{"submission_id": "same"}, {"submission_id": "same"}])
+    with pytest.raises(indexes.IndexConflictError, match=crud.IMPROVEMENT_SUGGESTIONS_COLLECTION):
+        await indexes.ensure_indexes(db)
+    assert "status_1_run_at_1" in await db[jobs.JOB_COLLECTION].index_information()
+
+async def test_ensure_command_reports_conflicts(db):
+    assert await indexes.main("ensure") == 0
+    await db[crud.IMPROVEMENT_SUGGESTIONS_COLLECTION].drop()
+    await db[crud.IMPROVEMENT_SUGGESTIONS_COLLECTION].insert_many([{"submission_id": "same"}, {"submission_id": "same"}])
+    assert await indexes.main("ensure") == 1
+
+def test_plan_stages_finds_collection_scans():
+    plan = {
+        "stage": "SHARD_MERGE",
+        "shards": [
+            {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}},
+            {"winningPlan": {"stage": "SUBPLAN", "inputStage": {"stage": "OR", "inputStages": [
+                {"stage": "IXSCAN"}, {"stage": "COLLSCAN"},
+            ]}}},
+        ],
+    }
+    assert indexes.plan_stages(plan) == ["SHARD_MERGE", "FETCH", "IXSCAN", "SUBPLAN", "OR", "IXSCAN", "COLLSCAN"]
+
+@pytest.mark.skipif(not os.environ.get("TEST_MONGO_URI"), reason="needs a scratch MongoDB in TEST_MONGO_URI")
+def test_check_command_finds_no_collection_scans():
+    # mongomock can't explain queries, so the query plans are checked against a real server
+    result = subprocess.run(
+        [sys.executable, "-m", "app.indexes", "check"],
+        env={**os.environ, "MONGO_URI": os.environ["TEST_MONGO_URI"], "MONGO_DB_NAME": "snapfeedback_index_check"},
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
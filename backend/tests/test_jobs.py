@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import jobs
+
+pytestmark = pytest.mark.anyio
+
+async def expire(db, job, **fields):
+    await db[jobs.JOB_COLLECTION].update_one({"_id": job["_id"]}, {"$set": fields})
+
+async def test_claim_takes_oldest_due_job_once(db):
+    first = await jobs.enqueue_job(db, job_type=jobs.EVALUATE_SUBMISSION_JOB, payload={"n": 1})
+    await jobs.enqueue_job(db, job_type=jobs.EVALUATE_SUBMISSION_JOB, payload={"n": 2})
+    await jobs.enqueue_job(db, job_type=jobs.EVALUATE_SUBMISSION_JOB, payload={"n": 3}, delay_seconds=60)
+
+    claimed = await jobs.claim_next_job(db, worker_id="a")
+    assert claimed["_id"] == first["_id"]
+    assert (claimed["status"], claimed["worker_id"], claimed["attempts"]) == ("running", "a", 1)
+
+    second = await jobs.claim_next_job(db, worker_id="b")
+    assert second["payload"] == {"n": 2}
+    # The delayed job isn't due yet
+    assert await jobs.claim_next_job(db, worker_id="c") is None
+
+async def test_claim_filters_job_types(db):
+    await jobs.enqueue_job(db, job_type=jobs.INGEST_BATCH_JOB, payload={})
+    assert await jobs.claim_next_job(db, worker_id="a", job_types=[jobs.EVALUATE_SUBMISSION_JOB]) is None
+    assert await jobs.claim_next_job(db, worker_id="a", job_types=[jobs.INGEST_BATCH_JOB]) is not None
+
+async def test_failed_attempt_is_retried_after_backoff_until_out_of_attempts(db):
+    await jobs.enqueue_job(db, job_type=jobs.EVALUATE_SUBMISSION_JOB, payload={}, max_attempts=2)
+
+    job = await jobs.claim_next_job(db, worker_id="a")
+    assert await jobs.fail_job(db, job=job, error="boom") == "queued"
+    stored = await jobs.get_job(db, job_id=str(job["_id"]))
+    assert stored["run_at"] > datetime.utcnow()
+    assert stored["last_error"] == "boom"
+    assert await jobs.claim_next_job(db, worker_id="a") is None
+
+    await expire(db, job, run_at=datetime.utcnow() - timedelta(seconds=1))
+    job = await jobs.claim_next_job(db, worker_id="b")
+    assert job["attempts"] == 2
+    assert await jobs.fail_job(db, job=job, error="boom again") == "failed"
+    assert (await jobs.get_job(db, job_id=str(job["_id"])))["status"] == "failed"
+    assert await jobs.claim_next_job(db, worker_id="c") is None
+
+async def test_expired_lease_is_reclaimed_and_the_old_owner_loses_it(db):
+    await jobs.enqueue_job(db, job_type=jobs.EVALUATE_SUBMISSION_JOB, payload={})
+    stale = await jobs.claim_next_job(db, worker_id="a")
+    assert await jobs.renew_lease(db, job=stale)
+
+    await expire(db, stale, lease_expires_at=datetime.utcnow() - timedelta(seconds=1))
+    current = await jobs.claim_next_job(db, worker_id="b")
+    assert (current["_id"], current["attempts"]) == (stale["_id"], 2)
+
+    # The first worker's writes no longer match its claim
+    assert not await jobs.renew_lease(db, job=stale)
+    assert not await jobs.complete_job(db, job=stale)
+    assert await jobs.fail_job(db, job=stale, error="late") is None
+
+    assert await jobs.complete_job(db, job=current)
+    stored = await jobs.get_job(db, job_id=str(current["_id"]))
+    assert (stored["status"], stored["worker_id"]) == ("completed", "b")
+
+async def test_expired_lease_on_last_attempt_is_failed_not_reclaimed(db):
+    await jobs.enqueue_job(db, job_type=jobs.EVALUATE_SUBMISSION_JOB, payload={}, max_attempts=1)
+    job = await jobs.claim_next_job(db, worker_id="a")
+    assert await jobs.fail_expired_job(db) is None
+
+    await expire(db, job, lease_expires_at=datetime.utcnow() - timedelta(seconds=1))
+    assert await jobs.claim_next_job(db, worker_id="b") is None
+    failed = await jobs.fail_expired_job(db)
+    assert failed["_id"] == job["_id"]
+    assert failed["status"] == "failed"
+    assert await jobs.fail_expired_job(db) is None
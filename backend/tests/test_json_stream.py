@@ -0,0 +1,47 @@
+import json
+
+from app.core.json_stream import JSONObjectStreamParser
+
+FEEDBACK = {
+    "Narrative Setting": {"score": 1, "what_went_well": "A {castle}, with \"towers\"", "what_could_be_improved": "[none]"},
+    "Boundary": {"score": 0.5, "what_went_well": "back\\slash", "what_could_be_improved": "Add, a rug"},
+    "Tags": ["a", "b,c"],
+    "Count": 3,
+}
+
+def feed_by_character(text):
+    """
+    Feeds text one character at a time and returns each member with the
+    length of text fed when it was returned.
+    """
+    parser = JSONObjectStreamParser()
+    return [(key, value, position + 1) for position, char in enumerate(text) for key, value in parser.feed(char)]
+
+def test_members_match_the_parsed_object():
+    text = json.dumps(FEEDBACK, indent=2)
+    members = feed_by_character(text)
+    assert {key: value for key, value, _ in members} == FEEDBACK
+    assert [key for key, _, _ in members] == list(FEEDBACK)
+
+def test_object_members_are_returned_as_soon_as_they_close():
+    text = json.dumps(FEEDBACK)
+    for key, value, fed in feed_by_character(text):
+        if isinstance(value, (dict, list)):
+            assert text[:fed].endswith(json.dumps(value))
+
+def test_scalar_members_wait_for_the_next_comma_or_the_end():
+    parser = JSONObjectStreamParser()
+    assert parser.feed('{"a": 12') == []
+    assert parser.feed('3, "b": tr') == [("a", 123)]
+    assert parser.feed('ue}') == [("b", True)]
+
+def test_text_after_the_object_is_ignored():
+    parser = JSONObjectStreamParser()
+    assert parser.feed('{"a": {"b": 1}}\n\n{"c": 2}') == [("a", {"b": 1})]
+    assert parser.finished
+    assert parser.feed('{"d": 3}') == []
+
+def test_empty_object_has_no_members():
+    parser = JSONObjectStreamParser()
+    assert parser.feed("{ }") == []
+    assert parser.finished
@@ -0,0 +1,23 @@
+import os
+import subprocess
+import sys
+
+from app.core import metrics
+
+def test_live_gauges_of_dead_processes_are_removed(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    # A worker that exits without running its shutdown, like one that was killed
+    subprocess.run(
+        [sys.executable, "-c", "from app.core import metrics; metrics.SCHEDULER_IN_FLIGHT.inc(3); metrics.JOBS.labels('evaluate_submission', 'succeeded').inc()"],
+        check=True,
+        env={**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)},
+    )
+    assert b"snapfeedback_openai_in_flight 3.0" in metrics.render()[0]
+
+    metrics.remove_dead_processes()
+    files = os.listdir(tmp_path)
+    assert not [name for name in files if name.startswith("gauge_live")]
+    assert [name for name in files if name.startswith("counter_")]
+    output = metrics.render()[0]
+    assert b"snapfeedback_openai_in_flight 3.0" not in output
+    assert b'snapfeedback_jobs_total{job_type="evaluate_submission",outcome="succeeded"} 1.0' in output
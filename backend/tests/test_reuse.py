@@ -0,0 +1,60 @@
+import pytest
+from pydantic import ValidationError
+
+from app import reuse
+from app.core.config import Settings, settings, IMAGE_HASH_BANDS
+
+pytestmark = pytest.mark.anyio
+
+HASH = "0123456789abcdef"
+
+def flip_bits(image_hash: str, bands: int) -> str:
+    """
+    Flips the lowest bit of the first `bands` 8-bit bands of a hash.
+    """
+    value = int(image_hash, 16)
+    for band in range(bands):
+        value ^= 1 << (63 - band * 8 - 7)
+    return f"{value:016x}"
+
+@pytest.fixture
+def reuse_enabled(monkeypatch):
+    monkeypatch.setattr(settings, "IMAGE_REUSE_ENABLED", True)
+    monkeypatch.setattr(settings, "IMAGE_REUSE_MAX_DISTANCE", IMAGE_HASH_BANDS - 1)
+
+async def store_evaluated(db, playground_hashes, toy_hashes):
+    await db["submissions"].insert_one({
+        "status": "evaluated",
+        "activity_description": "slide",
+        "playground_feedback": {"Boundary": {"score": 1}},
+        "toy_feedback": {"Boundary": {"score": 0}},
+        **reuse.hash_fields(playground_hashes, toy_hashes),
+    })
+
+def test_max_distance_must_stay_below_the_band_count():
+    assert Settings(IMAGE_REUSE_MAX_DISTANCE=IMAGE_HASH_BANDS - 1).IMAGE_REUSE_MAX_DISTANCE == IMAGE_HASH_BANDS - 1
+    with pytest.raises(ValidationError):
+        Settings(IMAGE_REUSE_MAX_DISTANCE=IMAGE_HASH_BANDS)
+    with pytest.raises(ValidationError):
+        Settings(IMAGE_REUSE_MAX_DISTANCE=-1)
+
+def test_hashes_below_the_band_count_apart_share_a_band():
+    near = flip_bits(HASH, IMAGE_HASH_BANDS - 1)
+    far = flip_bits(HASH, IMAGE_HASH_BANDS)
+    assert set(reuse.hash_bands("toy", [HASH])) & set(reuse.hash_bands("toy", [near]))
+    assert not set(reuse.hash_bands("toy", [HASH])) & set(reuse.hash_bands("toy", [far]))
+
+async def test_feedback_is_reused_up_to_the_max_distance(db, reuse_enabled):
+    await store_evaluated(db, [flip_bits(HASH, IMAGE_HASH_BANDS - 1)], [flip_bits(HASH, IMAGE_HASH_BANDS)])
+    found = await reuse.find_reusable_feedback(
+        db, playground_hashes=[HASH], toy_hashes=[HASH], activity_description="slide"
+    )
+    assert set(found) == {"playground_feedback"}
+    assert found["playground_feedback"][1] == {"Boundary": {"score": 1}}
+
+async def test_feedback_is_not_reused_for_another_description(db, reuse_enabled):
+    await store_evaluated(db, [HASH], [HASH])
+    found = await reuse.find_reusable_feedback(
+        db, playground_hashes=[HASH], toy_hashes=[HASH], activity_description="swing"
+    )
+    assert found == {}
@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+import pytest
+from openai import InternalServerError
+
+from app.core import ai_models, scheduler
+from benchmarks import fake_openai
+
+pytestmark = pytest.mark.anyio
+
+def make_scheduler(**overrides) -> scheduler.OpenAIScheduler:
+    options = dict(
+        initial_concurrency=4, min_concurrency=1, max_concurrency=8,
+        max_retries=3, retry_base_seconds=0.01, retry_max_seconds=0.05,
+    )
+    return scheduler.OpenAIScheduler(**{**options, **overrides})
+
+def completion(label: str = "hi", calls: list = None):
+    """
+    A request factory for a small chat completion, recording when it is sent.
+    """
+    async def request():
+        if calls is not None:
+            calls.append(label)
+        return await ai_models.get_openai_client().chat.completions.with_raw_response.create(
+            model="fake-model", messages=[{"role": "user", "content": label}], max_tokens=10
+        )
+    return request
+
+@pytest.fixture
+def rate_limits(monkeypatch):
+    """
+    Sets the fake API's requests-per-window limit, with a short window.
+    """
+    def set_limits(rpm: int, window_seconds: float = 0.3):
+        monkeypatch.setattr(fake_openai, "RPM_LIMIT", rpm)
+        monkeypatch.setattr(fake_openai, "RATE_WINDOW_SECONDS", window_seconds)
+    return set_limits
+
+def test_reset_durations_are_parsed():
+    assert scheduler.parse_reset_duration("20ms") == pytest.approx(0.02)
+    assert scheduler.parse_reset_duration("6m0s") == 360
+    assert scheduler.parse_reset_duration("1.5s") == 1.5
+    assert scheduler.parse_reset_duration("") is None
+    assert scheduler.parse_reset_duration("soon") is None
+
+async def test_budgets_are_read_from_the_rate_limit_headers(openai_stub, rate_limits):
+    rate_limits(rpm=10)
+    calls = make_scheduler()
+    await calls.call(completion(), estimated_tokens=50)
+    assert calls.remaining_requests == 9
+    assert calls.remaining_tokens == fake_openai.UNLIMITED - fake_openai.request_tokens(
+        {"messages": [{"role": "user", "content": "hi"}], "max_tokens": 10}
+    )
+
+async def test_exhausted_request_budget_holds_calls_until_the_reset(openai_stub, rate_limits):
+    rate_limits(rpm=1)
+    calls = make_scheduler()
+    await calls.call(completion())
+    started_at = time.monotonic()
+    await calls.call(completion())
+    # The second call waited for the window to reset instead of being sent and rejected
+    assert time.monotonic() - started_at >= 0.2
+    assert openai_stub["rejected"] == 0
+    assert calls.stats()["rate_limited"] == 0
+
+async def test_rate_limited_calls_halve_concurrency_and_are_retried(openai_stub, rate_limits):
+    rate_limits(rpm=2)
+    calls = make_scheduler(initial_concurrency=4)
+    # Before any response there is no budget to go by, so all four are sent at once
+    results = await asyncio.gather(*[calls.call(completion()) for _ in range(4)])
+    assert all(result.choices for result in results)
+    assert openai_stub["rejected"] == 2
+    assert calls.rate_limited == 2
+    assert calls.retries == 2
+    assert calls.concurrency_limit < 4
+
+async def test_concurrency_grows_with_successful_calls(openai_stub):
+    calls = make_scheduler(initial_concurrency=2, max_concurrency=3)
+    for _ in range(10):
+        await calls.call(completion())
+    assert calls.stats()["concurrency_limit"] == 3
+
+async def test_server_errors_are_retried_until_the_limit(openai_stub, monkeypatch):
+    monkeypatch.setattr(fake_openai, "ERROR_RATE", 1.0)
+    calls = make_scheduler(max_retries=2)
+    with pytest.raises(InternalServerError):
+        await calls.call(completion())
+    assert openai_stub["errors"] == 3
+    assert calls.retries == 2
+
+async def test_interactive_calls_are_dispatched_before_queued_background_calls(openai_stub, monkeypatch):
+    monkeypatch.setattr(fake_openai, "LATENCY_SECONDS", 0.05)
+    calls = make_scheduler(initial_concurrency=1, max_concurrency=1)
+    sent = []
+
+    async def call(label: str, priority: int):
+        scheduler.current_priority.set(priority)
+        await calls.call(completion(label, sent))
+
+    first = asyncio.create_task(call("first", scheduler.INTERACTIVE))
+    await asyncio.sleep(0.01)
+    queued = [
+        asyncio.create_task(call("background", scheduler.BACKGROUND)),
+        asyncio.create_task(call("interactive", scheduler.INTERACTIVE)),
+    ]
+    await asyncio.sleep(0.01)
+    assert calls.stats()["queue_depth"] == {"interactive": 1, "background": 1}
+    await asyncio.gather(first, *queued)
+    assert sent == ["first", "interactive", "background"]
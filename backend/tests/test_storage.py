@@ -0,0 +1,77 @@
+import os
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from app.core import storage
+from app.core.config import settings
+
+pytestmark = pytest.mark.anyio
+
+IMAGE = b"\xff\xd8 not really a jpeg"
+
+@pytest.fixture
+def local_store(tmp_path):
+    return storage.LocalImageStore(str(tmp_path / "images"))
+
+@pytest.fixture
+def s3_store(monkeypatch):
+    monkeypatch.setattr(settings, "S3_ACCESS_KEY_ID", "test")
+    monkeypatch.setattr(settings, "S3_SECRET_ACCESS_KEY", "test")
+    with mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="images")
+        yield storage.S3ImageStore(bucket="images", region="us-east-1", prefix="uploads/")
+
+async def test_local_store_round_trips_by_content_key(local_store):
+    key = await local_store.put(IMAGE)
+    assert key == storage.ImageStore.make_key(IMAGE)
+    assert await local_store.put(IMAGE) == key
+    assert await local_store.get(key) == IMAGE
+    assert os.listdir(local_store.directory) == [key]
+
+async def test_local_store_rejects_keys_outside_its_directory(local_store):
+    with pytest.raises(ValueError):
+        await local_store.get("../secrets.txt")
+
+async def test_failed_local_write_leaves_no_temporary_file(local_store, monkeypatch):
+    def replace(source, destination):
+        raise OSError("disk full")
+    monkeypatch.setattr(storage.os, "replace", replace)
+    with pytest.raises(OSError):
+        await local_store.put(IMAGE)
+    assert os.listdir(local_store.directory) == []
+
+async def test_s3_store_round_trips_by_content_key(s3_store):
+    key = await s3_store.put(IMAGE)
+    assert key == storage.ImageStore.make_key(IMAGE)
+    assert await s3_store.put(IMAGE) == key
+    assert await s3_store.get(key) == IMAGE
+
+    objects = s3_store.client.list_objects_v2(Bucket="images")["Contents"]
+    assert [obj["Key"] for obj in objects] == [f"uploads/{key}"]
+    head = s3_store.client.head_object(Bucket="images", Key=f"uploads/{key}")
+    assert head["ContentType"] == "image/jpeg"
+
+async def test_s3_store_raises_for_missing_images(s3_store):
+    from botocore.exceptions import ClientError
+    with pytest.raises(ClientError):
+        await s3_store.get("missing.jpeg")
+
+def test_backend_is_chosen_by_settings(monkeypatch, tmp_path):
+    monkeypatch.setattr(storage, "_store", None)
+    monkeypatch.setattr(settings, "IMAGE_STORE_BACKEND", "local")
+    monkeypatch.setattr(settings, "IMAGE_STORE_LOCAL_DIR", str(tmp_path))
+    assert isinstance(storage.get_image_store(), storage.LocalImageStore)
+
+    monkeypatch.setattr(storage, "_store", None)
+    monkeypatch.setattr(settings, "IMAGE_STORE_BACKEND", "ftp")
+    with pytest.raises(ValueError):
+        storage.get_image_store()
+    monkeypatch.setattr(storage, "_store", None)
+
+def test_image_urls_use_the_public_base_url(monkeypatch):
+    store = storage.LocalImageStore.__new__(storage.LocalImageStore)
+    assert store.url_for("abc.jpeg") == "/images/abc.jpeg"
+    monkeypatch.setattr(settings, "IMAGE_STORE_PUBLIC_BASE_URL", "https://cdn.example.com/images/")
+    assert store.url_for("abc.jpeg") == "https://cdn.example.com/images/abc.jpeg"
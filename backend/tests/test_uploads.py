@@ -0,0 +1,49 @@
+import io
+
+import pytest
+from fastapi import HTTPException, UploadFile
+from PIL import Image
+
+from app import main
+from app.core import images
+from app.core.config import settings
+
+pytestmark = pytest.mark.anyio
+
+def jpeg_bytes(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+def upload(data, name="image.jpeg"):
+    return UploadFile(io.BytesIO(data), size=len(data), filename=name)
+
+async def test_uploads_are_normalized_one_part_at_a_time(monkeypatch):
+    batches = []
+    normalize_raw_images = images.normalize_raw_images
+    async def recording_normalize(raw_images):
+        batches.append(len(raw_images))
+        return await normalize_raw_images(raw_images)
+    monkeypatch.setattr(images, "normalize_raw_images", recording_normalize)
+
+    uploads = [upload(jpeg_bytes(color)) for color in ["red", "green", "blue"]]
+    normalized = await main.normalize_uploads(uploads)
+
+    assert batches == [1, 1, 1]
+    assert len(normalized) == 3
+    assert all(Image.open(io.BytesIO(image)).format == "JPEG" for image in normalized)
+    assert all(part.file.closed for part in uploads)
+
+async def test_oversized_part_is_rejected_before_any_is_read(monkeypatch):
+    monkeypatch.setattr(settings, "MAX_UPLOAD_BYTES", 100)
+    uploads = [upload(b"x" * 50, "small.jpeg"), upload(b"x" * 101, "big.jpeg")]
+    with pytest.raises(HTTPException) as exc_info:
+        await main.normalize_uploads(uploads)
+    assert exc_info.value.status_code == 413
+    assert "big.jpeg" in exc_info.value.detail
+    assert uploads[0].file.tell() == 0
+
+async def test_invalid_part_is_a_bad_request():
+    with pytest.raises(HTTPException) as exc_info:
+        await main.normalize_uploads([upload(jpeg_bytes("red")), upload(b"not an image")])
+    assert exc_info.value.status_code == 400
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from app import crud, jobs, worker
+from app.core import ai_models
+
+pytestmark = pytest.mark.anyio
+
+FEEDBACK = {"Boundary": {"score": 1, "what_went_well": "a", "what_could_be_improved": "b"}}
+
+@pytest.fixture
+def stub_images(monkeypatch):
+    async def load_images_base64(image_keys):
+        return ["aGVsbG8="] * len(image_keys)
+    monkeypatch.setattr(worker, "load_images_base64", load_images_base64)
+
+@pytest.fixture
+def invalid_toy_answers(monkeypatch):
+    """
+    The model answers the playground prompts and gives an invalid answer to the toy prompts.
+    """
+    async def get_feedback(prompt_base, **kwargs):
+        if prompt_base == worker.settings.AI_TOY_PROMPT:
+            raise ai_models.InvalidAIResponseError(ValueError("not a criterion"))
+        return FEEDBACK
+    async def get_ai_feedback(image_data_base64, **kwargs):
+        return await get_feedback(**kwargs)
+    async def get_ai_feedback_multi(images_data_base64, **kwargs):
+        return await get_feedback(**kwargs)
+    monkeypatch.setattr(ai_models, "get_ai_feedback", get_ai_feedback)
+    monkeypatch.setattr(ai_models, "get_ai_feedback_multi", get_ai_feedback_multi)
+
+async def queued_evaluation(db, submission_data):
+    submission = await crud.create_submission(db, submission_data={
+        "activity_description": None,
+        "playground_feedback": None,
+        "toy_feedback": None,
+        "status": "pending",
+        **submission_data,
+    })
+    await jobs.enqueue_job(db, job_type=jobs.EVALUATE_SUBMISSION_JOB, payload={"submission_id": str(submission["_id"])})
+    return submission, await jobs.claim_next_job(db, worker_id="test")
+
+async def test_stopping_worker_claims_no_more_jobs(db):
+    await jobs.enqueue_job(db, job_type=jobs.IMPROVEMENT_SUGGESTIONS_JOB, payload={"submission_id": "x"})
+    job_worker = worker.Worker(db, concurrency=1)
+    # Every slot is busy, so the worker waits for one
+    await job_worker.semaphore.acquire()
+    run = asyncio.create_task(job_worker.run())
+    await asyncio.sleep(0.05)
+
+    job_worker.stopping.set()
+    job_worker.semaphore.release()
+    await asyncio.wait_for(run, timeout=1)
+    stored = await db[jobs.JOB_COLLECTION].find_one()
+    assert (stored["status"], stored["attempts"]) == ("queued", 0)
+
+async def test_multi_submission_keeps_the_set_that_was_evaluated(db, stub_images, invalid_toy_answers):
+    submission, job = await queued_evaluation(db, {
+        "playground_image_urls": ["/images/p.jpg"],
+        "toy_image_urls": ["/images/t.jpg"],
+    })
+    await worker.run_evaluate_submission_job(db, job)
+
+    stored = await crud.get_submission(db, submission_id=str(submission["_id"]))
+    assert (stored["status"], stored["playground_feedback"], stored["toy_feedback"]) == ("evaluated", FEEDBACK, None)
+    assert await db[jobs.JOB_COLLECTION].count_documents({"type": jobs.IMPROVEMENT_SUGGESTIONS_JOB}) == 1
+
+async def test_single_image_submission_needs_both_sets(db, stub_images, invalid_toy_answers):
+    submission, job = await queued_evaluation(db, {
+        "playground_image_url": "/images/p.jpg",
+        "toy_image_url": "/images/t.jpg",
+    })
+    with pytest.raises(ai_models.InvalidAIResponseError):
+        await worker.run_evaluate_submission_job(db, job)
+
+    stored = await crud.get_submission(db, submission_id=str(submission["_id"]))
+    assert (stored["status"], stored["playground_feedback"]) == ("evaluating", FEEDBACK)
+    assert await db[jobs.JOB_COLLECTION].count_documents({"type": jobs.IMPROVEMENT_SUGGESTIONS_JOB}) == 0